@@ -3,7 +3,8 @@ Analytics models and utilities for channel performance and reporting.
 """
 import logging
 from datetime import datetime, timedelta
-from config.database import execute_query
+from config.database import execute_query, stream_query, get_dialect
+from config.dialects import day_range
 from config.constants import LOG_ANALYTICS
 
 class TransactionReporting:
@@ -30,13 +31,14 @@ class TransactionReporting:
             
             params = []
             
-            if date_from:
-                base_query += " AND CAST(m.transaction_time AS DATE) >= ?"
-                params.append(date_from)
+            start, end = day_range(date_from, date_to)
+            if start:
+                base_query += " AND m.transaction_time >= ?"
+                params.append(start)
             
-            if date_to:
-                base_query += " AND CAST(m.transaction_time AS DATE) <= ?"
-                params.append(date_to)
+            if end:
+                base_query += " AND m.transaction_time < ?"
+                params.append(end)
             
             if channel_id:
                 base_query += " AND u.channel_id = ?"
@@ -73,80 +75,90 @@ class TransactionReporting:
                                 status_filter=None, limit=1000, offset=0):
         """Get detailed transaction list with filtering and pagination."""
         try:
-            base_query = """
-                SELECT 
-                    m.id,
-                    m.transaction_id,
-                    m.amount,
-                    m.transaction_time,
-                    m.utr,
-                    m.reference_id,
-                    c.name as channel_name,
-                    i.transaction_id as internal_txn_id,
-                    i.amount as internal_amount,
-                    b.amount as bank_amount,
-                    b.utr as bank_utr,
-                    r.status,
-                    r.anomaly_type,
-                    r.created_at as recon_date
-                FROM mpr_transactions m
-                JOIN mpr_uploads u ON m.upload_id = u.id
-                JOIN channels c ON u.channel_id = c.id
-                LEFT JOIN reconciliation_results r ON r.mpr_transaction_id = m.id
-                LEFT JOIN internal_transactions i ON r.internal_transaction_id = i.id
-                LEFT JOIN bank_transactions b ON r.bank_transaction_id = b.id
-                WHERE 1=1
-            """
-            
-            params = []
-            
-            if date_from:
-                base_query += " AND CAST(m.transaction_time AS DATE) >= ?"
-                params.append(date_from)
-            
-            if date_to:
-                base_query += " AND CAST(m.transaction_time AS DATE) <= ?"
-                params.append(date_to)
-            
-            if channel_id:
-                base_query += " AND u.channel_id = ?"
-                params.append(channel_id)
-            
-            if status_filter:
-                base_query += " AND r.status = ?"
-                params.append(status_filter)
-            
-            base_query += f" ORDER BY m.transaction_time DESC OFFSET {offset} ROWS FETCH NEXT {limit} ROWS ONLY"
-            
-            results = execute_query(base_query, params, fetch='all')
-            
-            transactions = []
-            if results:
-                for row in results:
-                    transactions.append({
-                        'id': row[0],
-                        'transaction_id': row[1],
-                        'amount': float(row[2]) if row[2] else 0.0,
-                        'transaction_time': row[3],
-                        'utr': row[4],
-                        'reference_id': row[5],
-                        'channel_name': row[6],
-                        'internal_txn_id': row[7],
-                        'internal_amount': float(row[8]) if row[8] else None,
-                        'bank_amount': float(row[9]) if row[9] else None,
-                        'bank_utr': row[10],
-                        'status': row[11],
-                        'anomaly_type': row[12],
-                        'recon_date': row[13]
-                    })
-            
-            return transactions
+            return list(TransactionReporting.iter_detailed_transactions(
+                date_from, date_to, channel_id, status_filter, limit, offset))
             
         except Exception as e:
             logging.error(f"Error getting detailed transactions: {str(e)}", 
                          extra={'category': LOG_ANALYTICS})
             return []
     
+    @staticmethod
+    def iter_detailed_transactions(date_from=None, date_to=None, channel_id=None,
+                                   status_filter=None, limit=None, offset=0):
+        """
+        Yield detailed transactions one at a time, streamed from the database.
+        
+        Without a limit every matching transaction is returned, so exports
+        can cover any date range with flat memory use.
+        """
+        dialect = get_dialect()
+        base_query = """
+            SELECT 
+                m.id,
+                m.transaction_id,
+                m.amount,
+                m.transaction_time,
+                m.utr,
+                m.reference_id,
+                c.name as channel_name,
+                i.transaction_id as internal_txn_id,
+                i.amount as internal_amount,
+                b.amount as bank_amount,
+                b.utr as bank_utr,
+                r.status,
+                r.anomaly_type,
+                r.created_at as recon_date
+            FROM mpr_transactions m
+            JOIN mpr_uploads u ON m.upload_id = u.id
+            JOIN channels c ON u.channel_id = c.id
+            LEFT JOIN reconciliation_results r ON r.mpr_transaction_id = m.id
+            LEFT JOIN internal_transactions i ON r.internal_transaction_id = i.id
+            LEFT JOIN bank_transactions b ON r.bank_transaction_id = b.id
+            WHERE 1=1
+        """
+        
+        params = []
+        
+        start, end = day_range(date_from, date_to)
+        if start:
+            base_query += " AND m.transaction_time >= ?"
+            params.append(start)
+        
+        if end:
+            base_query += " AND m.transaction_time < ?"
+            params.append(end)
+        
+        if channel_id:
+            base_query += " AND u.channel_id = ?"
+            params.append(channel_id)
+        
+        if status_filter:
+            base_query += " AND r.status = ?"
+            params.append(status_filter)
+        
+        base_query += " ORDER BY m.transaction_time DESC"
+        if limit:
+            base_query += f" {dialect.paginate(limit, offset)}"
+        
+        for row in stream_query(base_query, params):
+            yield {
+                'id': row[0],
+                'transaction_id': row[1],
+                'amount': float(row[2]) if row[2] else 0.0,
+                'transaction_time': row[3],
+                'utr': row[4],
+                'reference_id': row[5],
+                'channel_name': row[6],
+                'internal_txn_id': row[7],
+                'internal_amount': float(row[8]) if row[8] else None,
+                'bank_amount': float(row[9]) if row[9] else None,
+                'bank_utr': row[10],
+                'status': row[11],
+                'anomaly_type': row[12],
+                'recon_date': row[13]
+            }
+    
     @staticmethod
     def get_transaction_count(date_from=None, date_to=None, channel_id=None, status_filter=None):
         """Get total count of transactions matching filters."""
@@ -161,13 +173,14 @@ class TransactionReporting:
             
             params = []
             
-            if date_from:
-                base_query += " AND CAST(m.transaction_time AS DATE) >= ?"
-                params.append(date_from)
+            start, end = day_range(date_from, date_to)
+            if start:
+                base_query += " AND m.transaction_time >= ?"
+                params.append(start)
             
-            if date_to:
-                base_query += " AND CAST(m.transaction_time AS DATE) <= ?"
-                params.append(date_to)
+            if end:
+                base_query += " AND m.transaction_time < ?"
+                params.append(end)
             
             if channel_id:
                 base_query += " AND u.channel_id = ?"
@@ -190,10 +203,11 @@ class ChannelAnalytics:
     def get_channel_performance(days=30):
         """Get channel performance analytics over time."""
         try:
-            query = """
+            dialect = get_dialect()
+            query = f"""
                 SELECT 
                     c.name as channel_name,
-                    CAST(m.transaction_time AS DATE) as transaction_date,
+                    m.transaction_day as transaction_date,
                     COUNT(m.id) as daily_transactions,
                     SUM(m.amount) as daily_amount,
                     COUNT(CASE WHEN r.status = 'MATCHED' THEN 1 END) as daily_matched,
@@ -202,8 +216,8 @@ class ChannelAnalytics:
                 JOIN mpr_uploads u ON m.upload_id = u.id
                 JOIN channels c ON u.channel_id = c.id
                 LEFT JOIN reconciliation_results r ON r.mpr_transaction_id = m.id
-                WHERE m.transaction_time >= DATEADD(day, -?, GETUTCDATE())
-                GROUP BY c.id, c.name, CAST(m.transaction_time AS DATE)
+                WHERE m.transaction_time >= {dialect.days_ago()}
+                GROUP BY c.id, c.name, m.transaction_day
                 ORDER BY transaction_date DESC, channel_name
             """
             
@@ -233,9 +247,10 @@ class ChannelAnalytics:
     def get_channel_trends(channel_id, days=30):
         """Get detailed trends for a specific channel."""
         try:
-            query = """
+            dialect = get_dialect()
+            query = f"""
                 SELECT 
-                    CAST(m.transaction_time AS DATE) as transaction_date,
+                    m.transaction_day as transaction_date,
                     COUNT(m.id) as transactions,
                     SUM(m.amount) as amount,
                     AVG(m.amount) as avg_amount,
@@ -246,8 +261,8 @@ class ChannelAnalytics:
                 JOIN mpr_uploads u ON m.upload_id = u.id
                 LEFT JOIN reconciliation_results r ON r.mpr_transaction_id = m.id
                 WHERE u.channel_id = ? 
-                AND m.transaction_time >= DATEADD(day, -?, GETUTCDATE())
-                GROUP BY CAST(m.transaction_time AS DATE)
+                AND m.transaction_time >= {dialect.days_ago()}
+                GROUP BY m.transaction_day
                 ORDER BY transaction_date DESC
             """
             
@@ -279,49 +294,57 @@ class ReportExporter:
     def generate_csv_data(transactions):
         """Generate CSV data from transaction list."""
         try:
-            import csv
-            import io
-            
-            output = io.StringIO()
-            writer = csv.writer(output)
-            
-            # Write headers
-            headers = [
-                'Transaction ID', 'Amount', 'Transaction Time', 'UTR', 'Reference ID',
-                'Channel', 'Internal Transaction ID', 'Internal Amount', 
-                'Bank Amount', 'Bank UTR', 'Status', 'Anomaly Type', 'Reconciliation Date'
-            ]
-            writer.writerow(headers)
-            
-            # Write data rows
-            for txn in transactions:
-                row = [
-                    txn.get('transaction_id', ''),
-                    txn.get('amount', 0),
-                    txn.get('transaction_time', ''),
-                    txn.get('utr', ''),
-                    txn.get('reference_id', ''),
-                    txn.get('channel_name', ''),
-                    txn.get('internal_txn_id', ''),
-                    txn.get('internal_amount', ''),
-                    txn.get('bank_amount', ''),
-                    txn.get('bank_utr', ''),
-                    txn.get('status', ''),
-                    txn.get('anomaly_type', ''),
-                    txn.get('recon_date', '')
-                ]
-                writer.writerow(row)
-            
-            csv_data = output.getvalue()
-            output.close()
-            
-            return csv_data
+            return ''.join(ReportExporter.iter_csv_data(transactions))
             
         except Exception as e:
             logging.error(f"Error generating CSV data: {str(e)}", 
                          extra={'category': LOG_ANALYTICS})
             return None
     
+    @staticmethod
+    def iter_csv_data(transactions):
+        """Yield CSV text for any iterable of transactions, one line at a time."""
+        import csv
+        import io
+        
+        output = io.StringIO()
+        writer = csv.writer(output)
+        
+        def flush():
+            text = output.getvalue()
+            output.seek(0)
+            output.truncate(0)
+            return text
+        
+        # Write headers
+        headers = [
+            'Transaction ID', 'Amount', 'Transaction Time', 'UTR', 'Reference ID',
+            'Channel', 'Internal Transaction ID', 'Internal Amount', 
+            'Bank Amount', 'Bank UTR', 'Status', 'Anomaly Type', 'Reconciliation Date'
+        ]
+        writer.writerow(headers)
+        yield flush()
+        
+        # Write data rows
+        for txn in transactions:
+            row = [
+                txn.get('transaction_id', ''),
+                txn.get('amount', 0),
+                txn.get('transaction_time', ''),
+                txn.get('utr', ''),
+                txn.get('reference_id', ''),
+                txn.get('channel_name', ''),
+                txn.get('internal_txn_id', ''),
+                txn.get('internal_amount', ''),
+                txn.get('bank_amount', ''),
+                txn.get('bank_utr', ''),
+                txn.get('status', ''),
+                txn.get('anomaly_type', ''),
+                txn.get('recon_date', '')
+            ]
+            writer.writerow(row)
+            yield flush()
+    
     @staticmethod
     def generate_summary_report(summary_data):
         """Generate summary report in CSV format."""
@@ -1,11 +1,14 @@
 """
 Analytics routes and views for reporting and channel performance.
 """
-from flask import Blueprint, render_template, request, jsonify, make_response
+from flask import (
+    Blueprint, Response, render_template, request, jsonify, make_response, stream_with_context
+)
 from datetime import datetime, timedelta
 from app.auth.utils import login_required
 from app.analytics.models import TransactionReporting, ChannelAnalytics, ReportExporter
 from app.config.models import Channel
+import itertools
 import logging
 from config.constants import LOG_ANALYTICS
 
@@ -108,29 +111,44 @@ def export_transactions():
             except ValueError:
                 channel_id = None
         
-        # Get all transactions (no pagination for export)
-        transactions = TransactionReporting.get_detailed_transactions(
+        # Stream every matching transaction (no pagination for export)
+        transactions = TransactionReporting.iter_detailed_transactions(
             date_from=date_from,
             date_to=date_to,
             channel_id=channel_id,
-            status_filter=status_filter,
-            limit=10000  # Large limit for export
+            status_filter=status_filter
         )
-        
-        # Generate CSV data
-        csv_data = ReportExporter.generate_csv_data(transactions)
-        
-        if not csv_data:
-            return "Error generating CSV data", 500
+        # Run the query before the response starts; like the paged report,
+        # a failing query exports no rows
+        try:
+            first = next(transactions, None)
+        except Exception as e:
+            logging.error(f"Error getting detailed transactions: {str(e)}", 
+                         extra={'category': LOG_ANALYTICS})
+            first = None
+        if first is not None:
+            transactions = itertools.chain([first], transactions)
+        else:
+            transactions = []
+        
+        def generate():
+            exported = 0
+            try:
+                for line in ReportExporter.iter_csv_data(transactions):
+                    exported += 1
+                    yield line
+            except Exception as e:
+                # Headers are already sent, so the download ends short
+                logging.error(f"Error exporting transactions: {str(e)}", 
+                             extra={'category': LOG_ANALYTICS})
+                raise
+            logging.info(f"Transaction export completed: {exported - 1} records", 
+                        extra={'category': LOG_ANALYTICS})
         
         # Create response
-        response = make_response(csv_data)
-        response.headers['Content-Type'] = 'text/csv'
+        response = Response(stream_with_context(generate()), mimetype='text/csv')
         response.headers['Content-Disposition'] = f'attachment; filename=transactions_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
         
-        logging.info(f"Transaction export completed: {len(transactions)} records", 
-                    extra={'category': LOG_ANALYTICS})
-        
         return response
         
     except Exception as e:
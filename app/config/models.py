@@ -97,26 +97,32 @@ class Channel:
             return False
 
 class ChannelConfig:
-    def __init__(self, id, channel_id, field_mappings, file_format, created_at=None):
+    def __init__(self, id, channel_id, field_mappings, file_format, created_at=None,
+                 sheet_name=None, header_row=1):
         self.id = id
         self.channel_id = channel_id
         self.field_mappings = field_mappings
         self.file_format = file_format
         self.created_at = created_at
+        # Worksheet to read (None for the first) and 1-based row holding the column names
+        self.sheet_name = sheet_name
+        self.header_row = header_row
     
     @staticmethod
     def get_by_channel_id(channel_id):
         """Get channel configuration by channel ID."""
         try:
             query = """
-                SELECT id, channel_id, field_mappings_json, file_format, created_at 
+                SELECT id, channel_id, field_mappings_json, file_format, created_at, 
+                       sheet_name, header_row 
                 FROM channel_configs WHERE channel_id = ?
             """
             result = execute_query(query, (channel_id,), fetch='one')
             
             if result:
                 field_mappings = json.loads(result[2])
-                return ChannelConfig(result[0], result[1], field_mappings, result[3], result[4])
+                return ChannelConfig(result[0], result[1], field_mappings, result[3], result[4],
+                                     result[5], result[6] or 1)
             return None
             
         except Exception as e:
@@ -125,7 +131,7 @@ class ChannelConfig:
             return None
     
     @staticmethod
-    def create_or_update(channel_id, field_mappings, file_format):
+    def create_or_update(channel_id, field_mappings, file_format, sheet_name=None, header_row=1):
         """Create or update channel configuration."""
         try:
             field_mappings_json = json.dumps(field_mappings)
@@ -136,16 +142,19 @@ class ChannelConfig:
             if existing:
                 query = """
                     UPDATE channel_configs 
-                    SET field_mappings_json = ?, file_format = ? 
+                    SET field_mappings_json = ?, file_format = ?, sheet_name = ?, header_row = ? 
                     WHERE channel_id = ?
                 """
-                execute_query(query, (field_mappings_json, file_format, channel_id))
+                execute_query(query, (field_mappings_json, file_format, sheet_name, header_row,
+                                      channel_id))
             else:
                 query = """
-                    INSERT INTO channel_configs (channel_id, field_mappings_json, file_format) 
-                    VALUES (?, ?, ?)
+                    INSERT INTO channel_configs 
+                    (channel_id, field_mappings_json, file_format, sheet_name, header_row) 
+                    VALUES (?, ?, ?, ?, ?)
                 """
-                execute_query(query, (channel_id, field_mappings_json, file_format))
+                execute_query(query, (channel_id, field_mappings_json, file_format, sheet_name,
+                                      header_row))
             
             logging.info(f"Channel config updated: {channel_id}", 
                         extra={'category': LOG_SYSTEM})
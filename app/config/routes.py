@@ -90,6 +90,13 @@ def channel_mapping(channel_id):
     
     if request.method == 'POST':
         file_format = request.form.get('file_format', 'CSV')
+        sheet_name = request.form.get('sheet_name', '').strip() or None
+        header_row = request.form.get('header_row', 1, type=int)
+        
+        if not header_row or header_row < 1:
+            flash('Header row must be a positive row number.', 'error')
+            return render_template('config/channel_mapping.html', 
+                                 channel=channel, config=config)
         
         # Get field mappings from form
         field_mappings = {
@@ -110,7 +117,8 @@ def channel_mapping(channel_id):
             return render_template('config/channel_mapping.html', 
                                  channel=channel, config=config)
         
-        if ChannelConfig.create_or_update(channel_id, field_mappings, file_format):
+        if ChannelConfig.create_or_update(channel_id, field_mappings, file_format,
+                                          sheet_name, header_row):
             flash(f'Field mapping for "{channel.name}" saved successfully.', 'success')
             return redirect(url_for('config.channels'))
         else:
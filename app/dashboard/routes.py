@@ -1,10 +1,12 @@
 """
 Dashboard routes and views.
 """
-from flask import Blueprint, render_template
+from flask import Blueprint, render_template, request, jsonify
 from app.auth.utils import login_required
 from app.uploads.models import MPRUpload, InternalUpload, BankStatementUpload
 from app.config.models import Channel
+from config.settings import Config
+from config.database import get_query_stats, get_pool_metrics
 
 dashboard_bp = Blueprint('dashboard', __name__)
 
@@ -75,4 +77,20 @@ def index():
             'recent_bank_uploads': []
         }
         
-        return render_template('dashboard/index.html', data=dashboard_data)
\ No newline at end of file
+        return render_template('dashboard/index.html', data=dashboard_data)
+
+@dashboard_bp.route('/api/db-stats')
+@login_required
+def api_db_stats():
+    """API endpoint for per-statement database latency and pool metrics."""
+    try:
+        limit = request.args.get('limit', 50, type=int)
+        stats = get_query_stats()
+        return jsonify({
+            'enabled': stats is not None,
+            'slow_query_ms': Config.DB_SLOW_QUERY_MS,
+            'statements': stats.snapshot(max(1, min(limit, 500))) if stats else [],
+            'pool': get_pool_metrics(),
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
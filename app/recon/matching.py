@@ -0,0 +1,314 @@
+"""
+Matching indexes shared by the reconciliation backends.
+"""
+from bisect import bisect_left, bisect_right
+from collections import deque
+from datetime import datetime, timedelta, timezone
+
+def to_paise(amount):
+    """Convert a rupee amount to integer paise."""
+    return int(round(float(amount) * 100))
+
+def parse_transaction_time(value):
+    """Parse a stored transaction time, returning None if absent or unparseable."""
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        try:
+            parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+        except (ValueError, TypeError):
+            return None
+
+    # Compare everything as naive UTC so aware and naive values never clash
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+class AmountDateIndex:
+    """
+    Greedy AMOUNT_DATE matcher over a set of candidate rows.
+
+    Candidates are bucketed by integer paise and kept sorted by time inside
+    each bucket, so a probe only looks at the few buckets within the amount
+    tolerance and bisects to the date window. Among all eligible candidates
+    the one loaded first wins, which is the same choice a linear scan makes.
+    """
+
+    def __init__(self, rows, match_tolerance, date_tolerance_days,
+                 amount_index=2, time_index=3):
+        self.match_tolerance = match_tolerance
+        self.date_tolerance_days = date_tolerance_days
+        self.rows = list(rows)
+        self.probes = 0
+
+        self._amounts = []
+        self._times = []
+        self._buckets = {}
+        self._span = to_paise(match_tolerance) + 1
+        self._window = timedelta(days=date_tolerance_days + 1)
+
+        for position, row in enumerate(self.rows):
+            amount = float(row[amount_index])
+            when = parse_transaction_time(row[time_index]) if time_index is not None else None
+            self._amounts.append(amount)
+            self._times.append(when)
+
+            bucket = self._buckets.setdefault(to_paise(amount), ([], [], []))
+            timed, untimed, ordered = bucket
+            if when is None:
+                untimed.append(position)
+            else:
+                timed.append((when, position))
+            ordered.append(position)
+
+        for timed, _, _ in self._buckets.values():
+            timed.sort()
+
+    def dates_match(self, left, right):
+        """Date tolerance check; rows without a usable time match any date."""
+        if left is None or right is None:
+            return True
+        return abs((left - right).days) <= self.date_tolerance_days
+
+    def amounts_match(self, left, right):
+        """Amount tolerance check."""
+        return abs(left - right) <= self.match_tolerance
+
+    def find(self, amount, transaction_time):
+        """Return the position of the earliest eligible candidate, or None."""
+        amount = float(amount)
+        when = parse_transaction_time(transaction_time)
+        paise = to_paise(amount)
+        best = None
+
+        for key in range(paise - self._span, paise + self._span + 1):
+            bucket = self._buckets.get(key)
+            if not bucket:
+                continue
+            timed, untimed, ordered = bucket
+
+            if when is None:
+                # Undated probe: every time is acceptable, take the first in load order
+                for position in ordered:
+                    self.probes += 1
+                    if best is not None and position >= best:
+                        break
+                    if self.amounts_match(amount, self._amounts[position]):
+                        best = position
+                        break
+                continue
+
+            for position in untimed:
+                self.probes += 1
+                if best is not None and position >= best:
+                    break
+                if self.amounts_match(amount, self._amounts[position]):
+                    best = position
+                    break
+
+            lo = bisect_left(timed, (when - self._window,))
+            hi = bisect_right(timed, (when + self._window, float('inf')))
+            for candidate_time, position in timed[lo:hi]:
+                self.probes += 1
+                if best is not None and position >= best:
+                    continue
+                if (self.amounts_match(amount, self._amounts[position])
+                        and self.dates_match(when, candidate_time)):
+                    best = position
+
+        return best
+
+    def take(self, position):
+        """Remove a matched candidate so it cannot be used again."""
+        timed, untimed, ordered = self._buckets[to_paise(self._amounts[position])]
+        when = self._times[position]
+
+        if when is None:
+            del untimed[bisect_left(untimed, position)]
+        else:
+            del timed[bisect_left(timed, (when, position))]
+        del ordered[bisect_left(ordered, position)]
+        return self.rows[position]
+
+    def match(self, amount, transaction_time):
+        """Find and take the best candidate, returning its row or None."""
+        position = self.find(amount, transaction_time)
+        if position is None:
+            return None
+        return self.take(position)
+
+class BankCreditIndex:
+    """
+    Consumable lookup over bank credits by UTR and by amount.
+
+    A UTR hit is always preferred; otherwise the first unused credit within
+    the amount tolerance is taken. Each credit settles at most one match.
+    """
+
+    def __init__(self, bank_transactions, match_tolerance):
+        self.by_amount = AmountDateIndex(bank_transactions, match_tolerance, 0,
+                                         amount_index=1, time_index=None)
+        self.rows = self.by_amount.rows
+        self._consumed = set()
+        self._by_utr = {}
+
+        for position, bank in enumerate(self.rows):
+            bank_utr = bank[2]
+            if bank_utr:
+                self._by_utr.setdefault(bank_utr, []).append(position)
+
+    @property
+    def probes(self):
+        return self.by_amount.probes
+
+    def match(self, amount, utr):
+        """Take the best unused credit, returning (row, match_type) or (None, None)."""
+        if utr:
+            for position in self._by_utr.get(utr, ()):
+                self.by_amount.probes += 1
+                if position not in self._consumed:
+                    return self._take(position), 'UTR'
+
+        if amount is None:
+            return None, None
+        position = self.by_amount.find(amount, None)
+        if position is None:
+            return None, None
+        return self._take(position), 'AMOUNT'
+
+    def _take(self, position):
+        self._consumed.add(position)
+        return self.by_amount.take(position)
+
+class SlidingWindowIndex:
+    """
+    Time-ordered candidates with key and amount lookups for streaming runs.
+
+    Rows must be added in non-decreasing time order. Matched rows are removed
+    at once, and evict_before() drops everything older than a cutoff, so the
+    index only ever holds the rows inside the current time window. When
+    date_tolerance_days is None, amount probes ignore dates.
+    """
+
+    def __init__(self, match_tolerance, date_tolerance_days=None):
+        self.match_tolerance = match_tolerance
+        self.date_tolerance_days = date_tolerance_days
+        self.probes = 0
+
+        self._seq = 0
+        self._entries = {}
+        self._order = deque()
+        self._by_key = {}
+        self._buckets = {}
+        self._span = to_paise(match_tolerance) + 1
+        if date_tolerance_days is not None:
+            self._window = timedelta(days=date_tolerance_days + 1)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, row, key, amount, when):
+        """Add a candidate; `when` must not be earlier than any row already added."""
+        seq = self._seq
+        self._seq += 1
+        amount = float(amount)
+
+        self._entries[seq] = (row, key, amount, when)
+        self._order.append(seq)
+        if key:
+            self._by_key.setdefault(key, []).append(seq)
+        self._buckets.setdefault(to_paise(amount), [[], 0])[0].append((when, seq))
+
+    def evict_before(self, cutoff):
+        """Drop candidates older than cutoff and return the rows nobody took."""
+        evicted = []
+        while self._order:
+            seq = self._order[0]
+            entry = self._entries.get(seq)
+            if entry is not None and entry[3] >= cutoff:
+                break
+            self._order.popleft()
+            if entry is None:
+                continue  # already taken
+
+            row, key, amount, when = self._entries.pop(seq)
+            self._unlink_key(key, seq)
+            bucket = self._buckets[to_paise(amount)]
+            bucket[1] += 1  # oldest entry of its bucket, by construction
+            self._compact(to_paise(amount), bucket)
+            evicted.append(row)
+        return evicted
+
+    def match_key(self, key, amount=None):
+        """Take the oldest candidate with this key (and amount, if given)."""
+        for seq in self._by_key.get(key, ()) if key else ():
+            self.probes += 1
+            if amount is None or abs(float(amount) - self._entries[seq][2]) <= self.match_tolerance:
+                return self._take(seq)
+        return None
+
+    def match_amount(self, amount, when):
+        """Take the oldest candidate inside the amount and date tolerances."""
+        amount = float(amount)
+        paise = to_paise(amount)
+        best = None
+
+        for key in range(paise - self._span, paise + self._span + 1):
+            bucket = self._buckets.get(key)
+            if not bucket:
+                continue
+            entries, head = bucket
+
+            lo, hi = head, len(entries)
+            if self.date_tolerance_days is not None and when is not None:
+                lo = bisect_left(entries, (when - self._window,), head)
+                hi = bisect_right(entries, (when + self._window, float('inf')), lo)
+
+            for candidate_time, seq in entries[lo:hi]:
+                self.probes += 1
+                if best is not None and seq >= best:
+                    break
+                if abs(amount - self._entries[seq][2]) > self.match_tolerance:
+                    continue
+                if (self.date_tolerance_days is not None and when is not None
+                        and abs((when - candidate_time).days) > self.date_tolerance_days):
+                    continue
+                best = seq
+                break
+
+        return self._take(best) if best is not None else None
+
+    def drain(self):
+        """Remove and return every remaining row in time order."""
+        rows = [self._entries[seq][0] for seq in self._order if seq in self._entries]
+        self._entries.clear()
+        self._order.clear()
+        self._by_key.clear()
+        self._buckets.clear()
+        return rows
+
+    def _take(self, seq):
+        row, key, amount, when = self._entries.pop(seq)
+        self._unlink_key(key, seq)
+        bucket = self._buckets[to_paise(amount)]
+        del bucket[0][bisect_left(bucket[0], (when, seq), bucket[1])]
+        self._compact(to_paise(amount), bucket)
+        return row
+
+    def _unlink_key(self, key, seq):
+        if not key:
+            return
+        seqs = self._by_key[key]
+        seqs.remove(seq)
+        if not seqs:
+            del self._by_key[key]
+
+    def _compact(self, paise, bucket):
+        entries, head = bucket
+        if head == len(entries):
+            del self._buckets[paise]
+        elif head > 64 and head * 2 > len(entries):
+            del entries[:head]
+            bucket[1] = 0
@@ -1,48 +1,134 @@
 """
 Reconciliation models and utilities.
 """
+import json
 import logging
 from datetime import datetime, timedelta
-from config.database import execute_query
+from config.database import (
+    execute_query, execute_many, stream_query, transaction, get_dialect, get_pool_metrics
+)
+from app.recon.matching import AmountDateIndex, BankCreditIndex
+from config.dialects import day_range
+from app.recon.profiling import RunProfile
+from config.settings import Config
 from config.constants import (
     LOG_RECON, RECON_MATCH_TOLERANCE, DATE_TOLERANCE_DAYS,
+    RECON_BACKEND_ROW, RECON_BACKEND_VECTORIZED, RECON_BACKEND_PARALLEL,
+    RECON_BACKEND_STREAMING, RECON_RESULT_BATCH_SIZE,
     TRANSACTION_STATUS_PENDING, TRANSACTION_STATUS_MATCHED, 
     TRANSACTION_STATUS_ANOMALY, ANOMALY_AMOUNT_MISMATCH,
     ANOMALY_MISSING_INTERNAL, ANOMALY_MISSING_MPR, 
-    ANOMALY_MISSING_BANK, ANOMALY_DUPLICATE
+    ANOMALY_MISSING_BANK, ANOMALY_DUPLICATE,
+    RECON_SOURCE_MPR, RECON_SOURCE_INTERNAL, RECON_SOURCE_BANK, RECON_SOURCES,
+    RECON_MODE_FULL, RECON_MODE_INCREMENTAL
 )
 
+def get_reconciliation_engine(backend=None):
+    """Return a reconciliation engine for the given backend name."""
+    backend = (backend or Config.RECON_BACKEND).upper()
+    
+    if backend == RECON_BACKEND_ROW:
+        return ReconciliationEngine()
+    if backend == RECON_BACKEND_VECTORIZED:
+        from app.recon.vectorized import VectorizedReconciliationEngine
+        return VectorizedReconciliationEngine()
+    if backend == RECON_BACKEND_PARALLEL:
+        from app.recon.parallel import ParallelReconciliationEngine
+        return ParallelReconciliationEngine()
+    if backend == RECON_BACKEND_STREAMING:
+        from app.recon.streaming import StreamingReconciliationEngine
+        return StreamingReconciliationEngine()
+    
+    raise ValueError(f"Unknown reconciliation backend: {backend}")
+
+def _fetch_rows(query, params=None):
+    """Load a result set as plain tuples, fetched in batches rather than all at once."""
+    return list(stream_query(query, params, row_factory=tuple))
+
+def _bounded_query(query, time_column, date_filter=None, high_mark=None):
+    """
+    Limit a completed-upload query to a transaction date and to uploads up
+    to `high_mark`, when given. Returns (query, params).
+    """
+    params = ()
+    if date_filter:
+        query += f" AND {time_column} >= ? AND {time_column} < ?"
+        params += tuple(day_range(date_filter, date_filter))
+    if high_mark is not None:
+        query += " AND u.id <= ?"
+        params += (high_mark,)
+    return query, params or None
+
 class ReconciliationEngine:
+    backend = RECON_BACKEND_ROW
+    
     def __init__(self):
         self.match_tolerance = RECON_MATCH_TOLERANCE
         self.date_tolerance_days = DATE_TOLERANCE_DAYS
+        self.profile = RunProfile(self.backend)
     
-    def run_reconciliation(self, date_filter=None):
+    def run_reconciliation(self, date_filter=None, incremental=False):
         """Run complete reconciliation process."""
+        if incremental:
+            return self.run_incremental_reconciliation()
+        
         try:
             logging.info("Starting reconciliation process", 
                         extra={'category': LOG_RECON})
+            self.profile = RunProfile(self.backend, RECON_MODE_FULL, date_filter)
+            
+            # Uploads completed after this point are left for the next run
+            high_marks = ReconWatermark.get_high_marks() if not date_filter else None
+            bounds = high_marks or {}
             
             # Clear previous reconciliation results for the date
             if date_filter:
                 self._clear_reconciliation_results(date_filter)
             
             # Step 1: Match MPR with Internal Data
-            mpr_internal_matches = self._match_mpr_with_internal(date_filter)
+            with self.profile.stage('load'):
+                mpr_transactions = self._load_mpr_transactions(
+                    date_filter, bounds.get(RECON_SOURCE_MPR))
+                internal_transactions = self._load_internal_transactions(
+                    date_filter, bounds.get(RECON_SOURCE_INTERNAL))
+            self.profile.count('load', 'mpr_rows', len(mpr_transactions))
+            self.profile.count('load', 'internal_rows', len(internal_transactions))
+            
+            mpr_internal_matches = self._match_mpr_with_internal(
+                date_filter, mpr_transactions, internal_transactions
+            )
             
             # Step 2: Match with Bank Statements
-            bank_matches = self._match_with_bank_statements(date_filter)
+            with self.profile.stage('bank'):
+                bank_matches = self._match_with_bank_statements(
+                    date_filter, bounds.get(RECON_SOURCE_BANK))
             
-            # Step 3: Identify anomalies
-            anomalies = self._identify_anomalies(date_filter)
+            # Step 3: Identify anomalies from this run's match sets
+            with self.profile.stage('anomalies'):
+                anomalies = self._identify_anomalies(
+                    mpr_transactions, internal_transactions, mpr_internal_matches
+                )
+                # Repeated MPR rows were flagged at ingest and are never matched
+                anomalies.extend(self._duplicate_anomalies(self._load_duplicate_mpr(
+                    date_filter, watermark=0, high_mark=bounds.get(RECON_SOURCE_MPR))))
             
-            # Step 4: Create reconciliation results
-            results = self._create_reconciliation_results(
-                mpr_internal_matches, bank_matches, anomalies
-            )
+            # Step 4: Create reconciliation results; results and watermarks commit together
+            with transaction():
+                with self.profile.stage('write'):
+                    results = self._create_reconciliation_results(
+                        mpr_internal_matches, bank_matches, anomalies
+                    )
+                
+                # A full run covers every completed upload, so later runs can be incremental
+                if high_marks:
+                    ReconWatermark.advance(high_marks)
+            
+            if Config.RECON_VERIFY_ANOMALIES:
+                self._verify_anomalies(date_filter)
             
             logging.info(f"Reconciliation completed: {len(results)} results created", 
                         extra={'category': LOG_RECON})
+            self._finish_profile(len(results))
             
             return results
             
@@ -51,171 +137,472 @@ class ReconciliationEngine:
                          extra={'category': LOG_RECON})
             return []
     
-    def _match_mpr_with_internal(self, date_filter=None):
-        """Match MPR transactions with internal data."""
+    def run_incremental_reconciliation(self):
+        """
+        Reconcile only transactions that arrived since the last run.
+        
+        New rows are those from uploads above each source's watermark. They are
+        matched against each other and against the open pool (earlier rows whose
+        only results are unresolved anomalies); open rows are never re-matched
+        against each other. Existing PENDING matches are offered to new bank
+        credits. Watermarks advance only after every result has been written.
+        """
         try:
-            # Get MPR transactions
-            mpr_query = """
-                SELECT m.id, m.transaction_id, m.amount, m.transaction_time, m.utr
-                FROM mpr_transactions m
-                JOIN mpr_uploads u ON m.upload_id = u.id
-                WHERE u.status = 'COMPLETED'
-            """
+            logging.info("Starting incremental reconciliation process", 
+                        extra={'category': LOG_RECON})
+            self.profile = RunProfile(self.backend, RECON_MODE_INCREMENTAL)
             
-            # Get internal transactions
-            internal_query = """
-                SELECT i.id, i.transaction_id, i.amount, i.transaction_time
-                FROM internal_transactions i
-                JOIN internal_uploads u ON i.upload_id = u.id
-                WHERE u.status = 'COMPLETED'
-            """
+            watermarks = ReconWatermark.get_all()
+            high_marks = ReconWatermark.get_high_marks()
+            if watermarks is None or high_marks is None:
+                raise RuntimeError("reconciliation watermarks are unavailable")
             
-            if date_filter:
-                date_condition = " AND CAST(m.transaction_time AS DATE) = ?"
-                mpr_query += date_condition
-                internal_query += " AND CAST(i.transaction_time AS DATE) = ?"
-                
-                mpr_transactions = execute_query(mpr_query, (date_filter,), fetch='all')
-                internal_transactions = execute_query(internal_query, (date_filter,), fetch='all')
-            else:
-                mpr_transactions = execute_query(mpr_query, fetch='all')
-                internal_transactions = execute_query(internal_query, fetch='all')
+            with self.profile.stage('load'):
+                new_mpr, open_mpr = self._load_mpr_delta(
+                    watermarks[RECON_SOURCE_MPR], high_marks[RECON_SOURCE_MPR])
+                new_internal, open_internal = self._load_internal_delta(
+                    watermarks[RECON_SOURCE_INTERNAL], high_marks[RECON_SOURCE_INTERNAL])
+            self.profile.count('load', 'mpr_rows', len(new_mpr) + len(open_mpr))
+            self.profile.count('load', 'internal_rows', len(new_internal) + len(open_internal))
             
-            matches = []
+            # Step 1: New MPR against every open internal row, then open MPR against new internal
+            matches = self._pair_mpr_with_internal(new_mpr, open_internal + new_internal)
+            matched_internal_ids = {m['internal_id'] for m in matches}
+            matches.extend(self._pair_mpr_with_internal(
+                open_mpr, [i for i in new_internal if i[0] not in matched_internal_ids]
+            ))
             
-            # Match by transaction_id first (exact match)
-            for mpr in mpr_transactions:
-                mpr_id, mpr_txn_id, mpr_amount, mpr_time, mpr_utr = mpr
-                
-                for internal in internal_transactions:
-                    int_id, int_txn_id, int_amount, int_time = internal
-                    
-                    # Exact transaction ID match
-                    if mpr_txn_id and int_txn_id and mpr_txn_id == int_txn_id:
-                        # Check amount tolerance
-                        if abs(float(mpr_amount) - float(int_amount)) <= self.match_tolerance:
-                            matches.append({
-                                'mpr_id': mpr_id,
-                                'internal_id': int_id,
-                                'match_type': 'EXACT_ID',
-                                'confidence': 1.0
-                            })
-                            break
-            
-            # Match by amount and date (fuzzy match)
+            # Step 2: Carried-over PENDING matches first, then this run's, against open credits
+            with self.profile.stage('bank'):
+                pending = self._load_pending_matches()
+                pending_result_ids = {row[1]: row[0] for row in pending}
+                mpr_details = {mpr[0]: mpr for mpr in open_mpr + new_mpr}
+                bank_candidates = [tuple(row[1:]) for row in pending] + [
+                    (m['mpr_id'], m['internal_id'],
+                     mpr_details[m['mpr_id']][2], mpr_details[m['mpr_id']][4])
+                    for m in matches
+                ]
+                bank_credits = self._load_open_bank_credits(high_marks[RECON_SOURCE_BANK])
+                bank_matches = self._pair_with_bank(bank_candidates, bank_credits)
+            self.profile.count('bank', 'bank_rows', len(bank_credits))
+            self.profile.count('bank', 'candidate_rows', len(bank_candidates))
+            
+            settled = [b for b in bank_matches if b['mpr_id'] in pending_result_ids]
+            bank_matches = [b for b in bank_matches if b['mpr_id'] not in pending_result_ids]
+            
+            # Step 3: Only new rows can raise new anomalies
             matched_mpr_ids = {m['mpr_id'] for m in matches}
             matched_internal_ids = {m['internal_id'] for m in matches}
+            with self.profile.stage('anomalies'):
+                anomalies = self._unmatched_anomalies(
+                    [mpr for mpr in new_mpr if mpr[0] not in matched_mpr_ids],
+                    [i for i in new_internal if i[0] not in matched_internal_ids]
+                )
+                anomalies.extend(self._duplicate_anomalies(self._load_duplicate_mpr(
+                    watermark=watermarks[RECON_SOURCE_MPR], high_mark=high_marks[RECON_SOURCE_MPR])))
+            self.profile.count('anomalies', 'anomalies', len(anomalies))
             
-            for mpr in mpr_transactions:
-                mpr_id, mpr_txn_id, mpr_amount, mpr_time, mpr_utr = mpr
+            # Step 4: Settle, retire anomalies of open rows that matched, write and advance, in one transaction
+            statements = [self._settle_pending_statement(settled, pending_result_ids)]
+            statements.extend(self._retire_anomaly_statements(
+                [mpr[0] for mpr in open_mpr if mpr[0] in matched_mpr_ids],
+                [i[0] for i in open_internal if i[0] in matched_internal_ids]
+            ))
+            statements.extend(self._retire_new_anomaly_statements(watermarks, high_marks))
+            with transaction():
+                with self.profile.stage('write'):
+                    results = self._create_reconciliation_results(
+                        matches, bank_matches, anomalies, statements=statements
+                    )
                 
-                if mpr_id in matched_mpr_ids:
-                    continue
-                
-                for internal in internal_transactions:
-                    int_id, int_txn_id, int_amount, int_time = internal
-                    
-                    if int_id in matched_internal_ids:
-                        continue
-                    
-                    # Amount match within tolerance
-                    if abs(float(mpr_amount) - float(int_amount)) <= self.match_tolerance:
-                        # Date match within tolerance (if both have dates)
-                        date_match = True
-                        if mpr_time and int_time:
-                            try:
-                                mpr_date = datetime.fromisoformat(str(mpr_time).replace('Z', '+00:00'))
-                                int_date = datetime.fromisoformat(str(int_time).replace('Z', '+00:00'))
-                                date_diff = abs((mpr_date - int_date).days)
-                                date_match = date_diff <= self.date_tolerance_days
-                            except:
-                                date_match = True  # If date parsing fails, assume match
-                        
-                        if date_match:
-                            matches.append({
-                                'mpr_id': mpr_id,
-                                'internal_id': int_id,
-                                'match_type': 'AMOUNT_DATE',
-                                'confidence': 0.8
-                            })
-                            matched_mpr_ids.add(mpr_id)
-                            matched_internal_ids.add(int_id)
-                            break
+                ReconWatermark.advance(high_marks)
             
-            logging.info(f"MPR-Internal matching completed: {len(matches)} matches found", 
+            logging.info(f"Incremental reconciliation completed: {len(new_mpr)} new MPR, "
+                        f"{len(new_internal)} new internal, {len(open_mpr) + len(open_internal)} "
+                        f"open rows, {len(results) + len(settled)} results written", 
                         extra={'category': LOG_RECON})
+            self._finish_profile(len(results) + len(settled))
             
-            return matches
+            return results + settled
             
         except Exception as e:
-            logging.error(f"Error in MPR-Internal matching: {str(e)}", 
+            logging.error(f"Incremental reconciliation process failed: {str(e)}", 
                          extra={'category': LOG_RECON})
             return []
     
-    def _match_with_bank_statements(self, date_filter=None):
-        """Match transactions with bank statements."""
+    def _finish_profile(self, results):
+        """Emit the run profile to the log and keep it in the run history."""
+        self.profile.finish(results)
+        profile = self.profile.to_dict()
+        profile['db_pool'] = get_pool_metrics()
+        
+        logging.info(f"Reconciliation profile: {profile['total_seconds']:.3f}s, "
+                    f"peak RSS {profile['peak_rss_kb']} KB", 
+                    extra={'category': LOG_RECON, 'profile': profile})
+        ReconRunHistory.record(profile)
+    
+    def _load_mpr_delta(self, watermark, high_mark):
+        """
+        Load (new, open) MPR rows for an incremental run.
+        
+        Rows a date-filtered run already matched are left out of the new rows:
+        such runs do not advance the watermarks.
+        """
+        query = """
+            SELECT m.id, m.transaction_id, m.amount, m.transaction_time, m.utr
+            FROM mpr_transactions m
+            JOIN mpr_uploads u ON m.upload_id = u.id
+            WHERE u.status = 'COMPLETED' AND u.id > ? AND u.id <= ? AND m.is_duplicate = 0
+            AND NOT EXISTS (
+                SELECT 1 FROM reconciliation_results r
+                WHERE r.mpr_transaction_id = m.id AND r.status <> 'ANOMALY'
+            )
+            ORDER BY m.id
+        """
+        new_rows = _fetch_rows(query, (watermark, high_mark))
+        
+        open_query = """
+            SELECT m.id, m.transaction_id, m.amount, m.transaction_time, m.utr
+            FROM mpr_transactions m
+            JOIN mpr_uploads u ON m.upload_id = u.id
+            WHERE u.status = 'COMPLETED' AND u.id <= ? AND m.is_duplicate = 0
+            AND NOT EXISTS (
+                SELECT 1 FROM reconciliation_results r
+                WHERE r.mpr_transaction_id = m.id AND r.status <> 'ANOMALY'
+            )
+            ORDER BY m.id
+        """
+        open_rows = _fetch_rows(open_query, (watermark,))
+        
+        return list(new_rows), list(open_rows)
+    
+    def _duplicate_mpr_query(self, date_filter=None, watermark=None, high_mark=None):
+        """
+        Query for MPR rows flagged at ingest as repeats of a stored row, with
+        the original's id, from completed uploads in id order.
+        
+        Limited to a transaction date, or to uploads above `watermark` up to
+        `high_mark`, when given. Returns (query, params).
+        """
+        query = """
+            SELECT m.id, m.transaction_id, o.id
+            FROM mpr_transactions m
+            JOIN mpr_uploads u ON m.upload_id = u.id
+            LEFT JOIN mpr_transactions o ON o.fingerprint = m.fingerprint AND o.is_duplicate = 0
+            WHERE u.status = 'COMPLETED' AND m.is_duplicate = 1
+        """
+        params = []
+        if date_filter:
+            query += " AND m.transaction_time >= ? AND m.transaction_time < ?"
+            params.extend(day_range(date_filter, date_filter))
+        if high_mark is not None:
+            query += " AND u.id > ? AND u.id <= ?"
+            params.extend((watermark, high_mark))
+        return query + " ORDER BY m.id", params
+    
+    def _load_duplicate_mpr(self, date_filter=None, watermark=None, high_mark=None):
+        """Load MPR rows flagged as duplicates (see _duplicate_mpr_query)."""
+        return _fetch_rows(*self._duplicate_mpr_query(date_filter, watermark, high_mark))
+    
+    def _duplicate_anomalies(self, duplicates):
+        """DUPLICATE anomalies for MPR rows that repeat an already stored row."""
+        anomalies = []
+        for mpr_id, mpr_txn_id, original_id in duplicates:
+            anomalies.append({
+                'mpr_id': mpr_id,
+                'internal_id': None,
+                'bank_id': None,
+                'anomaly_type': ANOMALY_DUPLICATE,
+                'description': f'MPR transaction {mpr_txn_id} duplicates MPR record {original_id}'
+            })
+        self.profile.count('anomalies', 'duplicates', len(anomalies))
+        return anomalies
+    
+    def _load_internal_delta(self, watermark, high_mark):
+        """Load (new, open) internal rows for an incremental run (see _load_mpr_delta)."""
+        query = """
+            SELECT i.id, i.transaction_id, i.amount, i.transaction_time
+            FROM internal_transactions i
+            JOIN internal_uploads u ON i.upload_id = u.id
+            WHERE u.status = 'COMPLETED' AND u.id > ? AND u.id <= ?
+            AND NOT EXISTS (
+                SELECT 1 FROM reconciliation_results r
+                WHERE r.internal_transaction_id = i.id AND r.status <> 'ANOMALY'
+            )
+            ORDER BY i.id
+        """
+        new_rows = _fetch_rows(query, (watermark, high_mark))
+        
+        open_query = """
+            SELECT i.id, i.transaction_id, i.amount, i.transaction_time
+            FROM internal_transactions i
+            JOIN internal_uploads u ON i.upload_id = u.id
+            WHERE u.status = 'COMPLETED' AND u.id <= ?
+            AND NOT EXISTS (
+                SELECT 1 FROM reconciliation_results r
+                WHERE r.internal_transaction_id = i.id AND r.status <> 'ANOMALY'
+            )
+            ORDER BY i.id
+        """
+        open_rows = _fetch_rows(open_query, (watermark,))
+        
+        return list(new_rows), list(open_rows)
+    
+    def _load_pending_matches(self):
+        """Load MPR-Internal matches still waiting for a bank credit."""
+        query = """
+            SELECT r.id, r.mpr_transaction_id, r.internal_transaction_id, m.amount, m.utr
+            FROM reconciliation_results r
+            JOIN mpr_transactions m ON r.mpr_transaction_id = m.id
+            WHERE r.status = 'PENDING' AND r.internal_transaction_id IS NOT NULL
+            ORDER BY r.id
+        """
+        return _fetch_rows(query)
+    
+    def _load_open_bank_credits(self, high_mark):
+        """Load bank credits that no result has consumed yet."""
+        query = """
+            SELECT b.id, b.amount, b.utr, b.transaction_date, b.description
+            FROM bank_transactions b
+            JOIN bank_statement_uploads u ON b.upload_id = u.id
+            WHERE u.status = 'COMPLETED' AND b.amount > 0 AND u.id <= ?
+            AND NOT EXISTS (
+                SELECT 1 FROM reconciliation_results r WHERE r.bank_transaction_id = b.id
+            )
+            ORDER BY b.id
+        """
+        return _fetch_rows(query, (high_mark,))
+    
+    def _unmatched_anomalies(self, unmatched_mpr, unmatched_internal):
+        """
+        Build anomalies for unmatched rows.
+        
+        An unmatched MPR row that shares its transaction ID with an unmatched
+        internal row failed only on amount, so the two are reported together as
+        AMOUNT_MISMATCH (paired in load order); the rest are MISSING_INTERNAL
+        or MISSING_MPR.
+        """
+        anomalies = []
+        
+        internal_by_id = self._index_by_transaction_id(unmatched_internal)
+        mismatched_internal_ids = set()
+        
+        for mpr in unmatched_mpr:
+            candidates = internal_by_id.get(mpr[1]) if mpr[1] else None
+            if candidates:
+                internal = candidates.pop(0)
+                mismatched_internal_ids.add(internal[0])
+                anomalies.append({
+                    'mpr_id': mpr[0],
+                    'internal_id': internal[0],
+                    'bank_id': None,
+                    'anomaly_type': ANOMALY_AMOUNT_MISMATCH,
+                    'description': f'Amount mismatch: MPR ₹{mpr[2]} vs Internal ₹{internal[2]}'
+                })
+                continue
+            
+            anomalies.append({
+                'mpr_id': mpr[0],
+                'internal_id': None,
+                'bank_id': None,
+                'anomaly_type': ANOMALY_MISSING_INTERNAL,
+                'description': f'MPR transaction {mpr[1]} has no matching internal record'
+            })
+        
+        for internal in unmatched_internal:
+            if internal[0] in mismatched_internal_ids:
+                continue
+            anomalies.append({
+                'mpr_id': None,
+                'internal_id': internal[0],
+                'bank_id': None,
+                'anomaly_type': ANOMALY_MISSING_MPR,
+                'description': f'Internal transaction {internal[1]} has no matching MPR record'
+            })
+        
+        return anomalies
+    
+    def _settle_pending_statement(self, bank_matches, pending_result_ids):
+        """Statement promoting carried-over PENDING results that found a bank credit."""
+        query = """
+            UPDATE reconciliation_results 
+            SET bank_transaction_id = ?, status = ?
+            WHERE id = ?
+        """
+        return query, [
+            (match['bank_id'], TRANSACTION_STATUS_MATCHED, pending_result_ids[match['mpr_id']])
+            for match in bank_matches
+        ]
+    
+    def _retire_anomaly_statements(self, mpr_ids, internal_ids):
+        """Statements removing unresolved anomalies for open rows that have now matched."""
+        return [
+            ("DELETE FROM reconciliation_results WHERE status = 'ANOMALY' AND mpr_transaction_id = ?",
+             [(mpr_id,) for mpr_id in mpr_ids]),
+            ("DELETE FROM reconciliation_results WHERE status = 'ANOMALY' AND internal_transaction_id = ?",
+             [(internal_id,) for internal_id in internal_ids]),
+        ]
+    
+    def _retire_new_anomaly_statements(self, watermarks, high_marks):
+        """
+        Statements removing anomalies a date-filtered run left on this run's
+        new rows, which are matched or flagged again now.
+        """
+        return [
+            ("""
+                DELETE FROM reconciliation_results
+                WHERE status = 'ANOMALY' AND mpr_transaction_id IN (
+                    SELECT m.id FROM mpr_transactions m
+                    JOIN mpr_uploads u ON m.upload_id = u.id
+                    WHERE u.id > ? AND u.id <= ?
+                )
+            """, [(watermarks[RECON_SOURCE_MPR], high_marks[RECON_SOURCE_MPR])]),
+            ("""
+                DELETE FROM reconciliation_results
+                WHERE status = 'ANOMALY' AND internal_transaction_id IN (
+                    SELECT i.id FROM internal_transactions i
+                    JOIN internal_uploads u ON i.upload_id = u.id
+                    WHERE u.id > ? AND u.id <= ?
+                )
+            """, [(watermarks[RECON_SOURCE_INTERNAL], high_marks[RECON_SOURCE_INTERNAL])]),
+        ]
+    
+    def _match_mpr_with_internal(self, date_filter=None, mpr_transactions=None,
+                                 internal_transactions=None):
+        """Match MPR transactions with internal data, loading them unless given."""
         try:
-            # Get bank transactions (credits only for settlement matching)
-            bank_query = """
-                SELECT b.id, b.amount, b.utr, b.transaction_date, b.description
-                FROM bank_transactions b
-                JOIN bank_statement_uploads u ON b.upload_id = u.id
-                WHERE u.status = 'COMPLETED' AND b.amount > 0
-            """
+            if mpr_transactions is None:
+                mpr_transactions = self._load_mpr_transactions(date_filter)
+            if internal_transactions is None:
+                internal_transactions = self._load_internal_transactions(date_filter)
             
-            if date_filter:
-                bank_query += " AND CAST(b.transaction_date AS DATE) = ?"
-                bank_transactions = execute_query(bank_query, (date_filter,), fetch='all')
-            else:
-                bank_transactions = execute_query(bank_query, fetch='all')
+            matches = self._pair_mpr_with_internal(mpr_transactions, internal_transactions)
             
-            # Get existing MPR-Internal matches
-            existing_matches_query = """
-                SELECT mpr_transaction_id, internal_transaction_id
-                FROM reconciliation_results
-                WHERE mpr_transaction_id IS NOT NULL AND internal_transaction_id IS NOT NULL
-            """
-            existing_matches = execute_query(existing_matches_query, fetch='all')
+            logging.info(f"MPR-Internal matching completed: {len(matches)} matches found", 
+                        extra={'category': LOG_RECON})
             
-            matches = []
+            return matches
             
-            for match in existing_matches:
-                mpr_id, internal_id = match
-                
-                # Get MPR transaction details
-                mpr_query = "SELECT amount, utr FROM mpr_transactions WHERE id = ?"
-                mpr_result = execute_query(mpr_query, (mpr_id,), fetch='one')
+        except Exception as e:
+            logging.error(f"Error in MPR-Internal matching: {str(e)}", 
+                         extra={'category': LOG_RECON})
+            return []
+    
+    def _load_mpr_transactions(self, date_filter=None, high_mark=None):
+        """Load MPR transactions from completed uploads (up to `high_mark`) in id order."""
+        query, params = _bounded_query("""
+            SELECT m.id, m.transaction_id, m.amount, m.transaction_time, m.utr
+            FROM mpr_transactions m
+            JOIN mpr_uploads u ON m.upload_id = u.id
+            WHERE u.status = 'COMPLETED' AND m.is_duplicate = 0
+        """, 'm.transaction_time', date_filter, high_mark)
+        return _fetch_rows(query + " ORDER BY m.id", params)
+    
+    def _load_internal_transactions(self, date_filter=None, high_mark=None):
+        """Load internal transactions from completed uploads (up to `high_mark`) in id order."""
+        query, params = _bounded_query("""
+            SELECT i.id, i.transaction_id, i.amount, i.transaction_time
+            FROM internal_transactions i
+            JOIN internal_uploads u ON i.upload_id = u.id
+            WHERE u.status = 'COMPLETED'
+        """, 'i.transaction_time', date_filter, high_mark)
+        return _fetch_rows(query + " ORDER BY i.id", params)
+    
+    def _pair_mpr_with_internal(self, mpr_transactions, internal_transactions):
+        """Pair MPR rows with internal rows by exact ID, then by amount and date."""
+        # Match by transaction_id first (exact match)
+        with self.profile.stage('exact'):
+            matches = self._pair_by_transaction_id(mpr_transactions, internal_transactions)
+        
+        # Match by amount and date (fuzzy match)
+        matched_mpr_ids = {m['mpr_id'] for m in matches}
+        matched_internal_ids = {m['internal_id'] for m in matches}
+        with self.profile.stage('fuzzy'):
+            matches.extend(self._pair_by_amount_and_date(
+                [mpr for mpr in mpr_transactions if mpr[0] not in matched_mpr_ids],
+                [internal for internal in internal_transactions
+                 if internal[0] not in matched_internal_ids]
+            ))
+        
+        return matches
+    
+    def _pair_by_transaction_id(self, mpr_transactions, internal_transactions):
+        """EXACT_ID pass: pair rows sharing a transaction ID within the amount tolerance."""
+        matches = []
+        comparisons = 0
+        internal_by_txn_id = self._index_by_transaction_id(internal_transactions)
+        matched_internal_ids = set()
+        
+        for mpr in mpr_transactions:
+            mpr_id, mpr_txn_id, mpr_amount, mpr_time, mpr_utr = mpr
+            
+            if not mpr_txn_id:
+                continue
+            
+            # Candidates share the transaction ID and are kept in load order,
+            # so duplicate IDs are always paired first-come, first-served
+            for internal in internal_by_txn_id.get(mpr_txn_id, ()):
+                int_id, int_txn_id, int_amount, int_time = internal
                 
-                if not mpr_result:
+                if int_id in matched_internal_ids:
                     continue
                 
-                mpr_amount, mpr_utr = mpr_result
-                
-                # Find matching bank transaction
-                for bank in bank_transactions:
-                    bank_id, bank_amount, bank_utr, bank_date, bank_desc = bank
-                    
-                    # UTR match (highest confidence)
-                    if mpr_utr and bank_utr and mpr_utr == bank_utr:
-                        matches.append({
-                            'mpr_id': mpr_id,
-                            'internal_id': internal_id,
-                            'bank_id': bank_id,
-                            'match_type': 'UTR',
-                            'confidence': 1.0
-                        })
-                        break
-                    
-                    # Amount match within tolerance
-                    elif abs(float(mpr_amount) - float(bank_amount)) <= self.match_tolerance:
-                        matches.append({
-                            'mpr_id': mpr_id,
-                            'internal_id': internal_id,
-                            'bank_id': bank_id,
-                            'match_type': 'AMOUNT',
-                            'confidence': 0.7
-                        })
-                        break
+                # Check amount tolerance
+                comparisons += 1
+                if abs(float(mpr_amount) - float(int_amount)) <= self.match_tolerance:
+                    matches.append({
+                        'mpr_id': mpr_id,
+                        'internal_id': int_id,
+                        'match_type': 'EXACT_ID',
+                        'confidence': 1.0
+                    })
+                    matched_internal_ids.add(int_id)
+                    break
+        
+        self.profile.count('exact', 'comparisons', comparisons)
+        self.profile.count('exact', 'matches', len(matches))
+        return matches
+    
+    def _pair_by_amount_and_date(self, mpr_transactions, internal_transactions):
+        """Greedy AMOUNT_DATE pass over rows left unmatched by the exact pass."""
+        matches = []
+        fuzzy_index = AmountDateIndex(internal_transactions,
+                                      self.match_tolerance, self.date_tolerance_days)
+        
+        for mpr in mpr_transactions:
+            mpr_id, mpr_txn_id, mpr_amount, mpr_time, mpr_utr = mpr
+            
+            internal = fuzzy_index.match(mpr_amount, mpr_time)
+            if internal:
+                matches.append({
+                    'mpr_id': mpr_id,
+                    'internal_id': internal[0],
+                    'match_type': 'AMOUNT_DATE',
+                    'confidence': 0.8
+                })
+        
+        self.profile.count('fuzzy', 'probes', fuzzy_index.probes)
+        self.profile.count('fuzzy', 'matches', len(matches))
+        return matches
+    
+    def _index_by_transaction_id(self, internal_transactions):
+        """Build a transaction_id -> [internal rows] multimap in load order."""
+        index = {}
+        for internal in internal_transactions:
+            int_txn_id = internal[1]
+            if int_txn_id:
+                index.setdefault(int_txn_id, []).append(internal)
+        return index
+    
+    def _match_with_bank_statements(self, date_filter=None, high_mark=None):
+        """Match transactions with bank statements."""
+        try:
+            bank_transactions = self._load_bank_credits(date_filter, high_mark)
+            existing_matches = self._load_existing_matches()
+            self.profile.count('bank', 'bank_rows', len(bank_transactions))
+            self.profile.count('bank', 'candidate_rows', len(existing_matches))
+            
+            matches = self._pair_with_bank(existing_matches, bank_transactions)
             
             logging.info(f"Bank statement matching completed: {len(matches)} matches found", 
                         extra={'category': LOG_RECON})
@@ -227,8 +614,82 @@ class ReconciliationEngine:
                          extra={'category': LOG_RECON})
             return []
     
-    def _identify_anomalies(self, date_filter=None):
-        """Identify transaction anomalies."""
+    def _load_bank_credits(self, date_filter=None, high_mark=None):
+        """Load bank credits from completed statements (up to `high_mark`) in id order."""
+        query, params = _bounded_query("""
+            SELECT b.id, b.amount, b.utr, b.transaction_date, b.description
+            FROM bank_transactions b
+            JOIN bank_statement_uploads u ON b.upload_id = u.id
+            WHERE u.status = 'COMPLETED' AND b.amount > 0
+        """, 'b.transaction_date', date_filter, high_mark)
+        return _fetch_rows(query + " ORDER BY b.id", params)
+    
+    def _load_existing_matches(self):
+        """Load existing MPR-Internal matches with their MPR details in one pass."""
+        query = """
+            SELECT r.mpr_transaction_id, r.internal_transaction_id, m.amount, m.utr
+            FROM reconciliation_results r
+            JOIN mpr_transactions m ON r.mpr_transaction_id = m.id
+            WHERE r.mpr_transaction_id IS NOT NULL AND r.internal_transaction_id IS NOT NULL
+            ORDER BY r.id
+        """
+        return _fetch_rows(query)
+    
+    def _pair_with_bank(self, existing_matches, bank_transactions):
+        """Attach a bank credit to each existing match, UTR first, then amount."""
+        bank_index = BankCreditIndex(bank_transactions, self.match_tolerance)
+        matches = []
+        
+        for match in existing_matches:
+            mpr_id, internal_id, mpr_amount, mpr_utr = match
+            
+            bank, match_type = bank_index.match(mpr_amount, mpr_utr)
+            if not bank:
+                continue
+            
+            matches.append({
+                'mpr_id': mpr_id,
+                'internal_id': internal_id,
+                'bank_id': bank[0],
+                'match_type': match_type,
+                'confidence': 1.0 if match_type == 'UTR' else 0.7
+            })
+        
+        self.profile.count('bank', 'probes', bank_index.probes)
+        self.profile.count('bank', 'matches', len(matches))
+        return matches
+    
+    def _identify_anomalies(self, mpr_transactions, internal_transactions, matches):
+        """Identify anomalies from the rows and matches of the current run."""
+        matched_mpr_ids = {m['mpr_id'] for m in matches}
+        matched_internal_ids = {m['internal_id'] for m in matches}
+        
+        anomalies = self._unmatched_anomalies(
+            [mpr for mpr in mpr_transactions if mpr[0] not in matched_mpr_ids],
+            [i for i in internal_transactions if i[0] not in matched_internal_ids]
+        )
+        
+        logging.info(f"Anomaly detection completed: {len(anomalies)} anomalies found", 
+                    extra={'category': LOG_RECON})
+        self.profile.count('anomalies', 'anomalies', len(anomalies))
+        
+        return anomalies
+    
+    def _verify_anomalies(self, date_filter=None):
+        """
+        Cross-check a written run against the SQL anomaly queries.
+        
+        Once results are written every loaded row has a result, so any row the
+        SQL queries still report was missed by the in-memory derivation.
+        """
+        missed = self._identify_anomalies_sql(date_filter)
+        if missed:
+            logging.warning(f"Anomaly verification found {len(missed)} rows the run did not cover", 
+                           extra={'category': LOG_RECON})
+        return missed
+    
+    def _identify_anomalies_sql(self, date_filter=None):
+        """Identify transaction anomalies with SQL queries (verification mode only)."""
         try:
             anomalies = []
             
@@ -257,12 +718,12 @@ class ReconciliationEngine:
             """
             
             if date_filter:
-                date_condition = " AND CAST(m.transaction_time AS DATE) = ?"
-                unmatched_mpr_query += date_condition
-                unmatched_internal_query += " AND CAST(i.transaction_time AS DATE) = ?"
+                unmatched_mpr_query += " AND m.transaction_time >= ? AND m.transaction_time < ?"
+                unmatched_internal_query += " AND i.transaction_time >= ? AND i.transaction_time < ?"
                 
-                unmatched_mpr = execute_query(unmatched_mpr_query, (date_filter,), fetch='all')
-                unmatched_internal = execute_query(unmatched_internal_query, (date_filter,), fetch='all')
+                bounds = day_range(date_filter, date_filter)
+                unmatched_mpr = execute_query(unmatched_mpr_query, bounds, fetch='all')
+                unmatched_internal = execute_query(unmatched_internal_query, bounds, fetch='all')
             else:
                 unmatched_mpr = execute_query(unmatched_mpr_query, fetch='all')
                 unmatched_internal = execute_query(unmatched_internal_query, fetch='all')
@@ -322,19 +783,24 @@ class ReconciliationEngine:
                          extra={'category': LOG_RECON})
             return []
     
-    def _create_reconciliation_results(self, mpr_internal_matches, bank_matches, anomalies):
-        """Create reconciliation result records."""
+    def _create_reconciliation_results(self, mpr_internal_matches, bank_matches, anomalies,
+                                       statements=()):
+        """
+        Create reconciliation result records in one bulk transaction.
+        
+        Any extra (query, rows) `statements` run first, in the same transaction.
+        A failed write is logged and re-raised, so the caller's unit of work
+        is rolled back and the watermarks are not advanced.
+        """
         try:
             results = []
+            matched_rows = []
+            pending_rows = []
+            anomaly_rows = []
             
-            # Create matched results
+            # Matched results
             for match in bank_matches:
-                query = """
-                    INSERT INTO reconciliation_results 
-                    (mpr_transaction_id, internal_transaction_id, bank_transaction_id, status)
-                    VALUES (?, ?, ?, ?)
-                """
-                execute_query(query, (
+                matched_rows.append((
                     match['mpr_id'], 
                     match['internal_id'], 
                     match['bank_id'], 
@@ -342,32 +808,21 @@ class ReconciliationEngine:
                 ))
                 results.append(match)
             
-            # Create MPR-Internal only matches (no bank match yet)
+            # MPR-Internal only matches (no bank match yet)
             matched_mpr_ids = {m['mpr_id'] for m in bank_matches}
             
             for match in mpr_internal_matches:
                 if match['mpr_id'] not in matched_mpr_ids:
-                    query = """
-                        INSERT INTO reconciliation_results 
-                        (mpr_transaction_id, internal_transaction_id, status)
-                        VALUES (?, ?, ?)
-                    """
-                    execute_query(query, (
+                    pending_rows.append((
                         match['mpr_id'], 
                         match['internal_id'], 
                         TRANSACTION_STATUS_PENDING
                     ))
                     results.append(match)
             
-            # Create anomaly results
+            # Anomaly results
             for anomaly in anomalies:
-                query = """
-                    INSERT INTO reconciliation_results 
-                    (mpr_transaction_id, internal_transaction_id, bank_transaction_id, 
-                     status, anomaly_type)
-                    VALUES (?, ?, ?, ?, ?)
-                """
-                execute_query(query, (
+                anomaly_rows.append((
                     anomaly.get('mpr_id'),
                     anomaly.get('internal_id'),
                     anomaly.get('bank_id'),
@@ -376,12 +831,33 @@ class ReconciliationEngine:
                 ))
                 results.append(anomaly)
             
+            execute_many(list(statements) + [
+                ("""
+                    INSERT INTO reconciliation_results 
+                    (mpr_transaction_id, internal_transaction_id, bank_transaction_id, status)
+                    VALUES (?, ?, ?, ?)
+                """, matched_rows),
+                ("""
+                    INSERT INTO reconciliation_results 
+                    (mpr_transaction_id, internal_transaction_id, status)
+                    VALUES (?, ?, ?)
+                """, pending_rows),
+                ("""
+                    INSERT INTO reconciliation_results 
+                    (mpr_transaction_id, internal_transaction_id, bank_transaction_id, 
+                     status, anomaly_type)
+                    VALUES (?, ?, ?, ?, ?)
+                """, anomaly_rows),
+            ], batch_size=RECON_RESULT_BATCH_SIZE)
+            self.profile.count('write', 'rows',
+                               len(matched_rows) + len(pending_rows) + len(anomaly_rows))
+            
             return results
             
         except Exception as e:
             logging.error(f"Error creating reconciliation results: {str(e)}", 
                          extra={'category': LOG_RECON})
-            return []
+            raise
     
     def _clear_reconciliation_results(self, date_filter):
         """Clear existing reconciliation results for a date."""
@@ -399,6 +875,129 @@ class ReconciliationEngine:
             logging.error(f"Error clearing reconciliation results: {str(e)}", 
                          extra={'category': LOG_RECON})
 
+class ReconWatermark:
+    """High-water marks of the uploads each source contributed to reconciliation."""
+    
+    UPLOAD_TABLES = {
+        RECON_SOURCE_MPR: 'mpr_uploads',
+        RECON_SOURCE_INTERNAL: 'internal_uploads',
+        RECON_SOURCE_BANK: 'bank_statement_uploads',
+    }
+    
+    @staticmethod
+    def get_all():
+        """Get the last reconciled upload id per source (0 if never reconciled)."""
+        try:
+            watermarks = {source: 0 for source in RECON_SOURCES}
+            query = "SELECT source, last_upload_id FROM recon_watermarks"
+            for source, last_upload_id in execute_query(query, fetch='all') or []:
+                watermarks[source] = last_upload_id or 0
+            return watermarks
+            
+        except Exception as e:
+            logging.error(f"Error fetching reconciliation watermarks: {str(e)}", 
+                         extra={'category': LOG_RECON})
+            return None
+    
+    @staticmethod
+    def get_high_marks():
+        """Get the newest completed upload id per source."""
+        try:
+            high_marks = {}
+            for source, table in ReconWatermark.UPLOAD_TABLES.items():
+                query = f"SELECT MAX(id) FROM {table} WHERE status = 'COMPLETED'"
+                result = execute_query(query, fetch='one')
+                high_marks[source] = (result[0] if result else None) or 0
+            return high_marks
+            
+        except Exception as e:
+            logging.error(f"Error fetching upload high marks: {str(e)}", 
+                         extra={'category': LOG_RECON})
+            return None
+    
+    @staticmethod
+    def advance(high_marks):
+        """Move each source's watermark forward; never moves backwards."""
+        try:
+            query = f"""
+                UPDATE recon_watermarks 
+                SET last_upload_id = ?, updated_at = {get_dialect().now()}
+                WHERE source = ? AND last_upload_id < ?
+            """
+            for source, high_mark in high_marks.items():
+                execute_query(query, (high_mark, source, high_mark))
+            
+            logging.info(f"Reconciliation watermarks advanced: {high_marks}", 
+                        extra={'category': LOG_RECON})
+            return True
+            
+        except Exception as e:
+            logging.error(f"Error advancing reconciliation watermarks: {str(e)}", 
+                         extra={'category': LOG_RECON})
+            return False
+
+class ReconRunHistory:
+    """Stored profiles of past reconciliation runs."""
+    
+    @staticmethod
+    def record(profile):
+        """Store one run profile (as produced by RunProfile.to_dict)."""
+        try:
+            query = """
+                INSERT INTO recon_run_history 
+                (backend, mode, date_filter, started_at, total_seconds, results, 
+                 peak_rss_kb, profile)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """
+            execute_query(query, (
+                profile['backend'],
+                profile['mode'],
+                profile['date_filter'],
+                profile['started_at'],
+                profile['total_seconds'],
+                profile['results'],
+                profile['peak_rss_kb'],
+                json.dumps(profile['stages'])
+            ))
+            return True
+            
+        except Exception as e:
+            logging.error(f"Error recording reconciliation run history: {str(e)}", 
+                         extra={'category': LOG_RECON})
+            return False
+    
+    @staticmethod
+    def get_recent(limit=20):
+        """Get the most recent run profiles, newest first."""
+        try:
+            query = f"""
+                SELECT id, backend, mode, date_filter, started_at, total_seconds, 
+                       results, peak_rss_kb, profile
+                FROM recon_run_history
+                ORDER BY id DESC
+                {get_dialect().paginate(limit)}
+            """
+            rows = execute_query(query, fetch='all') or []
+            return [
+                {
+                    'id': row[0],
+                    'backend': row[1],
+                    'mode': row[2],
+                    'date_filter': row[3],
+                    'started_at': row[4],
+                    'total_seconds': row[5],
+                    'results': row[6],
+                    'peak_rss_kb': row[7],
+                    'stages': json.loads(row[8]) if row[8] else {}
+                }
+                for row in rows
+            ]
+            
+        except Exception as e:
+            logging.error(f"Error fetching reconciliation run history: {str(e)}", 
+                         extra={'category': LOG_RECON})
+            return []
+
 class ReconciliationReport:
     @staticmethod
     def get_summary(date_filter=None):
@@ -413,9 +1012,9 @@ class ReconciliationReport:
             """
             
             if date_filter:
-                base_query += " WHERE CAST(created_at AS DATE) = ?"
+                base_query += " WHERE created_at >= ? AND created_at < ?"
                 results = execute_query(base_query + " GROUP BY status, anomaly_type", 
-                                      (date_filter,), fetch='all')
+                                      day_range(date_filter, date_filter), fetch='all')
             else:
                 results = execute_query(base_query + " GROUP BY status, anomaly_type", 
                                       fetch='all')
@@ -478,10 +1077,10 @@ class ReconciliationReport:
             
             if status_filter:
                 query += " WHERE r.status = ?"
-                results = execute_query(query + f" ORDER BY r.created_at DESC LIMIT {limit}", 
+                results = execute_query(query + f" ORDER BY r.created_at DESC {get_dialect().paginate(limit)}", 
                                       (status_filter,), fetch='all')
             else:
-                results = execute_query(query + f" ORDER BY r.created_at DESC LIMIT {limit}", 
+                results = execute_query(query + f" ORDER BY r.created_at DESC {get_dialect().paginate(limit)}", 
                                       fetch='all')
             
             detailed_results = []
@@ -0,0 +1,363 @@
+"""
+Partitioned, multi-process reconciliation backend.
+"""
+import gc
+import heapq
+import logging
+import multiprocessing
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from operator import itemgetter
+import numpy as np
+import pandas as pd
+from config.settings import Config
+from config.constants import LOG_RECON, RECON_BACKEND_PARALLEL, RECON_PARALLEL_MIN_ROWS
+from app.recon.models import ReconciliationEngine
+from app.recon.matching import parse_transaction_time, to_paise
+
+# Input of the pass being run; forked workers inherit it instead of receiving
+# a pickled copy
+_pass_input = None
+
+def _split(sources, shard):
+    """
+    Rows of one shard, as a (positions, rows) pair per pass argument.
+
+    `sources` holds a (rows, assignment) pair per argument, the assignment
+    giving each row's shard, or -1 for rows the pass can leave out.
+    """
+    split = []
+    for rows, assignment in sources:
+        positions = np.flatnonzero(assignment == shard).tolist()
+        split.append((positions, [rows[position] for position in positions]))
+    return split
+
+def _walk(results, side, result_key, row_key):
+    """Pair results made from a subsequence of a shard's rows with the rows' positions."""
+    positions, rows = side
+    cursor = 0
+    for result in results:
+        while row_key(rows[cursor]) != result_key(result):
+            cursor += 1
+        yield positions[cursor], result
+        cursor += 1
+
+def _positioned(method, results, split):
+    """Key each result by the load position of the row it was made from."""
+    if method == '_unmatched_anomalies':
+        # One anomaly per MPR row in order, then internal rows left unpaired
+        mpr_positions = split[0][0]
+        keyed = [((0, position), anomaly)
+                 for position, anomaly in zip(mpr_positions, results)]
+        keyed.extend(((1, position), anomaly) for position, anomaly in _walk(
+            results[len(mpr_positions):], split[1],
+            itemgetter('internal_id'), itemgetter(0)))
+        return keyed
+
+    if method == '_pair_with_bank':
+        result_key, row_key = itemgetter('mpr_id', 'internal_id'), itemgetter(0, 1)
+    else:
+        result_key, row_key = itemgetter('mpr_id'), itemgetter(0)
+    return [((0, position), result)
+            for position, result in _walk(results, split[0], result_key, row_key)]
+
+def _run_shard(method, match_tolerance, date_tolerance_days, shard, split=None):
+    """
+    Run one of the row engine's passes over one shard of its input.
+
+    Runs inside a worker process; `split` is None when the worker was forked
+    with the pass input in memory. Returns the results keyed by load position
+    and the stage counters the pass reported.
+    """
+    if split is None:
+        split = _split(_pass_input, shard)
+    engine = ReconciliationEngine()
+    engine.match_tolerance = match_tolerance
+    engine.date_tolerance_days = date_tolerance_days
+    results = getattr(ReconciliationEngine, method)(engine, *(rows for _, rows in split))
+    return _positioned(method, results, split), engine.profile.stages
+
+def _components(count, left, right):
+    """Label each of `count` nodes with the smallest node of its connected component."""
+    labels = np.arange(count)
+    while True:
+        lowest = np.minimum(labels[left], labels[right])
+        joined = labels.copy()
+        np.minimum.at(joined, left, lowest)
+        np.minimum.at(joined, right, lowest)
+        joined = joined[joined]
+        if np.array_equal(joined, labels):
+            return labels
+        labels = joined
+
+def _codes(values):
+    """Integer codes of the values; empty and missing values get -1."""
+    column = np.empty(len(values), dtype=object)
+    column[:] = [value or None for value in values]
+    return pd.factorize(column)[0]
+
+def _pool_context():
+    """
+    Start method for a pass's workers.
+
+    On Linux a single-threaded process (the CLI, a benchmark case, a job
+    runner) forks, so workers inherit the pass input and the app is not
+    re-imported. A process already running threads, such as the web app
+    with its ingest queue and connection pool, may be forked while another
+    thread holds a lock, leaving the child to wait on it forever; its
+    workers come from a fork server instead and receive their shard pickled.
+    """
+    if not sys.platform.startswith('linux'):
+        return multiprocessing.get_context()
+    if threading.active_count() == 1:
+        return multiprocessing.get_context('fork')
+    return multiprocessing.get_context('forkserver')
+
+def _paise(amounts):
+    return np.rint(np.asarray(amounts, dtype=float) * 100).astype(np.int64)
+
+class ParallelReconciliationEngine(ReconciliationEngine):
+    """
+    Reconciliation engine that runs every pass across a process pool.
+
+    Each pass is split into shards whose rows cannot affect one another, and
+    every shard runs the row engine's own code on its rows in load order, so
+    results are identical to the row engine's:
+
+    - EXACT_ID pairing and the AMOUNT_MISMATCH/MISSING anomalies only ever
+      pair rows sharing a transaction ID, so they are sharded by ID;
+    - AMOUNT_DATE rows are grouped into (amount in paise, settlement day)
+      cells, and cells that hold an MPR row and an internal row within the
+      amount and date tolerances are joined into one component;
+    - bank credits are joined to the matches they could settle, by UTR or
+      by amount, in the same way.
+
+    Components go to shards whole. A greedy choice only ever sees rows of
+    its own component, so matching them apart gives the same pairs. Dense
+    amounts can chain many cells into one component, which then runs on a
+    single worker.
+    """
+    backend = RECON_BACKEND_PARALLEL
+
+    def __init__(self, workers=None):
+        super().__init__()
+        self.workers = max(1, workers or Config.RECON_WORKERS)
+        self._fan_out = False
+
+    def run_reconciliation(self, date_filter=None, incremental=False):
+        """Run reconciliation, deciding afresh whether its passes fan out."""
+        self._fan_out = False
+        return super().run_reconciliation(date_filter, incremental)
+
+    def _pair_mpr_with_internal(self, mpr_transactions, internal_transactions):
+        """Decide from the run's size whether every later pass fans out."""
+        self._fan_out = self._fan_out or (
+            len(mpr_transactions) + len(internal_transactions) >= RECON_PARALLEL_MIN_ROWS)
+        return super()._pair_mpr_with_internal(mpr_transactions, internal_transactions)
+
+    def _fans_out(self, rows):
+        return self.workers > 1 and (self._fan_out or rows >= RECON_PARALLEL_MIN_ROWS)
+
+    def _pair_by_transaction_id(self, mpr_transactions, internal_transactions):
+        """EXACT_ID pass, sharded by transaction ID."""
+        if not self._fans_out(len(mpr_transactions) + len(internal_transactions)):
+            return super()._pair_by_transaction_id(mpr_transactions, internal_transactions)
+
+        mpr_shards, internal_shards = self._id_shards(mpr_transactions, internal_transactions)
+        # Rows without an ID never pair, so they are left out altogether
+        return self._run_sharded('exact', '_pair_by_transaction_id', [
+            (mpr_transactions, mpr_shards), (internal_transactions, internal_shards)])
+
+    def _unmatched_anomalies(self, unmatched_mpr, unmatched_internal):
+        """Anomaly pass, sharded by transaction ID."""
+        if not self._fans_out(len(unmatched_mpr) + len(unmatched_internal)):
+            return super()._unmatched_anomalies(unmatched_mpr, unmatched_internal)
+
+        # Every row has an anomaly, so rows without an ID are spread by position
+        sources = []
+        for rows, shards in zip((unmatched_mpr, unmatched_internal),
+                                self._id_shards(unmatched_mpr, unmatched_internal)):
+            missing = shards < 0
+            shards[missing] = np.flatnonzero(missing) % self.workers
+            sources.append((rows, shards))
+        return self._run_sharded('anomalies', '_unmatched_anomalies', sources)
+
+    def _id_shards(self, mpr_rows, internal_rows):
+        """Shard of each MPR and internal row by transaction ID (-1: no ID)."""
+        codes = _codes([row[1] for row in mpr_rows] + [row[1] for row in internal_rows])
+        shards = np.where(codes < 0, -1, codes % self.workers)
+        return shards[:len(mpr_rows)], shards[len(mpr_rows):]
+
+    def _pair_by_amount_and_date(self, mpr_transactions, internal_transactions):
+        """AMOUNT_DATE pass, sharded by (amount, day) component."""
+        if not self._fans_out(len(mpr_transactions) + len(internal_transactions)):
+            return super()._pair_by_amount_and_date(mpr_transactions, internal_transactions)
+
+        mpr_cells, internal_cells, labels = self._amount_date_components(
+            mpr_transactions, internal_transactions)
+        mpr_labels, internal_labels = labels[mpr_cells], labels[internal_cells]
+        reached = np.isin(internal_labels, mpr_labels)
+        return self._run_sharded('fuzzy', '_pair_by_amount_and_date', [
+            (mpr_transactions, mpr_labels % self.workers),
+            (internal_transactions, np.where(reached, internal_labels % self.workers, -1)),
+        ])
+
+    def _amount_date_components(self, mpr_rows, internal_rows):
+        """
+        Join (paise, day) cells that an MPR probe can reach into components.
+
+        A probe reaches candidates within the paise span and, when both rows
+        are dated, within DATE_TOLERANCE_DAYS + 1 calendar days; undated rows
+        reach every day. Returns the cell of each MPR and internal row and the
+        component label of every cell.
+        """
+        span = to_paise(self.match_tolerance) + 1
+        reach = self.date_tolerance_days + 1
+
+        def days(rows):
+            parsed = (parse_transaction_time(row[3]) for row in rows)
+            return np.fromiter((when.toordinal() if when else 0 for when in parsed),
+                               dtype=np.int64, count=len(rows))
+
+        mpr_paise, internal_paise = (_paise([row[2] for row in mpr_rows]),
+                                     _paise([row[2] for row in internal_rows]))
+        mpr_days, internal_days = days(mpr_rows), days(internal_rows)
+
+        # Cell key: paise * stride + day index, where index 0 is "undated" and
+        # every dated index stays clear of 0 and the stride even when offset
+        dated = np.concatenate([mpr_days, internal_days])
+        dated = dated[dated > 0]
+        first_day = (dated.min() if len(dated) else 0) - reach - 1
+        stride = (dated.max() if len(dated) else 0) - first_day + reach + 1
+
+        def keys(paise, day_values):
+            return paise * stride + np.where(day_values > 0, day_values - first_day, 0)
+
+        mpr_keys, internal_keys = keys(mpr_paise, mpr_days), keys(internal_paise, internal_days)
+        cells, cell_of = np.unique(np.concatenate([mpr_keys, internal_keys]), return_inverse=True)
+        mpr_cells, internal_cells = cell_of[:len(mpr_rows)], cell_of[len(mpr_rows):]
+
+        probes, probe_cells = np.unique(mpr_keys, return_index=True)
+        probe_cells = mpr_cells[probe_cells]
+        probe_paise, probe_dated = probes // stride, probes % stride > 0
+        candidates = np.unique(internal_keys)
+
+        left, right = [], []
+        def connect(sources, targets):
+            found = np.searchsorted(candidates, targets)
+            hit = (found < len(candidates))
+            hit[hit] = candidates[found[hit]] == targets[hit]
+            left.append(sources[hit])
+            right.append(np.searchsorted(cells, targets[hit]))
+
+        undated_paise = []
+        for paise_offset in range(-span, span + 1):
+            base = probes + paise_offset * stride
+            # Dated probes: dated candidates inside the window, and undated ones
+            for day_offset in range(-reach, reach + 1):
+                connect(probe_cells[probe_dated], base[probe_dated] + day_offset)
+            connect(probe_cells[probe_dated], (probe_paise[probe_dated] + paise_offset) * stride)
+            undated_paise.append(probe_paise[~probe_dated] + paise_offset)
+
+        # Undated probes reach every day: join them through one node per paise
+        undated_probes = probe_cells[~probe_dated]
+        columns, column_of = np.unique(np.concatenate(undated_paise), return_inverse=True)
+        left.append(np.tile(undated_probes, 2 * span + 1))
+        right.append(len(cells) + column_of)
+        candidate_cells = np.searchsorted(cells, candidates)
+        candidate_column = np.searchsorted(columns, candidates // stride)
+        in_column = candidate_column < len(columns)
+        in_column[in_column] = columns[candidate_column[in_column]] == (
+            candidates[in_column] // stride)
+        left.append(candidate_cells[in_column])
+        right.append(len(cells) + candidate_column[in_column])
+
+        labels = _components(len(cells) + len(columns),
+                             np.concatenate(left), np.concatenate(right))
+        return mpr_cells, internal_cells, labels
+
+    def _pair_with_bank(self, existing_matches, bank_transactions):
+        """Bank pass, sharded by the UTR and amount components matches and credits share."""
+        if not existing_matches or not self._fans_out(
+                len(existing_matches) + len(bank_transactions)):
+            return super()._pair_with_bank(existing_matches, bank_transactions)
+
+        span = to_paise(self.match_tolerance) + 1
+        utrs = _codes([match[3] for match in existing_matches]
+                      + [bank[2] for bank in bank_transactions])
+        match_utrs, credit_utrs = utrs[:len(existing_matches)], utrs[len(existing_matches):]
+
+        # Nodes: one per credit amount in paise, then one per UTR
+        credit_paise = _paise([bank[1] for bank in bank_transactions])
+        amounts, credit_nodes = np.unique(credit_paise, return_inverse=True)
+        utr_node = len(amounts) + utrs
+        left = [credit_nodes[credit_utrs >= 0]]
+        right = [utr_node[len(existing_matches):][credit_utrs >= 0]]
+
+        # A match can take any credit with its UTR or within the amount tolerance;
+        # its first reachable node anchors the rest
+        match_amounts = np.array([np.nan if match[2] is None else float(match[2])
+                                  for match in existing_matches])
+        has_amount = ~np.isnan(match_amounts)
+        match_paise = np.where(has_amount, np.rint(np.nan_to_num(match_amounts) * 100),
+                               0).astype(np.int64)
+        anchor = np.where(match_utrs >= 0, utr_node[:len(existing_matches)], -1)
+        for offset in range(-span, span + 1):
+            found = np.searchsorted(amounts, match_paise + offset)
+            hit = has_amount & (found < len(amounts))
+            hit[hit] = amounts[found[hit]] == match_paise[hit] + offset
+            linked = hit & (anchor >= 0)
+            left.append(anchor[linked])
+            right.append(found[linked])
+            anchor = np.where(hit & (anchor < 0), found, anchor)
+
+        labels = _components(len(amounts) + (utrs.max() + 1 if len(utrs) else 0),
+                             np.concatenate(left), np.concatenate(right))
+        match_labels = np.where(anchor >= 0, labels[np.maximum(anchor, 0)], -1)
+        credit_labels = labels[credit_nodes]
+        reached = np.isin(credit_labels, match_labels[anchor >= 0])
+        return self._run_sharded('bank', '_pair_with_bank', [
+            (existing_matches, np.where(anchor >= 0, match_labels % self.workers, -1)),
+            (bank_transactions, np.where(reached, credit_labels % self.workers, -1)),
+        ])
+
+    def _run_sharded(self, stage, method, sources):
+        """
+        Run a row-engine pass on every shard and merge the results in the
+        order the row engine produces them.
+
+        Forked workers split the pass input themselves from the copy they
+        inherit, so rows are never pickled; otherwise each shard is sent.
+        """
+        global _pass_input
+        context = _pool_context()
+        inherit = context.get_start_method() == 'fork'
+        _pass_input = sources if inherit else None
+        if inherit:
+            # Keep the collector in the workers off the inherited heap, which
+            # would otherwise be copied page by page as it is traversed
+            gc.freeze()
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers, mp_context=context) as pool:
+                futures = [pool.submit(_run_shard, method, self.match_tolerance,
+                                       self.date_tolerance_days, shard,
+                                       None if inherit else _split(sources, shard))
+                           for shard in range(self.workers)]
+                keyed = []
+                for future in futures:
+                    shard_results, stages = future.result()
+                    keyed.append(shard_results)
+                    for name, counters in stages.items():
+                        for counter, value in counters.items():
+                            if counter != 'seconds':
+                                self.profile.count(name, counter, value)
+        finally:
+            _pass_input = None
+            if inherit:
+                gc.unfreeze()
+
+        self.profile.count(stage, 'shards', self.workers)
+        logging.info(f"Parallel {stage} pass on {self.workers} workers",
+                     extra={'category': LOG_RECON})
+        return [result for _, result in heapq.merge(*keyed, key=itemgetter(0))]
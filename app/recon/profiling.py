@@ -0,0 +1,84 @@
+"""
+Per-stage timing and counters for reconciliation runs.
+"""
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+def peak_rss_kb():
+    """Peak resident set size of this process and its finished children, in KB."""
+    if resource is None:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # ru_maxrss is reported in bytes on macOS and in kilobytes elsewhere
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+class RunProfile:
+    """
+    Structured profile of one reconciliation run.
+
+    Each stage accumulates wall time across every entry into it, plus any
+    named counters (rows loaded, comparisons, index probes) its code reports.
+    """
+
+    def __init__(self, backend=None, mode=None, date_filter=None):
+        self.backend = backend
+        self.mode = mode
+        self.date_filter = date_filter
+        self.started_at = datetime.utcnow()
+        self.results = 0
+        self.stages = {}
+        self._started = time.perf_counter()
+        self._total_seconds = None
+
+    @contextmanager
+    def stage(self, name):
+        """Time the enclosed block as part of the named stage."""
+        stage = self._stage(name)
+        started = time.perf_counter()
+        try:
+            yield stage
+        finally:
+            stage['seconds'] += time.perf_counter() - started
+
+    def count(self, stage, counter, amount=1):
+        """Add to a counter of the named stage."""
+        stage = self._stage(stage)
+        stage[counter] = stage.get(counter, 0) + amount
+
+    def finish(self, results):
+        """Stop the clock and record how many results the run wrote."""
+        self.results = results
+        self._total_seconds = time.perf_counter() - self._started
+
+    @property
+    def total_seconds(self):
+        if self._total_seconds is None:
+            return time.perf_counter() - self._started
+        return self._total_seconds
+
+    def to_dict(self):
+        return {
+            'backend': self.backend,
+            'mode': self.mode,
+            'date_filter': self.date_filter,
+            'started_at': self.started_at.isoformat(),
+            'total_seconds': round(self.total_seconds, 6),
+            'results': self.results,
+            'peak_rss_kb': peak_rss_kb(),
+            'stages': {
+                name: {key: round(value, 6) if key == 'seconds' else value
+                       for key, value in stage.items()}
+                for name, stage in self.stages.items()
+            },
+        }
+
+    def _stage(self, name):
+        return self.stages.setdefault(name, {'seconds': 0.0})
@@ -3,10 +3,10 @@ Reconciliation routes and views.
 """
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from app.auth.utils import login_required
-from app.recon.models import ReconciliationEngine, ReconciliationReport
+from app.recon.models import ReconciliationReport, ReconRunHistory, get_reconciliation_engine
 from datetime import datetime
 import logging
-from config.constants import LOG_RECON
+from config.constants import LOG_RECON, RECON_BACKENDS
 
 recon_bp = Blueprint('recon', __name__)
 
@@ -23,13 +23,15 @@ def index():
         
         return render_template('recon/index.html', 
                              summary=summary, 
-                             recent_results=recent_results)
+                             recent_results=recent_results,
+                             backends=RECON_BACKENDS)
         
     except Exception as e:
         flash(f'Error loading reconciliation data: {str(e)}', 'error')
         return render_template('recon/index.html', 
                              summary={}, 
-                             recent_results=[])
+                             recent_results=[],
+                             backends=RECON_BACKENDS)
 
 @recon_bp.route('/run', methods=['POST'])
 @login_required
@@ -46,9 +48,19 @@ def run_reconciliation():
                 flash('Invalid date format. Please use YYYY-MM-DD.', 'error')
                 return redirect(url_for('recon.index'))
         
+        backend = request.form.get('backend')
+        if backend and backend.upper() not in RECON_BACKENDS:
+            flash(f'Unknown reconciliation backend: {backend}', 'error')
+            return redirect(url_for('recon.index'))
+        
+        incremental = request.form.get('incremental') == 'on'
+        if incremental and date_filter:
+            flash('Incremental runs cover all new uploads; the date filter was ignored.', 'warning')
+            date_filter = None
+        
         # Run reconciliation
-        engine = ReconciliationEngine()
-        results = engine.run_reconciliation(date_filter)
+        engine = get_reconciliation_engine(backend)
+        results = engine.run_reconciliation(date_filter, incremental=incremental)
         
         if results:
             flash(f'Reconciliation completed successfully. {len(results)} results processed.', 'success')
@@ -131,17 +143,31 @@ def api_summary():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@recon_bp.route('/api/runs')
+@login_required
+def api_runs():
+    """API endpoint for recent reconciliation run profiles."""
+    try:
+        limit = request.args.get('limit', 20, type=int)
+        runs = ReconRunHistory.get_recent(max(1, min(limit, 100)))
+        for run in runs:
+            if run['started_at'] is not None:
+                run['started_at'] = str(run['started_at'])
+        return jsonify(runs)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @recon_bp.route('/resolve/<int:result_id>', methods=['POST'])
 @login_required
 def resolve_anomaly(result_id):
     """Mark anomaly as resolved."""
     try:
-        from config.database import execute_query
+        from config.database import execute_query, get_dialect
         from config.constants import TRANSACTION_STATUS_RESOLVED
         
-        query = """
+        query = f"""
             UPDATE reconciliation_results 
-            SET status = ?, resolved_at = GETUTCDATE() 
+            SET status = ?, resolved_at = {get_dialect().now()} 
             WHERE id = ?
         """
         execute_query(query, (TRANSACTION_STATUS_RESOLVED, result_id))
@@ -0,0 +1,348 @@
+"""
+Bounded-memory streaming reconciliation backend.
+"""
+import logging
+from itertools import chain
+from datetime import datetime, timedelta
+from config.database import stream_query, transaction
+from config.dialects import day_range
+from config.constants import (
+    LOG_RECON, RECON_STREAM_CHUNK_SIZE, RECON_BACKEND_STREAMING, RECON_MODE_FULL,
+    ANOMALY_MISSING_INTERNAL, ANOMALY_MISSING_MPR, RECON_SOURCE_MPR, RECON_SOURCE_INTERNAL,
+    RECON_SOURCE_BANK
+)
+from app.recon.models import ReconciliationEngine, ReconWatermark
+from app.recon.matching import SlidingWindowIndex, parse_transaction_time
+from app.recon.profiling import RunProfile
+
+class StreamedResults:
+    """Counts of results written by a streaming run (the rows are not kept)."""
+
+    def __init__(self):
+        self.matched = 0
+        self.pending = 0
+        self.anomalies = 0
+
+    def __len__(self):
+        return self.matched + self.pending + self.anomalies
+
+    def __bool__(self):
+        return len(self) > 0
+
+class _TimeOrderedStream:
+    """One-row lookahead over a time-ordered row iterator."""
+
+    def __init__(self, rows, time_index):
+        self._rows = iter(rows)
+        self._time_index = time_index
+        self.head = None
+        self.head_time = None
+        self.advance()
+
+    def advance(self):
+        row = next(self._rows, None)
+        self.head = row
+        self.head_time = parse_transaction_time(row[self._time_index]) if row else None
+        return row
+
+class StreamingReconciliationEngine(ReconciliationEngine):
+    """
+    Reconciliation engine whose memory is bounded by the date window.
+
+    MPR, internal and bank credit rows are read through forward-only cursors
+    in time order, RECON_STREAM_CHUNK_SIZE rows per fetch. Internal and bank
+    rows are held only while they are within DATE_TOLERANCE_DAYS + 1 days of
+    the MPR row being matched; older rows are released, unmatched internal
+    rows becoming MISSING_MPR anomalies. Results are written chunk by chunk.
+
+    Matching follows the in-memory engines with two scoped differences: exact
+    IDs and bank credits must fall inside the window, and ties go to the
+    earliest transaction time. Rows whose time is missing or unparseable are
+    undated: undated internal rows and bank credits are held for the rest of
+    the run and can match any later MPR row, and undated MPR rows are matched
+    last, against the undated rows only.
+
+    Results therefore differ from the in-memory engines', which should be
+    used where the two must agree:
+
+    - bank credits are matched within the run, as soon as a match is made;
+      the in-memory engines only offer credits to matches stored by earlier
+      runs, so their first run leaves every match PENDING;
+    - pairs the window keeps apart are reported as a MISSING_INTERNAL and a
+      MISSING_MPR anomaly, two result rows where the in-memory engines write
+      one match or one AMOUNT_MISMATCH.
+    """
+    backend = RECON_BACKEND_STREAMING
+
+    def run_reconciliation(self, date_filter=None, incremental=False):
+        """Run reconciliation over time-ordered streams."""
+        if incremental:
+            return super().run_reconciliation(incremental=True)
+
+        try:
+            logging.info("Starting streaming reconciliation process",
+                        extra={'category': LOG_RECON})
+            self.profile = RunProfile(self.backend, RECON_MODE_FULL, date_filter)
+
+            high_marks = ReconWatermark.get_high_marks() if not date_filter else None
+
+            # Streams read on their own connections; every chunk written and the
+            # watermarks commit together, so a failed chunk leaves no partial run
+            with transaction():
+                if date_filter:
+                    self._clear_reconciliation_results(date_filter)
+
+                with self.profile.stage('match'):
+                    results = self._reconcile_streams(date_filter, high_marks)
+
+                if high_marks:
+                    ReconWatermark.advance(high_marks)
+
+            logging.info(f"Streaming reconciliation completed: {len(results)} results created "
+                        f"({results.matched} matched, {results.pending} pending, "
+                        f"{results.anomalies} anomalies)",
+                        extra={'category': LOG_RECON})
+            self._finish_profile(len(results))
+
+            return results
+
+        except Exception as e:
+            logging.error(f"Streaming reconciliation process failed: {str(e)}",
+                         extra={'category': LOG_RECON})
+            return []
+
+    def _reconcile_streams(self, date_filter, bounds=None):
+        """
+        Slide the match window across the MPR stream and write as it goes.
+
+        `bounds` maps each source to the newest upload the run covers.
+        """
+        bounds = bounds or {}
+        window = timedelta(days=self.date_tolerance_days + 1)
+        results = StreamedResults()
+        self._reset_buffer()
+
+        internal_window = SlidingWindowIndex(self.match_tolerance, self.date_tolerance_days)
+        bank_window = SlidingWindowIndex(self.match_tolerance)
+        undated_internal = SlidingWindowIndex(self.match_tolerance)
+        undated_bank = SlidingWindowIndex(self.match_tolerance)
+
+        internal_bound = bounds.get(RECON_SOURCE_INTERNAL)
+        bank_bound = bounds.get(RECON_SOURCE_BANK)
+        mpr_bound = bounds.get(RECON_SOURCE_MPR)
+        for internal in self._stream_internal(date_filter, internal_bound, dated=False):
+            undated_internal.add(internal, internal[1], internal[2], datetime.min)
+        for bank in self._stream_bank_credits(date_filter, bank_bound, dated=False):
+            undated_bank.add(bank, bank[2], bank[1], datetime.min)
+
+        internal_stream = _TimeOrderedStream(self._stream_internal(date_filter, internal_bound), 3)
+        bank_stream = _TimeOrderedStream(self._stream_bank_credits(date_filter, bank_bound), 3)
+
+        self._peak_window = 0
+        unparseable_mpr = []
+        for mpr in self._stream_mpr(date_filter, mpr_bound):
+            self.profile.count('match', 'mpr_rows')
+            when = parse_transaction_time(mpr[3])
+            if when is None:
+                # A stored time that cannot be read makes the row undated
+                unparseable_mpr.append(mpr)
+                continue
+
+            # Slide the window: pull rows up to when + window, release rows before when - window
+            self._fill(internal_window, undated_internal, internal_stream, when + window,
+                       key_index=1, amount_index=2)
+            self._fill(bank_window, undated_bank, bank_stream, when + window,
+                       key_index=2, amount_index=1)
+            for internal in internal_window.evict_before(when - window):
+                self._buffer_missing_mpr(internal, results)
+            bank_window.evict_before(when - window)
+            self._peak_window = max(self._peak_window, len(internal_window) + len(bank_window))
+
+            self._match_streamed(mpr, when, internal_window, undated_internal,
+                                 bank_window, undated_bank, results)
+
+        # Everything still open on the internal side can no longer meet a dated MPR row
+        while internal_stream.head:
+            if internal_stream.head_time is None:
+                undated_internal.add(internal_stream.head, internal_stream.head[1],
+                                     internal_stream.head[2], datetime.min)
+            else:
+                self._buffer_missing_mpr(internal_stream.head, results)
+            internal_stream.advance()
+        for internal in internal_window.drain():
+            self._buffer_missing_mpr(internal, results)
+        while bank_stream.head:
+            if bank_stream.head_time is None:
+                undated_bank.add(bank_stream.head, bank_stream.head[2],
+                                 bank_stream.head[1], datetime.min)
+            bank_stream.advance()
+
+        for mpr in chain(unparseable_mpr, self._stream_mpr(date_filter, mpr_bound, dated=False)):
+            self._match_streamed(mpr, None, internal_window, undated_internal,
+                                 bank_window, undated_bank, results)
+        for internal in undated_internal.drain():
+            self._buffer_missing_mpr(internal, results)
+
+        # Repeated MPR rows were flagged at ingest and left out of the stream
+        duplicates = self._stream_rows(*self._duplicate_mpr_query(
+            date_filter, watermark=0, high_mark=mpr_bound))
+        for anomaly in self._duplicate_anomalies(duplicates):
+            self._buffer['anomalies'].append(anomaly)
+            results.anomalies += 1
+            self._maybe_flush(results)
+
+        self._flush(results)
+
+        # Reading, matching and eviction are interleaved, so they share one stage
+        self.profile.count('match', 'internal_probes',
+                           internal_window.probes + undated_internal.probes)
+        self.profile.count('match', 'bank_probes', bank_window.probes + undated_bank.probes)
+        self.profile.count('match', 'unparseable_mpr_rows', len(unparseable_mpr))
+        self.profile.count('match', 'peak_window_rows', self._peak_window)
+        return results
+
+    def _fill(self, index, undated, stream, until, key_index, amount_index):
+        """
+        Add stream rows to the window until the next one is later than `until`.
+
+        Rows whose stored time cannot be parsed go to the undated index.
+        """
+        while stream.head and (stream.head_time is None or stream.head_time <= until):
+            if stream.head_time is None:
+                undated.add(stream.head, stream.head[key_index], stream.head[amount_index],
+                            datetime.min)
+            else:
+                index.add(stream.head, stream.head[key_index], stream.head[amount_index],
+                          stream.head_time)
+            stream.advance()
+
+    def _match_streamed(self, mpr, when, internal_window, undated_internal,
+                        bank_window, undated_bank, results):
+        """Match one MPR row against the window and buffer the outcome."""
+        mpr_id, mpr_txn_id, mpr_amount, mpr_time, mpr_utr = mpr
+
+        match_type = 'EXACT_ID'
+        internal = (internal_window.match_key(mpr_txn_id, mpr_amount)
+                    or undated_internal.match_key(mpr_txn_id, mpr_amount))
+        if internal is None:
+            match_type = 'AMOUNT_DATE'
+            internal = (internal_window.match_amount(mpr_amount, when)
+                        or undated_internal.match_amount(mpr_amount, when))
+
+        if internal is None:
+            self._buffer['anomalies'].append({
+                'mpr_id': mpr_id,
+                'internal_id': None,
+                'bank_id': None,
+                'anomaly_type': ANOMALY_MISSING_INTERNAL,
+                'description': f'MPR transaction {mpr_txn_id} has no matching internal record'
+            })
+            results.anomalies += 1
+            self._maybe_flush(results)
+            return
+
+        match = {
+            'mpr_id': mpr_id,
+            'internal_id': internal[0],
+            'match_type': match_type,
+            'confidence': 1.0 if match_type == 'EXACT_ID' else 0.8
+        }
+        self._buffer['matches'].append(match)
+
+        bank_match_type = 'UTR'
+        bank = bank_window.match_key(mpr_utr) or undated_bank.match_key(mpr_utr)
+        if bank is None:
+            bank_match_type = 'AMOUNT'
+            bank = (bank_window.match_amount(mpr_amount, when)
+                    or undated_bank.match_amount(mpr_amount, when))
+
+        if bank is None:
+            results.pending += 1
+        else:
+            self._buffer['bank_matches'].append({
+                'mpr_id': mpr_id,
+                'internal_id': internal[0],
+                'bank_id': bank[0],
+                'match_type': bank_match_type,
+                'confidence': 1.0 if bank_match_type == 'UTR' else 0.7
+            })
+            results.matched += 1
+
+        self._maybe_flush(results)
+
+    def _buffer_missing_mpr(self, internal, results):
+        self._buffer['anomalies'].append({
+            'mpr_id': None,
+            'internal_id': internal[0],
+            'bank_id': None,
+            'anomaly_type': ANOMALY_MISSING_MPR,
+            'description': f'Internal transaction {internal[1]} has no matching MPR record'
+        })
+        results.anomalies += 1
+        self._maybe_flush(results)
+
+    def _reset_buffer(self):
+        self._buffer = {'matches': [], 'bank_matches': [], 'anomalies': []}
+
+    def _maybe_flush(self, results):
+        if len(self._buffer['matches']) + len(self._buffer['anomalies']) >= RECON_STREAM_CHUNK_SIZE:
+            self._flush(results)
+
+    def _flush(self, results):
+        """Write the buffered chunk of results and start a new one; raises if the write fails."""
+        if self._buffer['matches'] or self._buffer['anomalies']:
+            with self.profile.stage('write'):
+                self._create_reconciliation_results(
+                    self._buffer['matches'], self._buffer['bank_matches'], self._buffer['anomalies']
+                )
+        self._reset_buffer()
+
+    def _stream_mpr(self, date_filter, high_mark=None, dated=True):
+        query = """
+            SELECT m.id, m.transaction_id, m.amount, m.transaction_time, m.utr
+            FROM mpr_transactions m
+            JOIN mpr_uploads u ON m.upload_id = u.id
+            WHERE u.status = 'COMPLETED' AND m.is_duplicate = 0
+        """
+        return self._stream_source(query, 'm.transaction_time', 'm.id', date_filter, high_mark,
+                                   dated)
+
+    def _stream_internal(self, date_filter, high_mark=None, dated=True):
+        query = """
+            SELECT i.id, i.transaction_id, i.amount, i.transaction_time
+            FROM internal_transactions i
+            JOIN internal_uploads u ON i.upload_id = u.id
+            WHERE u.status = 'COMPLETED'
+        """
+        return self._stream_source(query, 'i.transaction_time', 'i.id', date_filter, high_mark,
+                                   dated)
+
+    def _stream_bank_credits(self, date_filter, high_mark=None, dated=True):
+        query = """
+            SELECT b.id, b.amount, b.utr, b.transaction_date, b.description
+            FROM bank_transactions b
+            JOIN bank_statement_uploads u ON b.upload_id = u.id
+            WHERE u.status = 'COMPLETED' AND b.amount > 0
+        """
+        return self._stream_source(query, 'b.transaction_date', 'b.id', date_filter,
+                                   high_mark, dated)
+
+    def _stream_source(self, query, time_column, id_column, date_filter, high_mark, dated):
+        """Build the time-ordered query for one source and stream it."""
+        params = []
+        if dated:
+            query += f" AND {time_column} IS NOT NULL"
+        else:
+            query += f" AND {time_column} IS NULL"
+        if date_filter:
+            query += f" AND {time_column} >= ? AND {time_column} < ?"
+            params.extend(day_range(date_filter, date_filter))
+        if high_mark is not None:
+            query += " AND u.id <= ?"
+            params.append(high_mark)
+        query += f" ORDER BY {time_column}, {id_column}"
+        return self._stream_rows(query, params)
+
+    def _stream_rows(self, query, params):
+        """Yield rows from a forward-only cursor, fetching one chunk at a time."""
+        return stream_query(query, params, batch_size=RECON_STREAM_CHUNK_SIZE)
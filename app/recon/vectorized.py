@@ -0,0 +1,334 @@
+"""
+Columnar (pandas/NumPy) reconciliation backend.
+"""
+from operator import itemgetter
+import numpy as np
+import pandas as pd
+from config.constants import RECON_BACKEND_VECTORIZED
+from app.recon.models import ReconciliationEngine
+from app.recon.matching import parse_transaction_time, to_paise
+
+# Column name -> tuple position for the fields each pass actually reads
+MPR_COLUMNS = {'id': 0, 'transaction_id': 1, 'amount': 2, 'transaction_time': 3}
+INTERNAL_COLUMNS = {'id': 0, 'transaction_id': 1, 'amount': 2, 'transaction_time': 3}
+BANK_COLUMNS = {'id': 0, 'amount': 1, 'utr': 2}
+EXISTING_MATCH_COLUMNS = {'mpr_id': 0, 'internal_id': 1, 'amount': 2, 'utr': 3}
+
+DAY_NS = 86400 * 10**9
+
+# Once a proposal round settles less than this share of the rows still open,
+# the few contested rows left are resolved with a plain sweep
+SWEEP_BELOW_SHARE = 0.25
+
+def _codes(*columns):
+    """Shared integer codes of the columns' values; empty and missing values get -1."""
+    values = pd.concat([pd.Series(column, dtype=object) for column in columns],
+                       ignore_index=True)
+    codes, _ = pd.factorize(values.where(values.notna() & (values != ''), None))
+    bounds = np.cumsum([0] + [len(column) for column in columns])
+    return [codes[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+
+def _amounts(rows, index):
+    """Amount column as floats; missing amounts become NaN."""
+    try:
+        return np.fromiter(map(itemgetter(index), rows), dtype=float, count=len(rows))
+    except TypeError:
+        return np.array([row[index] for row in rows], dtype=float)
+
+def _paise(amounts):
+    return np.rint(np.nan_to_num(amounts) * 100).astype(np.int64)
+
+def _times(values):
+    """Transaction times as naive-UTC nanoseconds, with a mask of the usable ones."""
+    column = pd.Series(values, dtype=object)
+    parsed = pd.to_datetime(column, format='ISO8601', utc=True, errors='coerce')
+    parsed = parsed.dt.tz_localize(None).dt.as_unit('ns')
+    dated = parsed.notna().to_numpy()
+    nanoseconds = parsed.to_numpy().view(np.int64).copy()
+
+    # Anything pandas could not read goes through the row engine's parser
+    for position in np.flatnonzero(~dated & column.notna().to_numpy() & (column != '').to_numpy()):
+        when = parse_transaction_time(values[position])
+        if when is not None:
+            nanoseconds[position] = pd.Timestamp(when).as_unit('ns').value
+            dated[position] = True
+    return nanoseconds, dated
+
+def _serial_pairs(left, right, rank):
+    """
+    Resolve candidate pairs the way a greedy pass in load order would.
+
+    Each left row takes the lowest-ranked right row still free. In a round
+    every open left row proposes its favourite; the proposal is final when
+    no earlier open left row can reach that right row, since only such a row
+    could take it first. The earliest open row always wins, so every round
+    settles at least one row. Returns the (left, right, rank) of each pair,
+    in left order.
+    """
+    order = np.lexsort((rank, left))
+    left, right, rank = left[order], right[order], rank[order]
+    settled = []
+
+    while len(left):
+        favourite = np.ones(len(left), dtype=bool)
+        favourite[1:] = left[1:] != left[:-1]
+        # Edges are in left order, so each right row's first edge is from its earliest reacher
+        earliest = np.zeros(len(left), dtype=bool)
+        earliest[np.unique(right, return_index=True)[1]] = True
+        won = favourite & earliest
+        settled.append((left[won], right[won], rank[won]))
+
+        if won.sum() < SWEEP_BELOW_SHARE * favourite.sum():
+            settled.append(_sweep(left, right, rank, won))
+            break
+
+        open_edges = ~np.isin(left, left[won]) & ~np.isin(right, right[won])
+        left, right, rank = left[open_edges], right[open_edges], rank[open_edges]
+
+    if not settled:
+        empty = np.array([], dtype=np.int64)
+        return empty, empty, empty
+    left, right, rank = (np.concatenate(parts) for parts in zip(*settled))
+    order = np.argsort(left, kind='stable')
+    return left[order], right[order], rank[order]
+
+def _sweep(left, right, rank, won):
+    """Greedy pass over the contested edges left after the last round's winners."""
+    taken = set(right[won].tolist())
+    decided = set(left[won].tolist())
+    pairs = ([], [], [])
+    for row, candidate, preference in zip(left.tolist(), right.tolist(), rank.tolist()):
+        if row in decided or candidate in taken:
+            continue
+        decided.add(row)
+        taken.add(candidate)
+        for part, value in zip(pairs, (row, candidate, preference)):
+            part.append(value)
+    return tuple(np.array(part, dtype=np.int64) for part in pairs)
+
+class VectorizedReconciliationEngine(ReconciliationEngine):
+    """
+    Reconciliation engine that runs its joins on DataFrames.
+
+    Candidate pairs come from merges: on transaction ID for the exact pass,
+    on (amount in paise, day) cells for the AMOUNT_DATE pass and on UTR and
+    amount for the bank pass, after a merge_asof on amount drops rows with
+    no counterpart inside the tolerance. The greedy, load-order choice among
+    the candidates is then made in vectorized rounds, so results are
+    identical to the row-at-a-time engine.
+    """
+    backend = RECON_BACKEND_VECTORIZED
+
+    def _frame(self, rows, columns):
+        """Build a DataFrame of the selected columns, read straight off the fetched rows."""
+        return pd.DataFrame({
+            name: (_amounts(rows, index) if name == 'amount'
+                   else pd.Series(np.fromiter(map(itemgetter(index), rows), dtype=object,
+                                              count=len(rows)), dtype=object))
+            for name, index in columns.items()
+        })
+
+    def _pair_mpr_with_internal(self, mpr_transactions, internal_transactions):
+        """Pair MPR rows with internal rows by exact ID, then by amount and date."""
+        if not mpr_transactions or not internal_transactions:
+            return []
+
+        with self.profile.stage('exact'):
+            mpr = self._frame(mpr_transactions, MPR_COLUMNS)
+            internal = self._frame(internal_transactions, INTERNAL_COLUMNS)
+            exact_mpr, exact_internal = self._exact_id_pairs(mpr, internal)
+        self.profile.count('exact', 'matches', len(exact_mpr))
+
+        matches = self._match_dicts(mpr, internal, exact_mpr, exact_internal, 'EXACT_ID', 1.0)
+
+        with self.profile.stage('fuzzy'):
+            open_mpr = np.ones(len(mpr), dtype=bool)
+            open_mpr[exact_mpr] = False
+            open_mpr = np.flatnonzero(open_mpr)
+            open_internal = np.ones(len(internal), dtype=bool)
+            open_internal[exact_internal] = False
+            open_internal = np.flatnonzero(open_internal)
+            fuzzy_mpr, fuzzy_internal = self._amount_date_pairs(
+                mpr.iloc[open_mpr], internal.iloc[open_internal])
+            matches.extend(self._match_dicts(mpr, internal, open_mpr[fuzzy_mpr],
+                                             open_internal[fuzzy_internal], 'AMOUNT_DATE', 0.8))
+        self.profile.count('fuzzy', 'matches', len(fuzzy_mpr))
+
+        return matches
+
+    def _match_dicts(self, mpr, internal, mpr_positions, internal_positions, match_type,
+                     confidence):
+        return [
+            {
+                'mpr_id': mpr_id,
+                'internal_id': int_id,
+                'match_type': match_type,
+                'confidence': confidence
+            }
+            for mpr_id, int_id in zip(mpr['id'].to_numpy()[mpr_positions].tolist(),
+                                      internal['id'].to_numpy()[internal_positions].tolist())
+        ]
+
+    def _exact_id_pairs(self, mpr, internal):
+        """EXACT_ID pairs: a merge on transaction ID, each MPR row preferring the earliest row."""
+        mpr_codes, internal_codes = _codes(mpr['transaction_id'], internal['transaction_id'])
+        left = pd.DataFrame({'left': np.arange(len(mpr)), 'code': mpr_codes})
+        right = pd.DataFrame({'right': np.arange(len(internal)), 'code': internal_codes})
+        pairs = left[left['code'] >= 0].merge(right[right['code'] >= 0], on='code')
+
+        left, right = pairs['left'].to_numpy(), pairs['right'].to_numpy()
+        close = (np.abs(mpr['amount'].to_numpy()[left] - internal['amount'].to_numpy()[right])
+                 <= self.match_tolerance)
+        left, right, _ = _serial_pairs(left[close], right[close], right[close])
+        return left, right
+
+    def _amount_date_pairs(self, mpr, internal):
+        """
+        AMOUNT_DATE pairs among the rows the exact pass left open.
+
+        Candidates are merged in by (paise, day) cell: dated rows within the
+        paise span and DATE_TOLERANCE_DAYS + 1 calendar days of each other,
+        undated rows by paise alone. The exact amount and date checks then
+        run on the merged pairs. Returns positions into the given frames.
+        """
+        span = to_paise(self.match_tolerance) + 1
+        reach = self.date_tolerance_days + 1
+        mpr_amounts, internal_amounts = mpr['amount'].to_numpy(), internal['amount'].to_numpy()
+        mpr_paise, internal_paise = _paise(mpr_amounts), _paise(internal_amounts)
+
+        probes = np.flatnonzero(self._within_reach(mpr_paise, internal_paise))
+        candidates = np.flatnonzero(self._within_reach(internal_paise, mpr_paise[probes]))
+        mpr_amounts, mpr_paise = mpr_amounts[probes], mpr_paise[probes]
+        internal_amounts, internal_paise = internal_amounts[candidates], internal_paise[candidates]
+        mpr_times, mpr_dated = _times(mpr['transaction_time'].to_numpy()[probes])
+        internal_times, internal_dated = _times(internal['transaction_time'].to_numpy()[candidates])
+        mpr_days, internal_days = mpr_times // DAY_NS, internal_times // DAY_NS
+
+        # Cell key: paise * stride + day index, every offset day index staying
+        # inside [0, stride) and dated candidates clear of index 0 (undated)
+        days = np.concatenate([mpr_days[mpr_dated], internal_days[internal_dated]])
+        first_day = (days.min() if len(days) else 0) - reach
+        stride = (days.max() if len(days) else 0) - first_day + reach + 1
+        mpr_cells = np.where(mpr_dated, mpr_days - first_day, 0)
+        internal_keys = internal_paise * stride + np.where(internal_dated,
+                                                           internal_days - first_day, 0)
+
+        def probe_keys(positions, cells, day_offsets):
+            """Every key a group of probes reaches, as (left, key) rows."""
+            keys = [(mpr_paise[positions] + paise_offset) * stride + cells + day_offset
+                    for paise_offset in range(-span, span + 1) for day_offset in day_offsets]
+            return pd.DataFrame({'left': np.tile(positions, len(keys)),
+                                 'key': np.concatenate(keys)})
+
+        def candidate_keys(positions, keys):
+            return pd.DataFrame({'right': positions, 'key': keys[positions]})
+
+        dated_mpr, undated_mpr = np.flatnonzero(mpr_dated), np.flatnonzero(~mpr_dated)
+        dated_internal = np.flatnonzero(internal_dated)
+        undated_internal = np.flatnonzero(~internal_dated)
+        merges = [
+            # Dated probes reach dated candidates inside the window...
+            (probe_keys(dated_mpr, mpr_cells[dated_mpr], range(-reach, reach + 1)),
+             candidate_keys(dated_internal, internal_keys)),
+            # ...every probe reaches undated candidates...
+            (probe_keys(np.arange(len(probes)), 0, [0]),
+             candidate_keys(undated_internal, internal_keys)),
+            # ...and undated probes reach dated candidates on any day
+            (probe_keys(undated_mpr, 0, [0]),
+             candidate_keys(dated_internal, internal_paise * stride)),
+        ]
+        pairs = [probe_frame.merge(candidate_frame, on='key')
+                 for probe_frame, candidate_frame in merges]
+        left = np.concatenate([pair['left'].to_numpy() for pair in pairs]).astype(np.int64)
+        right = np.concatenate([pair['right'].to_numpy() for pair in pairs]).astype(np.int64)
+
+        eligible = np.abs(mpr_amounts[left] - internal_amounts[right]) <= self.match_tolerance
+        both_dated = mpr_dated[left] & internal_dated[right]
+        eligible &= ~both_dated | (np.abs((mpr_times[left] - internal_times[right]) // DAY_NS)
+                                   <= self.date_tolerance_days)
+        self.profile.count('fuzzy', 'candidate_pairs', int(eligible.sum()))
+
+        # Each MPR row prefers the internal row loaded first
+        left, right, _ = _serial_pairs(left[eligible], right[eligible], right[eligible])
+        return probes[left], candidates[right]
+
+    def _within_reach(self, probe_paise, candidate_paise):
+        """Mask of probes with a candidate inside the paise span, found with merge_asof."""
+        if not len(candidate_paise) or not len(probe_paise):
+            return np.zeros(len(probe_paise), dtype=bool)
+
+        span = to_paise(self.match_tolerance) + 1
+        probes = pd.DataFrame({'paise': probe_paise, 'position': np.arange(len(probe_paise))})
+        candidates = pd.DataFrame({'paise': np.unique(candidate_paise)})
+        candidates['nearest'] = candidates['paise']
+        nearest = pd.merge_asof(probes.sort_values('paise'), candidates, on='paise',
+                                direction='nearest', tolerance=span)
+
+        reachable = np.zeros(len(probe_paise), dtype=bool)
+        reachable[nearest['position'].to_numpy()] = nearest['nearest'].notna().to_numpy()
+        return reachable
+
+    def _pair_with_bank(self, existing_matches, bank_transactions):
+        """
+        Attach a bank credit to each existing match, UTR first, then amount.
+
+        UTR candidates come from a merge on UTR and amount candidates from a
+        merge on paise; a match prefers any UTR credit to an amount credit,
+        and the earlier credit within each.
+        """
+        if not existing_matches or not bank_transactions:
+            return []
+
+        matches = self._frame(existing_matches, EXISTING_MATCH_COLUMNS)
+        bank = self._frame(bank_transactions, BANK_COLUMNS)
+        span = to_paise(self.match_tolerance) + 1
+
+        match_utrs, bank_utrs = _codes(matches['utr'], bank['utr'])
+        utr_pairs = pd.DataFrame({'left': np.flatnonzero(match_utrs >= 0),
+                                  'key': match_utrs[match_utrs >= 0]}).merge(
+            pd.DataFrame({'right': np.flatnonzero(bank_utrs >= 0),
+                          'key': bank_utrs[bank_utrs >= 0]}), on='key')
+
+        match_amounts, bank_amounts = matches['amount'].to_numpy(), bank['amount'].to_numpy()
+        match_paise, bank_paise = _paise(match_amounts), _paise(bank_amounts)
+        probes = np.flatnonzero(~np.isnan(match_amounts)
+                                & self._within_reach(match_paise, bank_paise))
+        amount_pairs = pd.DataFrame({
+            'left': np.tile(probes, 2 * span + 1),
+            'key': np.concatenate([match_paise[probes] + offset
+                                   for offset in range(-span, span + 1)]),
+        }).merge(pd.DataFrame({'right': np.arange(len(bank)), 'key': bank_paise}), on='key')
+        amount_pairs = amount_pairs[
+            np.abs(match_amounts[amount_pairs['left'].to_numpy()]
+                   - bank_amounts[amount_pairs['right'].to_numpy()]) <= self.match_tolerance]
+
+        # Any UTR credit ranks before every amount credit; a credit reachable
+        # both ways keeps its UTR rank
+        left = np.concatenate([utr_pairs['left'].to_numpy(), amount_pairs['left'].to_numpy()])
+        right = np.concatenate([utr_pairs['right'].to_numpy(), amount_pairs['right'].to_numpy()])
+        rank = np.concatenate([utr_pairs['right'].to_numpy(),
+                               len(bank) + amount_pairs['right'].to_numpy()])
+        order = np.lexsort((rank, right, left))
+        left, right, rank = left[order], right[order], rank[order]
+        first = np.ones(len(left), dtype=bool)
+        first[1:] = (left[1:] != left[:-1]) | (right[1:] != right[:-1])
+        self.profile.count('bank', 'candidate_pairs', int(first.sum()))
+
+        left, right, rank = _serial_pairs(left[first].astype(np.int64),
+                                          right[first].astype(np.int64),
+                                          rank[first].astype(np.int64))
+        self.profile.count('bank', 'matches', len(left))
+        return [
+            {
+                'mpr_id': mpr_id,
+                'internal_id': internal_id,
+                'bank_id': bank_id,
+                'match_type': 'UTR' if by_utr else 'AMOUNT',
+                'confidence': 1.0 if by_utr else 0.7
+            }
+            for mpr_id, internal_id, bank_id, by_utr in zip(
+                matches['mpr_id'].to_numpy()[left].tolist(),
+                matches['internal_id'].to_numpy()[left].tolist(),
+                bank['id'].to_numpy()[right].tolist(),
+                (rank < len(bank)).tolist())
+        ]
@@ -0,0 +1,154 @@
+"""
+Row-level fingerprints for spotting MPR transactions that were already loaded.
+
+Each MPR row is reduced to a 16-byte hash of its channel, transaction ID,
+amount and UTR, stored with the row. The first row with a fingerprint is the
+original; later ones are stored flagged as duplicates, which reconciliation
+reports as DUPLICATE anomalies instead of matching them again.
+
+An in-process Bloom filter of the stored originals answers "new" for most
+rows, so only possible duplicates are looked up in the database. The filter
+can miss rows other processes stored, so its answers are checked by the
+unique index on original fingerprints when rows are inserted.
+"""
+import hashlib
+import math
+import threading
+import numpy as np
+import pandas as pd
+from config.settings import Config
+from config.database import execute_query, stream_query
+
+FINGERPRINT_BYTES = 16
+
+# Fingerprints per lookup query, well under SQL Server's parameter limit
+LOOKUP_BATCH_SIZE = 500
+
+def transaction_fingerprints(channel_id, transactions):
+    """Fingerprint of each mapped MPR row: channel, transaction ID, amount and UTR."""
+    def text(column):
+        if column not in transactions:
+            return pd.Series('', index=transactions.index)
+        return transactions[column].fillna('').astype(str)
+
+    amounts = transactions['amount'].map('{:.2f}'.format)
+    keys = f'{channel_id}|' + text('transaction_id') + '|' + amounts + '|' + text('utr')
+    return keys.map(lambda key: hashlib.blake2b(key.encode('utf-8'),
+                                                digest_size=FINGERPRINT_BYTES).digest())
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over fingerprints.
+
+    Fingerprints are already uniform hashes, so the bit positions are derived
+    from their two 64-bit halves by double hashing instead of rehashing.
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        self.bits = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self._array = np.zeros((self.bits + 7) // 8, dtype=np.uint8)
+
+    def _positions(self, fingerprints):
+        halves = np.frombuffer(b''.join(fingerprints), dtype='<u8').reshape(-1, 2)
+        steps = np.arange(self.hashes, dtype=np.uint64)
+        with np.errstate(over='ignore'):
+            return (halves[:, :1] + steps * halves[:, 1:]) % np.uint64(self.bits)
+
+    def add(self, fingerprints):
+        if len(fingerprints):
+            positions = self._positions(fingerprints).ravel()
+            np.bitwise_or.at(self._array, positions >> np.uint64(3),
+                             (1 << (positions & np.uint64(7))).astype(np.uint8))
+
+    def might_contain(self, fingerprints):
+        """Boolean array: False means the fingerprint was certainly never added."""
+        if not len(fingerprints):
+            return np.zeros(0, dtype=bool)
+        positions = self._positions(fingerprints)
+        bits = self._array[positions >> np.uint64(3)] >> (positions & np.uint64(7)).astype(np.uint8)
+        return (bits & 1).all(axis=1)
+
+class FingerprintIndex:
+    """
+    Stored MPR fingerprints, with a Bloom filter in front of the database.
+
+    The filter is loaded from committed rows by `refresh`, which reads on its
+    own connection and so must run before an upload's transaction opens: on
+    SQL Server it would otherwise wait on the rows that upload has inserted.
+    Refreshing by id misses rows other uploads commit out of id order, so a
+    "new" answer can be wrong; the unique index on original fingerprints then
+    rejects the insert, and the caller checks again with `verify`.
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        self.bloom = BloomFilter(capacity, error_rate)
+        self.last_id = 0
+        self.lookups = 0
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """Add originals stored since the last refresh to the filter."""
+        query = """
+            SELECT id, fingerprint FROM mpr_transactions
+            WHERE id > ? AND fingerprint IS NOT NULL AND is_duplicate = 0
+            ORDER BY id
+        """
+        with self._lock:
+            batch = []
+            for row_id, fingerprint in stream_query(query, (self.last_id,), row_factory=tuple):
+                batch.append(bytes(fingerprint))
+                self.last_id = row_id
+                if len(batch) >= LOOKUP_BATCH_SIZE * 10:
+                    self.bloom.add(batch)
+                    batch = []
+            self.bloom.add(batch)
+
+    def existing(self, fingerprints, verify=False):
+        """
+        The given fingerprints that already belong to a stored original.
+        
+        Only those the filter may contain are looked up, unless `verify` is
+        set, when every fingerprint is looked up in the database.
+        """
+        if verify:
+            candidates = list(fingerprints)
+        else:
+            with self._lock:
+                candidates = [fp for fp, maybe in
+                              zip(fingerprints, self.bloom.might_contain(fingerprints)) if maybe]
+
+        found = set()
+        for start in range(0, len(candidates), LOOKUP_BATCH_SIZE):
+            batch = candidates[start:start + LOOKUP_BATCH_SIZE]
+            query = f"""
+                SELECT fingerprint FROM mpr_transactions
+                WHERE is_duplicate = 0 AND fingerprint IN ({', '.join('?' * len(batch))})
+            """
+            # Joins the caller's transaction, so earlier chunks of the same upload count
+            found.update(bytes(row[0]) for row in execute_query(query, tuple(batch), fetch='all') or [])
+            self.lookups += 1
+        return found
+
+    def add(self, fingerprints):
+        """Record newly stored originals."""
+        with self._lock:
+            self.bloom.add(list(fingerprints))
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_fingerprint_index():
+    """Return the process-wide fingerprint index, created on first use."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = FingerprintIndex(Config.UPLOAD_DEDUPE_CAPACITY,
+                                      Config.UPLOAD_DEDUPE_ERROR_RATE)
+        return _index
+
+def reset_fingerprint_index():
+    """Forget the filter; it is reloaded from the database on next use."""
+    global _index
+    with _index_lock:
+        _index = None
@@ -0,0 +1,170 @@
+"""
+Background ingestion of uploaded files.
+
+Upload routes save the file and queue an ingest job; a thread pool in this
+process parses and stores it while the job records its progress for the
+status API. Jobs are kept in memory, so they are only visible to the process
+that ran them and are forgotten on restart; the upload tables remain the
+record of what was stored.
+"""
+import logging
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from config.settings import Config
+from config.constants import (
+    LOG_UPLOAD, INGEST_JOB_QUEUED, INGEST_JOB_RUNNING,
+    INGEST_JOB_COMPLETED, INGEST_JOB_FAILED
+)
+
+class IngestJob:
+    """Progress of one queued upload; updated by the worker, read by the status API."""
+
+    def __init__(self, kind, filename):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.filename = filename
+        self.status = INGEST_JOB_QUEUED
+        self.rows_parsed = 0
+        self.rows_inserted = 0
+        self.errors = []
+        self.upload_id = None
+        self.message = None
+        self.created_at = datetime.now()
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def parsed(self, rows):
+        """Count rows read from the file."""
+        with self._lock:
+            self.rows_parsed += rows
+
+    def inserted(self, rows):
+        """Count rows written to the upload's transaction table."""
+        with self._lock:
+            self.rows_inserted += rows
+
+    def restart(self):
+        """Forget the row counts before the file is read again."""
+        with self._lock:
+            self.rows_parsed = 0
+            self.rows_inserted = 0
+
+    def start(self):
+        with self._lock:
+            self.status = INGEST_JOB_RUNNING
+            self.started_at = datetime.now()
+
+    def finish(self, upload_id, message):
+        """Record the processor's result: an upload id on success, else the error."""
+        with self._lock:
+            self.upload_id = upload_id
+            self.message = message
+            if upload_id:
+                self.status = INGEST_JOB_COMPLETED
+            else:
+                self.status = INGEST_JOB_FAILED
+                self.errors.append(message)
+            self.finished_at = datetime.now()
+
+    @property
+    def finished(self):
+        return self.status in (INGEST_JOB_COMPLETED, INGEST_JOB_FAILED)
+
+    def to_dict(self):
+        with self._lock:
+            elapsed = ((self.finished_at or datetime.now()) - self.started_at).total_seconds() \
+                if self.started_at else 0
+            return {
+                'id': self.id,
+                'kind': self.kind,
+                'filename': self.filename,
+                'status': self.status,
+                'rows_parsed': self.rows_parsed,
+                'rows_inserted': self.rows_inserted,
+                'rows_per_second': round(self.rows_inserted / elapsed, 1) if elapsed > 0 else None,
+                'errors': list(self.errors),
+                'upload_id': self.upload_id,
+                'message': self.message,
+                'created_at': self.created_at.isoformat(),
+                'started_at': self.started_at.isoformat() if self.started_at else None,
+                'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            }
+
+class IngestQueue:
+    """A worker pool running ingest jobs, and the registry the status API reads."""
+
+    def __init__(self, workers, history=200):
+        self.history = history
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers),
+                                            thread_name_prefix='ingest')
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, kind, filename, ingest):
+        """
+        Queue `ingest(job)` for a saved file and return its job at once.
+
+        `ingest` is a processor's ingest method bound to the file; it returns
+        (upload_id, message) like the synchronous upload path.
+        """
+        job = IngestJob(kind, filename)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._forget_finished()
+        self._executor.submit(self._run, job, ingest)
+
+        logging.info(f"Ingest job {job.id} queued for {filename}",
+                    extra={'category': LOG_UPLOAD})
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def _run(self, job, ingest):
+        job.start()
+        try:
+            upload_id, message = ingest(job)
+        except Exception as e:
+            upload_id, message = None, f"Processing error: {str(e)}"
+        job.finish(upload_id, message)
+
+        if upload_id:
+            logging.info(f"Ingest job {job.id} completed: upload {upload_id}, "
+                        f"{job.rows_inserted} of {job.rows_parsed} rows stored",
+                        extra={'category': LOG_UPLOAD})
+        else:
+            logging.error(f"Ingest job {job.id} failed: {message}",
+                         extra={'category': LOG_UPLOAD})
+
+    def _forget_finished(self):
+        # Oldest finished jobs are dropped first; queued and running jobs are kept
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.history)]:
+            del self._jobs[job_id]
+
+_queue = None
+_queue_lock = threading.Lock()
+
+def get_ingest_queue():
+    """Return the process-wide ingest queue, starting its workers on first use."""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = IngestQueue(Config.UPLOAD_WORKERS, history=Config.UPLOAD_JOB_HISTORY)
+        return _queue
+
+def reset_ingest_queue(wait=True):
+    """Stop the ingest workers (after queued jobs, by default) and forget all jobs."""
+    global _queue
+    with _queue_lock:
+        queue, _queue = _queue, None
+    if queue is not None:
+        queue.shutdown(wait=wait)
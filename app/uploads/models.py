@@ -2,18 +2,196 @@
 Upload models and utilities.
 """
 import os
+import hashlib
+import numpy as np
+import openpyxl
 import pandas as pd
+from pandas.tseries.api import guess_datetime_format
 import logging
+import time
+import warnings
 from datetime import datetime
 from werkzeug.utils import secure_filename
-from config.database import execute_query
+from config.settings import Config
+from config.database import execute_query, execute_insert, execute_many, get_dialect, transaction
 from config.constants import (
-    LOG_UPLOAD, ALLOWED_EXTENSIONS, MAX_FILE_SIZE,
-    FILE_FORMAT_CSV, FILE_FORMAT_EXCEL
+    LOG_UPLOAD, ALLOWED_EXTENSIONS, MAX_FILE_SIZE, UPLOAD_CHUNK_SIZE,
+    FILE_FORMAT_CSV, FILE_FORMAT_EXCEL,
+    UPLOAD_KIND_MPR, UPLOAD_KIND_INTERNAL, UPLOAD_KIND_BANK
 )
 from app.config.models import ChannelConfig
+from app.uploads.fingerprints import transaction_fingerprints, get_fingerprint_index
+
+class UploadError(Exception):
+    """An upload step failed; the message is shown to the user."""
+
+class DuplicateUploadError(UploadError):
+    """Another upload of the same file content was stored while this one was processed."""
+
+class FingerprintConflictError(UploadError):
+    """An MPR row taken as new matched an original another upload had stored."""
+
+def _text_column(values):
+    """Column of str values, None where the source is missing."""
+    text = pd.Series(None, index=values.index, dtype=object)
+    present = values.notna()
+    text[present] = values[present].astype(str)
+    return text
+
+def _amount_column(values):
+    """Column of float amounts, NaN where missing or not a number."""
+    return pd.to_numeric(values, errors='coerce').astype(float)
+
+def _iso_timestamps(parsed):
+    """ISO-8601 text for parsed datetimes, as Timestamp.isoformat writes it."""
+    if getattr(parsed.dt, 'tz', None) is not None:
+        return parsed.map(pd.Timestamp.isoformat)
+    seconds = parsed.values.astype('datetime64[s]')
+    text = pd.Series(np.datetime_as_string(seconds, unit='s'), index=parsed.index, dtype=object)
+    fractional = parsed.values != seconds.astype(parsed.values.dtype)
+    if fractional.any():
+        text[fractional] = parsed[fractional].map(pd.Timestamp.isoformat)
+    return text
+
+class _DateFormat:
+    """
+    How one file writes a date/time column: decided from the first chunk with
+    parseable text and reused for every later chunk, so a value such as
+    05-01-2024 is read the same way throughout the file.
+    """
+
+    def __init__(self):
+        self.dayfirst = None
+        self.format = None
+
+    @property
+    def decided(self):
+        return self.dayfirst is not None
+
+    def decide(self, text, parsed, dayfirst):
+        """Fix the reading from a parsed chunk, if any of its values parsed."""
+        sample = text[parsed.notna()]
+        if len(sample):
+            self.dayfirst = dayfirst
+            self.format = guess_datetime_format(sample.iloc[0], dayfirst=dayfirst)
+
+def _parse_datetime(value, dayfirst=False):
+    """ISO-8601 text for one date/time value, or the value itself as text."""
+    try:
+        if isinstance(value, str):
+            return pd.to_datetime(value, dayfirst=dayfirst).isoformat()
+        return value.isoformat() if hasattr(value, 'isoformat') else str(value)
+    except (ValueError, TypeError, OverflowError):
+        return str(value)
+
+def _parse_datetime_text(text, date_format=None):
+    """
+    Parse a column of date/time text with one format, NaT where it fails.
+
+    When the month-first reading leaves rows unparsed (e.g. 25-01-2024), the
+    day-first reading is used instead if it parses more of the column. Given
+    a `date_format`, the first chunk decides the reading and later chunks
+    are parsed with it.
+    """
+    empty = pd.Series(pd.NaT, index=text.index, dtype='datetime64[ns]')
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', UserWarning)
+        try:
+            if date_format is not None and date_format.decided:
+                if date_format.format:
+                    return pd.to_datetime(text, format=date_format.format, errors='coerce')
+                return pd.to_datetime(text, errors='coerce', dayfirst=date_format.dayfirst)
+            
+            parsed = pd.to_datetime(text, errors='coerce')
+            dayfirst = False
+            if parsed.isna().any():
+                day_first = pd.to_datetime(text, errors='coerce', dayfirst=True)
+                if day_first.notna().sum() > parsed.notna().sum():
+                    parsed, dayfirst = day_first, True
+            if date_format is not None:
+                date_format.decide(text, parsed, dayfirst)
+                if date_format.format:
+                    # The first chunk is read exactly as the later ones will be
+                    parsed = pd.to_datetime(text, format=date_format.format, errors='coerce')
+            return parsed
+        except (ValueError, TypeError):
+            # e.g. mixed UTC offsets, which cannot share one column
+            return empty
+
+def _datetime_column(values, date_format=None):
+    """
+    Column of ISO-8601 datetimes, None where missing.
+
+    Text is parsed in one pass with the format pandas infers for the column,
+    or the file's `date_format` when one is given; rows in any other format
+    fall back to being parsed one at a time, in the same day order.
+    """
+    result = pd.Series(None, index=values.index, dtype=object)
+    present = values[values.notna()]
+    if present.empty:
+        return result
+    
+    if pd.api.types.is_datetime64_any_dtype(present):
+        result[present.index] = _iso_timestamps(present)
+        return result
+    
+    is_text = present.map(lambda value: isinstance(value, str)).astype(bool)
+    text = present[is_text]
+    parsed = _parse_datetime_text(text, date_format)
+    dayfirst = bool(date_format is not None and date_format.dayfirst)
+    
+    valid = parsed.notna()
+    result[text.index[valid]] = _iso_timestamps(parsed[valid])
+    result[text.index[~valid]] = text[~valid].map(lambda value: _parse_datetime(value, dayfirst))
+    
+    other = present[~is_text]
+    result[other.index] = other.map(_parse_datetime)
+    return result
+
+def _mapped_columns(field_mappings):
+    """
+    The file columns a channel's field_mappings use, and the types to read them as.
+    
+    Identifier and time columns are read as text, so leading zeros survive and
+    times reach _datetime_column unconverted; the amount column is left to the
+    parser's numeric conversion.
+    """
+    columns = [column for column in field_mappings.values() if column]
+    dtypes = {column: str for field, column in field_mappings.items()
+              if column and field != 'amount'}
+    return columns, dtypes
+
+# Internal and bank files have fixed column names; identifiers and times are
+# read as text, as _mapped_columns reads a channel's, so leading zeros survive
+# in every chunk, not just the ones that happen to contain a letter
+_INTERNAL_DTYPES = {'transaction_id': str, 'reference_id': str, 'transaction_time': str}
+_BANK_DTYPES = {'utr': str, 'description': str, 'transaction_date': str}
+
+def _batch_rows(upload_id, transactions, columns):
+    """Insert parameters for a frame of transactions, built column by column."""
+    if not isinstance(transactions, pd.DataFrame):
+        transactions = pd.DataFrame(list(transactions))
+    values = []
+    for column in columns:
+        if column in transactions.columns:
+            # Missing values are bound as NULL, never as NaN
+            data = transactions[column]
+            values.append(data.astype(object).where(data.notna(), None).tolist())
+        else:
+            values.append([None] * len(transactions))
+    return list(zip([upload_id] * len(transactions), *values))
+
+def _bulk_insert(query, rows, types):
+    """Insert rows in DB_INSERT_BATCH_SIZE batches and return the rows per second."""
+    started = time.perf_counter()
+    # Joins the caller's transaction, if one is active
+    execute_many([(query, rows, types)], batch_size=Config.DB_INSERT_BATCH_SIZE)
+    elapsed = time.perf_counter() - started
+    return len(rows) / elapsed if elapsed > 0 else float(len(rows))
 
 class FileUploadHandler:
+    HASH_BLOCK_SIZE = 1024 * 1024
+    
     def __init__(self, upload_folder):
         self.upload_folder = upload_folder
     
@@ -23,21 +201,39 @@ class FileUploadHandler:
                filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
     
     def save_file(self, file):
-        """Save uploaded file and return filename."""
+        """Save uploaded file and return its filename and SHA-256, or (None, None)."""
         if not file or file.filename == '':
-            return None
+            return None, None
         
         if not self.allowed_file(file.filename):
-            return None
+            return None, None
         
         filename = secure_filename(file.filename)
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         filename = f"{timestamp}_{filename}"
         
+        # The content hash is taken while the file is written, in one pass
         filepath = os.path.join(self.upload_folder, filename)
-        file.save(filepath)
+        digest = hashlib.sha256()
+        with open(filepath, 'wb') as saved:
+            for block in iter(lambda: file.stream.read(self.HASH_BLOCK_SIZE), b''):
+                digest.update(block)
+                saved.write(block)
         
-        return filename
+        return filename, digest.hexdigest()
+    
+    def existing_upload(self, kind, filename, file_hash):
+        """
+        Id of a stored upload of the same kind with the same content, if any.
+        
+        The newly saved copy of a duplicate is removed, as it will not be parsed.
+        """
+        upload_id = find_upload_by_hash(kind, file_hash)
+        if upload_id:
+            os.remove(os.path.join(self.upload_folder, filename))
+            logging.info(f"Upload {filename} duplicates upload {upload_id}; not processed again", 
+                        extra={'category': LOG_UPLOAD})
+        return upload_id
     
     def parse_file(self, filepath, file_format='CSV'):
         """Parse uploaded file and return DataFrame."""
@@ -53,6 +249,77 @@ class FileUploadHandler:
             logging.error(f"Error parsing file {filepath}: {str(e)}", 
                          extra={'category': LOG_UPLOAD})
             return None
+    
+    def iter_chunks(self, filepath, file_format='CSV', chunksize=None, sheet_name=None,
+                    header_row=1, columns=None, dtypes=None):
+        """
+        Yield the parsed file as DataFrames of at most `chunksize` rows
+        (UPLOAD_CHUNK_SIZE by default), with column names from `header_row`
+        (1-based; earlier rows are skipped).
+        
+        CSV files and .xlsx workbooks are read incrementally, so only one chunk
+        is held in memory at a time. Workbooks are read from `sheet_name` (the
+        first sheet by default). When `columns` is given, only those columns
+        are kept; the others are skipped without being converted. `dtypes`
+        maps columns to the types CSV and .xls values are read as (workbook
+        cells keep their stored types). Raises UploadError if the file cannot
+        be parsed.
+        """
+        chunksize = chunksize or UPLOAD_CHUNK_SIZE
+        usecols = (lambda name: name in columns) if columns else None
+        try:
+            if file_format == FILE_FORMAT_EXCEL:
+                if filepath.lower().endswith('.xls'):
+                    # Legacy workbooks have no streaming reader
+                    yield pd.read_excel(filepath, sheet_name=sheet_name or 0, header=header_row - 1,
+                                        usecols=usecols, dtype=dtypes)
+                else:
+                    yield from self._iter_workbook_chunks(filepath, chunksize, sheet_name,
+                                                          header_row, columns)
+                return
+            
+            with pd.read_csv(filepath, chunksize=chunksize, header=header_row - 1,
+                             usecols=usecols, dtype=dtypes) as reader:
+                for chunk in reader:
+                    yield chunk
+                    
+        except Exception as e:
+            logging.error(f"Error parsing file {filepath}: {str(e)}", 
+                         extra={'category': LOG_UPLOAD})
+            raise UploadError("Error parsing file") from e
+    
+    def _iter_workbook_chunks(self, filepath, chunksize, sheet_name, header_row, columns):
+        """
+        Stream an .xlsx worksheet row by row with openpyxl's read-only reader.
+        
+        Cell values are taken as stored (no formatting or formulas evaluated),
+        and blank rows are skipped, as pandas does for trailing rows.
+        """
+        workbook = openpyxl.load_workbook(filepath, read_only=True, data_only=True)
+        try:
+            sheet = workbook[sheet_name] if sheet_name else workbook.worksheets[0]
+            rows = sheet.iter_rows(min_row=header_row, values_only=True)
+            header = next(rows, None)
+            if header is None:
+                raise ValueError(f"No header row {header_row} in sheet {sheet.title}")
+            
+            names = [str(name) if name is not None else f'Unnamed: {i}' for i, name in enumerate(header)]
+            keep = [i for i, name in enumerate(names) if columns is None or name in columns]
+            names = [names[i] for i in keep]
+            
+            batch = []
+            for row in rows:
+                values = tuple(row[i] if i < len(row) else None for i in keep)
+                if all(value is None for value in values):
+                    continue
+                batch.append(values)
+                if len(batch) >= chunksize:
+                    yield pd.DataFrame(batch, columns=names)
+                    batch = []
+            if batch:
+                yield pd.DataFrame(batch, columns=names)
+        finally:
+            workbook.close()
 
 class MPRUpload:
     def __init__(self, id, channel_id, filename, upload_date, 
@@ -66,25 +333,24 @@ class MPRUpload:
         self.status = status
     
     @staticmethod
-    def create(channel_id, filename, total_transactions=0, total_amount=0):
+    def create(channel_id, filename, total_transactions=0, total_amount=0, file_hash=None):
         """Create new MPR upload record."""
         try:
             query = """
-                INSERT INTO mpr_uploads (channel_id, filename, total_transactions, total_amount) 
-                VALUES (?, ?, ?, ?)
+                INSERT INTO mpr_uploads (channel_id, filename, total_transactions, total_amount, file_hash) 
+                VALUES (?, ?, ?, ?, ?)
             """
-            execute_query(query, (channel_id, filename, total_transactions, total_amount))
-            
-            # Get the inserted ID
-            query = "SELECT SCOPE_IDENTITY()"
-            result = execute_query(query, fetch='one')
-            upload_id = int(result[0]) if result else None
+            upload_id = execute_insert(query, (channel_id, filename, total_transactions, total_amount,
+                                               file_hash))
             
             logging.info(f"MPR upload created: {filename}", 
                         extra={'category': LOG_UPLOAD})
             return upload_id
             
         except Exception as e:
+            if file_hash and get_dialect().is_unique_violation(e):
+                # The same file was queued twice and the other copy committed first
+                raise DuplicateUploadError("File was stored by another upload") from e
             logging.error(f"Error creating MPR upload: {str(e)}", 
                          extra={'category': LOG_UPLOAD})
             return None
@@ -93,14 +359,15 @@ class MPRUpload:
     def get_recent(limit=10):
         """Get recent MPR uploads."""
         try:
-            query = """
-                SELECT TOP (?) u.id, u.channel_id, u.filename, u.upload_date, 
+            query = f"""
+                SELECT u.id, u.channel_id, u.filename, u.upload_date, 
                        u.total_transactions, u.total_amount, u.status, c.name as channel_name
                 FROM mpr_uploads u
                 JOIN channels c ON u.channel_id = c.id
                 ORDER BY u.upload_date DESC
+                {get_dialect().paginate(limit)}
             """
-            results = execute_query(query, (limit,), fetch='all')
+            results = execute_query(query, fetch='all')
             
             uploads = []
             if results:
@@ -127,25 +394,23 @@ class InternalUpload:
         self.status = status
     
     @staticmethod
-    def create(filename, total_transactions=0, total_amount=0):
+    def create(filename, total_transactions=0, total_amount=0, file_hash=None):
         """Create new internal upload record."""
         try:
             query = """
-                INSERT INTO internal_uploads (filename, total_transactions, total_amount) 
-                VALUES (?, ?, ?)
+                INSERT INTO internal_uploads (filename, total_transactions, total_amount, file_hash) 
+                VALUES (?, ?, ?, ?)
             """
-            execute_query(query, (filename, total_transactions, total_amount))
-            
-            # Get the inserted ID
-            query = "SELECT SCOPE_IDENTITY()"
-            result = execute_query(query, fetch='one')
-            upload_id = int(result[0]) if result else None
+            upload_id = execute_insert(query, (filename, total_transactions, total_amount, file_hash))
             
             logging.info(f"Internal upload created: {filename}", 
                         extra={'category': LOG_UPLOAD})
             return upload_id
             
         except Exception as e:
+            if file_hash and get_dialect().is_unique_violation(e):
+                # The same file was queued twice and the other copy committed first
+                raise DuplicateUploadError("File was stored by another upload") from e
             logging.error(f"Error creating internal upload: {str(e)}", 
                          extra={'category': LOG_UPLOAD})
             return None
@@ -154,12 +419,13 @@ class InternalUpload:
     def get_recent(limit=10):
         """Get recent internal uploads."""
         try:
-            query = """
-                SELECT TOP (?) id, filename, upload_date, total_transactions, total_amount
+            query = f"""
+                SELECT id, filename, upload_date, total_transactions, total_amount
                 FROM internal_uploads
                 ORDER BY upload_date DESC
+                {get_dialect().paginate(limit)}
             """
-            results = execute_query(query, (limit,), fetch='all')
+            results = execute_query(query, fetch='all')
             
             uploads = []
             if results:
@@ -184,25 +450,23 @@ class BankStatementUpload:
         self.status = status
     
     @staticmethod
-    def create(filename, total_credits=0, total_debits=0):
+    def create(filename, total_credits=0, total_debits=0, file_hash=None):
         """Create new bank statement upload record."""
         try:
             query = """
-                INSERT INTO bank_statement_uploads (filename, total_credits, total_debits) 
-                VALUES (?, ?, ?)
+                INSERT INTO bank_statement_uploads (filename, total_credits, total_debits, file_hash) 
+                VALUES (?, ?, ?, ?)
             """
-            execute_query(query, (filename, total_credits, total_debits))
-            
-            # Get the inserted ID
-            query = "SELECT SCOPE_IDENTITY()"
-            result = execute_query(query, fetch='one')
-            upload_id = int(result[0]) if result else None
+            upload_id = execute_insert(query, (filename, total_credits, total_debits, file_hash))
             
             logging.info(f"Bank statement upload created: {filename}", 
                         extra={'category': LOG_UPLOAD})
             return upload_id
             
         except Exception as e:
+            if file_hash and get_dialect().is_unique_violation(e):
+                # The same file was queued twice and the other copy committed first
+                raise DuplicateUploadError("File was stored by another upload") from e
             logging.error(f"Error creating bank statement upload: {str(e)}", 
                          extra={'category': LOG_UPLOAD})
             return None
@@ -211,12 +475,13 @@ class BankStatementUpload:
     def get_recent(limit=10):
         """Get recent bank statement uploads."""
         try:
-            query = """
-                SELECT TOP (?) id, filename, upload_date, total_credits, total_debits
+            query = f"""
+                SELECT id, filename, upload_date, total_credits, total_debits
                 FROM bank_statement_uploads
                 ORDER BY upload_date DESC
+                {get_dialect().paginate(limit)}
             """
-            results = execute_query(query, (limit,), fetch='all')
+            results = execute_query(query, fetch='all')
             
             uploads = []
             if results:
@@ -230,59 +495,73 @@ class BankStatementUpload:
                          extra={'category': LOG_UPLOAD})
             return []
 
+UPLOAD_TABLES = {
+    UPLOAD_KIND_MPR: 'mpr_uploads',
+    UPLOAD_KIND_INTERNAL: 'internal_uploads',
+    UPLOAD_KIND_BANK: 'bank_statement_uploads',
+}
+
+def get_upload_status(kind, upload_id):
+    """Stored status of an upload of the given kind, or None if it does not exist."""
+    query = f"SELECT status FROM {UPLOAD_TABLES[kind]} WHERE id = ?"
+    result = execute_query(query, (upload_id,), fetch='one')
+    return result[0] if result else None
+
+def find_upload_by_hash(kind, file_hash):
+    """Id of the completed upload of the given kind whose file has this SHA-256."""
+    query = f"SELECT id FROM {UPLOAD_TABLES[kind]} WHERE file_hash = ? AND status = 'COMPLETED'"
+    result = execute_query(query, (file_hash,), fetch='one')
+    return result[0] if result else None
+
+def duplicate_message(upload_id):
+    """Message shown when an upload matches a file that was already stored."""
+    return f"File already processed as upload {upload_id}; it was not processed again"
+
 class MPRTransaction:
+    # Insert order of the mapped fields
+    COLUMNS = ('utr', 'transaction_id', 'transaction_time', 'reference_id', 'amount', 'settlement_account',
+               'fingerprint', 'is_duplicate')
+    # Bound type of each insert parameter; times are ISO-8601 text the server converts
+    PARAMETER_TYPES = ('INT', 'NVARCHAR(50)', 'NVARCHAR(100)', 'NVARCHAR(40)', 'NVARCHAR(100)',
+                       'DECIMAL(18,2)', 'NVARCHAR(50)', 'BINARY(16)', 'BIT')
+    
     @staticmethod
     def create_batch(upload_id, transactions_data):
-        """Create batch of MPR transactions."""
+        """Create batch of MPR transactions from a frame (or list of dicts) of mapped rows."""
         try:
             query = """
                 INSERT INTO mpr_transactions 
-                (upload_id, utr, transaction_id, transaction_time, reference_id, amount, settlement_account) 
-                VALUES (?, ?, ?, ?, ?, ?, ?)
+                (upload_id, utr, transaction_id, transaction_time, reference_id, amount, settlement_account,
+                 fingerprint, is_duplicate) 
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
             """
             
-            batch_data = []
-            for transaction in transactions_data:
-                batch_data.append((
-                    upload_id,
-                    transaction.get('utr'),
-                    transaction.get('transaction_id'),
-                    transaction.get('transaction_time'),
-                    transaction.get('reference_id'),
-                    transaction.get('amount'),
-                    transaction.get('settlement_account')
-                ))
-            
-            # Execute batch insert
-            connection = None
-            cursor = None
-            try:
-                from config.database import get_db_connection
-                connection = get_db_connection()
-                cursor = connection.cursor()
-                
-                cursor.executemany(query, batch_data)
-                connection.commit()
-                
-                logging.info(f"Batch inserted {len(batch_data)} transactions for upload {upload_id}", 
-                           extra={'category': LOG_UPLOAD})
-                return True
-                
-            finally:
-                if cursor:
-                    cursor.close()
-                if connection:
-                    connection.close()
+            batch_data = _batch_rows(upload_id, transactions_data, MPRTransaction.COLUMNS)
+            rate = _bulk_insert(query, batch_data, MPRTransaction.PARAMETER_TYPES)
+            
+            logging.info(f"Batch inserted {len(batch_data)} transactions for upload {upload_id} "
+                       f"({rate:,.0f} rows/s)", extra={'category': LOG_UPLOAD})
+            return True
             
         except Exception as e:
+            if get_dialect().is_unique_violation(e):
+                # Only original fingerprints are unique in mpr_transactions
+                raise FingerprintConflictError(
+                    "Transactions in this file were stored by another upload at the same time; "
+                    "please upload it again") from e
             logging.error(f"Error creating transaction batch: {str(e)}", 
                          extra={'category': LOG_UPLOAD})
             return False
 
 class InternalTransaction:
+    # Insert order of the mapped fields
+    COLUMNS = ('transaction_id', 'transaction_time', 'amount', 'reference_id')
+    # Bound type of each insert parameter; times are ISO-8601 text the server converts
+    PARAMETER_TYPES = ('INT', 'NVARCHAR(100)', 'NVARCHAR(40)', 'DECIMAL(18,2)', 'NVARCHAR(100)')
+    
     @staticmethod
     def create_batch(upload_id, transactions_data):
-        """Create batch of internal transactions."""
+        """Create batch of internal transactions from a frame (or list of dicts) of rows."""
         try:
             query = """
                 INSERT INTO internal_transactions 
@@ -290,36 +569,12 @@ class InternalTransaction:
                 VALUES (?, ?, ?, ?, ?)
             """
             
-            batch_data = []
-            for transaction in transactions_data:
-                batch_data.append((
-                    upload_id,
-                    transaction.get('transaction_id'),
-                    transaction.get('transaction_time'),
-                    transaction.get('amount'),
-                    transaction.get('reference_id')
-                ))
-            
-            # Execute batch insert
-            connection = None
-            cursor = None
-            try:
-                from config.database import get_db_connection
-                connection = get_db_connection()
-                cursor = connection.cursor()
-                
-                cursor.executemany(query, batch_data)
-                connection.commit()
-                
-                logging.info(f"Batch inserted {len(batch_data)} internal transactions for upload {upload_id}", 
-                           extra={'category': LOG_UPLOAD})
-                return True
-                
-            finally:
-                if cursor:
-                    cursor.close()
-                if connection:
-                    connection.close()
+            batch_data = _batch_rows(upload_id, transactions_data, InternalTransaction.COLUMNS)
+            rate = _bulk_insert(query, batch_data, InternalTransaction.PARAMETER_TYPES)
+            
+            logging.info(f"Batch inserted {len(batch_data)} internal transactions for upload {upload_id} "
+                       f"({rate:,.0f} rows/s)", extra={'category': LOG_UPLOAD})
+            return True
             
         except Exception as e:
             logging.error(f"Error creating internal transaction batch: {str(e)}", 
@@ -327,9 +582,14 @@ class InternalTransaction:
             return False
 
 class BankTransaction:
+    # Insert order of the mapped fields
+    COLUMNS = ('transaction_date', 'amount', 'utr', 'description')
+    # Bound type of each insert parameter; times are ISO-8601 text the server converts
+    PARAMETER_TYPES = ('INT', 'NVARCHAR(40)', 'DECIMAL(18,2)', 'NVARCHAR(50)', 'NVARCHAR(500)')
+    
     @staticmethod
     def create_batch(upload_id, transactions_data):
-        """Create batch of bank transactions."""
+        """Create batch of bank transactions from a frame (or list of dicts) of rows."""
         try:
             query = """
                 INSERT INTO bank_transactions 
@@ -337,36 +597,12 @@ class BankTransaction:
                 VALUES (?, ?, ?, ?, ?)
             """
             
-            batch_data = []
-            for transaction in transactions_data:
-                batch_data.append((
-                    upload_id,
-                    transaction.get('transaction_date'),
-                    transaction.get('amount'),
-                    transaction.get('utr'),
-                    transaction.get('description')
-                ))
-            
-            # Execute batch insert
-            connection = None
-            cursor = None
-            try:
-                from config.database import get_db_connection
-                connection = get_db_connection()
-                cursor = connection.cursor()
-                
-                cursor.executemany(query, batch_data)
-                connection.commit()
-                
-                logging.info(f"Batch inserted {len(batch_data)} bank transactions for upload {upload_id}", 
-                           extra={'category': LOG_UPLOAD})
-                return True
-                
-            finally:
-                if cursor:
-                    cursor.close()
-                if connection:
-                    connection.close()
+            batch_data = _batch_rows(upload_id, transactions_data, BankTransaction.COLUMNS)
+            rate = _bulk_insert(query, batch_data, BankTransaction.PARAMETER_TYPES)
+            
+            logging.info(f"Batch inserted {len(batch_data)} bank transactions for upload {upload_id} "
+                       f"({rate:,.0f} rows/s)", extra={'category': LOG_UPLOAD})
+            return True
             
         except Exception as e:
             logging.error(f"Error creating bank transaction batch: {str(e)}", 
@@ -375,10 +611,24 @@ class BankTransaction:
 
 class MPRProcessor:
     def __init__(self, upload_folder):
+        self.upload_folder = upload_folder
         self.file_handler = FileUploadHandler(upload_folder)
     
     def process_mpr_file(self, file, channel_id):
         """Process uploaded MPR file."""
+        # Save file
+        filename, file_hash = self.file_handler.save_file(file)
+        if not filename:
+            return None, "Invalid file or file type not allowed"
+        
+        original_id = self.file_handler.existing_upload(UPLOAD_KIND_MPR, filename, file_hash)
+        if original_id:
+            return original_id, duplicate_message(original_id)
+        
+        return self.ingest_mpr_file(filename, channel_id, file_hash=file_hash)
+    
+    def ingest_mpr_file(self, filename, channel_id, file_hash=None, job=None):
+        """Parse and store a saved MPR file, reporting progress to `job` if given."""
         try:
             # Get channel configuration
             config = ChannelConfig.get_by_channel_id(channel_id)
@@ -387,273 +637,346 @@ class MPRProcessor:
                             extra={'category': LOG_UPLOAD})
                 return None, "Channel configuration not found"
             
-            # Save file
-            filename = self.file_handler.save_file(file)
-            if not filename:
-                return None, "Invalid file or file type not allowed"
-            
-            # Parse file
-            filepath = os.path.join(self.upload_folder, filename)
-            df = self.file_handler.parse_file(filepath, config.file_format)
-            
-            if df is None:
-                return None, "Error parsing file"
-            
-            # Map fields according to configuration
-            transactions_data = self._map_transactions(df, config.field_mappings)
-            
-            if not transactions_data:
-                return None, "No valid transactions found in file"
-            
-            # Calculate totals
-            total_transactions = len(transactions_data)
-            total_amount = sum(float(t.get('amount', 0)) for t in transactions_data if t.get('amount'))
-            
-            # Create upload record
-            upload_id = MPRUpload.create(channel_id, filename, total_transactions, total_amount)
-            
-            if not upload_id:
-                return None, "Error creating upload record"
-            
-            # Create transaction records
-            if MPRTransaction.create_batch(upload_id, transactions_data):
-                # Update upload status
-                query = "UPDATE mpr_uploads SET status = 'COMPLETED' WHERE id = ?"
-                execute_query(query, (upload_id,))
-                
-                logging.info(f"MPR file processed successfully: {filename}", 
-                           extra={'category': LOG_UPLOAD})
-                return upload_id, "File processed successfully"
-            else:
-                return None, "Error saving transaction data"
+            # The filter is read on its own connection, so before the upload's transaction
+            get_fingerprint_index().refresh()
+            try:
+                try:
+                    upload_id, duplicates = self._store_mpr_file(channel_id, config, filename,
+                                                                 file_hash, job)
+                except FingerprintConflictError:
+                    # The filter had not seen a row another upload stored; read the file
+                    # again, looking every fingerprint up in the database
+                    logging.warning(f"Fingerprint filter missed a stored transaction in {filename}; "
+                                   f"checking every row", extra={'category': LOG_UPLOAD})
+                    if job:
+                        job.restart()
+                    get_fingerprint_index().refresh()
+                    upload_id, duplicates = self._store_mpr_file(channel_id, config, filename,
+                                                                 file_hash, job, verify=True)
+            except DuplicateUploadError:
+                original_id = self.file_handler.existing_upload(UPLOAD_KIND_MPR, filename, file_hash)
+                if not original_id:
+                    return None, "Error creating upload record"
+                return original_id, duplicate_message(original_id)
+            except UploadError as e:
+                return None, str(e)
+            
+            logging.info(f"MPR file processed successfully: {filename} "
+                       f"({duplicates} duplicate transactions flagged)", 
+                       extra={'category': LOG_UPLOAD})
+            return upload_id, "File processed successfully"
             
         except Exception as e:
             logging.error(f"Error processing MPR file: {str(e)}", 
                          extra={'category': LOG_UPLOAD})
             return None, f"Processing error: {str(e)}"
     
-    def _map_transactions(self, df, field_mappings):
-        """Map DataFrame columns to transaction fields."""
-        transactions = []
+    def _store_mpr_file(self, channel_id, config, filename, file_hash=None, job=None, verify=False):
+        """
+        Store a saved MPR file as one upload and return (upload_id, duplicates).
         
-        for _, row in df.iterrows():
-            transaction = {}
+        Each chunk of the file is mapped and inserted before the next is read;
+        the upload record, its rows and the totals still share one commit.
+        With `verify`, every row is looked up in the database for duplicates
+        instead of only those the fingerprint filter may contain.
+        """
+        filepath = os.path.join(self.upload_folder, filename)
+        with transaction():
+            upload_id = MPRUpload.create(channel_id, filename, file_hash=file_hash)
+            if not upload_id:
+                raise UploadError("Error creating upload record")
+            
+            total_transactions = 0
+            total_amount = 0.0
+            duplicates = 0
+            # Every chunk reads times the way the first one did
+            time_format = _DateFormat()
+            columns, dtypes = _mapped_columns(config.field_mappings)
+            chunks = self.file_handler.iter_chunks(
+                filepath, config.file_format, sheet_name=config.sheet_name,
+                header_row=config.header_row, columns=columns, dtypes=dtypes
+            )
+            for df in chunks:
+                if job:
+                    job.parsed(len(df))
+                
+                # Map fields according to configuration
+                transactions_data = self._map_transactions(df, config.field_mappings, time_format)
+                if transactions_data.empty:
+                    continue
+                
+                transactions_data = self._flag_duplicates(channel_id, transactions_data, verify)
+                if not MPRTransaction.create_batch(upload_id, transactions_data):
+                    raise UploadError("Error saving transaction data")
+                
+                originals = transactions_data['fingerprint'][~transactions_data['is_duplicate']]
+                get_fingerprint_index().add(originals)
+                if job:
+                    job.inserted(len(transactions_data))
+                
+                duplicates += int(transactions_data['is_duplicate'].sum())
+                total_transactions += len(transactions_data)
+                total_amount += float(transactions_data['amount'].sum())
             
-            for field, column_name in field_mappings.items():
-                if column_name and column_name in df.columns:
-                    value = row[column_name]
-                    
-                    # Handle different data types
-                    if field == 'amount' and pd.notna(value):
-                        try:
-                            transaction[field] = float(value)
-                        except (ValueError, TypeError):
-                            transaction[field] = 0.0
-                    elif field == 'transaction_time' and pd.notna(value):
-                        try:
-                            if isinstance(value, str):
-                                transaction[field] = pd.to_datetime(value).isoformat()
-                            else:
-                                transaction[field] = value.isoformat() if hasattr(value, 'isoformat') else str(value)
-                        except:
-                            transaction[field] = str(value)
-                    else:
-                        transaction[field] = str(value) if pd.notna(value) else None
-            
-            # Only include transactions with required fields
-            if transaction.get('transaction_id') and transaction.get('amount'):
-                transactions.append(transaction)
+            if not total_transactions:
+                raise UploadError("No valid transactions found in file")
+            
+            query = """
+                UPDATE mpr_uploads 
+                SET status = 'COMPLETED', total_transactions = ?, total_amount = ? 
+                WHERE id = ?
+            """
+            execute_query(query, (total_transactions, total_amount, upload_id))
+        return upload_id, duplicates
+    
+    def _flag_duplicates(self, channel_id, transactions, verify=False):
+        """
+        Add each row's fingerprint and whether it repeats a stored row or an
+        earlier row of the same chunk.
+        """
+        fingerprints = transaction_fingerprints(channel_id, transactions)
+        repeated = fingerprints.duplicated()
+        stored = get_fingerprint_index().existing(fingerprints[~repeated].tolist(), verify=verify)
+        return transactions.assign(fingerprint=fingerprints,
+                                   is_duplicate=repeated | fingerprints.isin(stored))
+    
+    def _map_transactions(self, df, field_mappings, time_format=None):
+        """
+        Map DataFrame columns to transaction fields, a whole column at a time.
+        
+        Returns a frame with one column per mapped field, keeping rows that
+        have a transaction_id and a non-zero amount. `time_format` carries the
+        file's date format from chunk to chunk.
+        """
+        transactions = pd.DataFrame(index=df.index)
         
-        return transactions
+        for field, column_name in field_mappings.items():
+            if column_name and column_name in df.columns:
+                values = df[column_name]
+                
+                # Handle different data types
+                if field == 'amount':
+                    transactions[field] = _amount_column(values).fillna(0.0)
+                elif field == 'transaction_time':
+                    transactions[field] = _datetime_column(values, time_format)
+                else:
+                    transactions[field] = _text_column(values)
+        
+        # Only include transactions with required fields
+        if 'transaction_id' not in transactions or 'amount' not in transactions:
+            return transactions.iloc[0:0]
+        required = transactions['transaction_id'].fillna('').astype(bool) & \
+            (transactions['amount'] != 0)
+        return transactions[required].reset_index(drop=True)
 
 class InternalDataProcessor:
     def __init__(self, upload_folder):
+        self.upload_folder = upload_folder
         self.file_handler = FileUploadHandler(upload_folder)
     
     def process_internal_file(self, file):
         """Process uploaded internal data file."""
+        # Save file
+        filename, file_hash = self.file_handler.save_file(file)
+        if not filename:
+            return None, "Invalid file or file type not allowed"
+        
+        original_id = self.file_handler.existing_upload(UPLOAD_KIND_INTERNAL, filename, file_hash)
+        if original_id:
+            return original_id, duplicate_message(original_id)
+        
+        return self.ingest_internal_file(filename, file_hash=file_hash)
+    
+    def ingest_internal_file(self, filename, file_hash=None, job=None):
+        """Parse and store a saved internal data file, reporting progress to `job` if given."""
         try:
-            # Save file
-            filename = self.file_handler.save_file(file)
-            if not filename:
-                return None, "Invalid file or file type not allowed"
-            
-            # Parse file
+            # Each chunk of the file is checked, processed and inserted before the
+            # next is read; the upload record, its rows and the totals share one commit
             filepath = os.path.join(self.upload_folder, filename)
-            df = self.file_handler.parse_file(filepath)
-            
-            if df is None:
-                return None, "Error parsing file"
-            
-            # Expected columns for internal data
-            required_columns = ['transaction_id', 'amount']
-            missing_columns = [col for col in required_columns if col not in df.columns]
-            
-            if missing_columns:
-                return None, f"Missing required columns: {', '.join(missing_columns)}"
-            
-            # Process transactions
-            transactions_data = self._process_internal_transactions(df)
-            
-            if not transactions_data:
-                return None, "No valid transactions found in file"
-            
-            # Calculate totals
-            total_transactions = len(transactions_data)
-            total_amount = sum(float(t.get('amount', 0)) for t in transactions_data if t.get('amount'))
-            
-            # Create upload record
-            upload_id = InternalUpload.create(filename, total_transactions, total_amount)
-            
-            if not upload_id:
-                return None, "Error creating upload record"
-            
-            # Create transaction records
-            if InternalTransaction.create_batch(upload_id, transactions_data):
-                # Update upload status
-                query = "UPDATE internal_uploads SET status = 'COMPLETED' WHERE id = ?"
-                execute_query(query, (upload_id,))
-                
-                logging.info(f"Internal data file processed successfully: {filename}", 
-                           extra={'category': LOG_UPLOAD})
-                return upload_id, "File processed successfully"
-            else:
-                return None, "Error saving transaction data"
+            try:
+                with transaction():
+                    upload_id = InternalUpload.create(filename, file_hash=file_hash)
+                    if not upload_id:
+                        raise UploadError("Error creating upload record")
+                    
+                    total_transactions = 0
+                    total_amount = 0.0
+                    # Every chunk reads times the way the first one did
+                    time_format = _DateFormat()
+                    for df in self.file_handler.iter_chunks(filepath, dtypes=_INTERNAL_DTYPES):
+                        if job:
+                            job.parsed(len(df))
+                        
+                        # Expected columns for internal data
+                        required_columns = ['transaction_id', 'amount']
+                        missing_columns = [col for col in required_columns if col not in df.columns]
+                        
+                        if missing_columns:
+                            raise UploadError(f"Missing required columns: {', '.join(missing_columns)}")
+                        
+                        # Process transactions
+                        transactions_data = self._process_internal_transactions(df, time_format)
+                        if transactions_data.empty:
+                            continue
+                        
+                        if not InternalTransaction.create_batch(upload_id, transactions_data):
+                            raise UploadError("Error saving transaction data")
+                        
+                        if job:
+                            job.inserted(len(transactions_data))
+                        
+                        total_transactions += len(transactions_data)
+                        total_amount += float(transactions_data['amount'].sum())
+                    
+                    if not total_transactions:
+                        raise UploadError("No valid transactions found in file")
+                    
+                    query = """
+                        UPDATE internal_uploads 
+                        SET status = 'COMPLETED', total_transactions = ?, total_amount = ? 
+                        WHERE id = ?
+                    """
+                    execute_query(query, (total_transactions, total_amount, upload_id))
+            except DuplicateUploadError:
+                original_id = self.file_handler.existing_upload(UPLOAD_KIND_INTERNAL, filename, file_hash)
+                if not original_id:
+                    return None, "Error creating upload record"
+                return original_id, duplicate_message(original_id)
+            except UploadError as e:
+                return None, str(e)
+            
+            logging.info(f"Internal data file processed successfully: {filename}", 
+                       extra={'category': LOG_UPLOAD})
+            return upload_id, "File processed successfully"
             
         except Exception as e:
             logging.error(f"Error processing internal data file: {str(e)}", 
                          extra={'category': LOG_UPLOAD})
             return None, f"Processing error: {str(e)}"
     
-    def _process_internal_transactions(self, df):
-        """Process internal transaction data."""
-        transactions = []
+    def _process_internal_transactions(self, df, time_format=None):
+        """Process internal transaction data, a whole column at a time."""
+        transactions = pd.DataFrame(index=df.index)
         
-        for _, row in df.iterrows():
-            transaction = {}
-            
-            # Map standard fields
-            transaction['transaction_id'] = str(row.get('transaction_id', ''))
-            
-            # Handle amount
-            if 'amount' in df.columns and pd.notna(row['amount']):
-                try:
-                    transaction['amount'] = float(row['amount'])
-                except (ValueError, TypeError):
-                    transaction['amount'] = 0.0
-            else:
-                transaction['amount'] = 0.0
-            
-            # Handle optional fields
-            if 'transaction_time' in df.columns and pd.notna(row['transaction_time']):
-                try:
-                    if isinstance(row['transaction_time'], str):
-                        transaction['transaction_time'] = pd.to_datetime(row['transaction_time']).isoformat()
-                    else:
-                        transaction['transaction_time'] = row['transaction_time'].isoformat() if hasattr(row['transaction_time'], 'isoformat') else str(row['transaction_time'])
-                except:
-                    transaction['transaction_time'] = str(row['transaction_time'])
-            
-            if 'reference_id' in df.columns and pd.notna(row['reference_id']):
-                transaction['reference_id'] = str(row['reference_id'])
-            
-            # Only include transactions with required fields
-            if transaction.get('transaction_id') and transaction.get('amount'):
-                transactions.append(transaction)
+        # Map standard fields
+        transactions['transaction_id'] = _text_column(df['transaction_id'])
+        transactions['amount'] = _amount_column(df['amount']).fillna(0.0)
+        
+        # Handle optional fields
+        if 'transaction_time' in df.columns:
+            transactions['transaction_time'] = _datetime_column(df['transaction_time'], time_format)
         
-        return transactions
+        if 'reference_id' in df.columns:
+            transactions['reference_id'] = _text_column(df['reference_id'])
+        
+        # Only include transactions with required fields
+        required = transactions['transaction_id'].fillna('').astype(bool) & \
+            (transactions['amount'] != 0)
+        return transactions[required].reset_index(drop=True)
 
 class BankStatementProcessor:
     def __init__(self, upload_folder):
+        self.upload_folder = upload_folder
         self.file_handler = FileUploadHandler(upload_folder)
     
     def process_bank_statement_file(self, file):
         """Process uploaded bank statement file."""
+        # Save file
+        filename, file_hash = self.file_handler.save_file(file)
+        if not filename:
+            return None, "Invalid file or file type not allowed"
+        
+        original_id = self.file_handler.existing_upload(UPLOAD_KIND_BANK, filename, file_hash)
+        if original_id:
+            return original_id, duplicate_message(original_id)
+        
+        return self.ingest_bank_statement_file(filename, file_hash=file_hash)
+    
+    def ingest_bank_statement_file(self, filename, file_hash=None, job=None):
+        """Parse and store a saved bank statement file, reporting progress to `job` if given."""
         try:
-            # Save file
-            filename = self.file_handler.save_file(file)
-            if not filename:
-                return None, "Invalid file or file type not allowed"
-            
-            # Parse file
+            # Each chunk of the file is checked, processed and inserted before the
+            # next is read; the upload record, its rows and the totals share one commit
             filepath = os.path.join(self.upload_folder, filename)
-            df = self.file_handler.parse_file(filepath)
-            
-            if df is None:
-                return None, "Error parsing file"
-            
-            # Expected columns for bank statement
-            required_columns = ['amount']
-            missing_columns = [col for col in required_columns if col not in df.columns]
-            
-            if missing_columns:
-                return None, f"Missing required columns: {', '.join(missing_columns)}"
-            
-            # Process transactions
-            transactions_data = self._process_bank_transactions(df)
-            
-            if not transactions_data:
-                return None, "No valid transactions found in file"
-            
-            # Calculate totals
-            total_credits = sum(float(t.get('amount', 0)) for t in transactions_data if float(t.get('amount', 0)) > 0)
-            total_debits = sum(abs(float(t.get('amount', 0))) for t in transactions_data if float(t.get('amount', 0)) < 0)
-            
-            # Create upload record
-            upload_id = BankStatementUpload.create(filename, total_credits, total_debits)
-            
-            if not upload_id:
-                return None, "Error creating upload record"
-            
-            # Create transaction records
-            if BankTransaction.create_batch(upload_id, transactions_data):
-                # Update upload status
-                query = "UPDATE bank_statement_uploads SET status = 'COMPLETED' WHERE id = ?"
-                execute_query(query, (upload_id,))
-                
-                logging.info(f"Bank statement file processed successfully: {filename}", 
-                           extra={'category': LOG_UPLOAD})
-                return upload_id, "File processed successfully"
-            else:
-                return None, "Error saving transaction data"
+            try:
+                with transaction():
+                    upload_id = BankStatementUpload.create(filename, file_hash=file_hash)
+                    if not upload_id:
+                        raise UploadError("Error creating upload record")
+                    
+                    total_transactions = 0
+                    total_credits = 0.0
+                    total_debits = 0.0
+                    # Every chunk reads dates the way the first one did
+                    date_format = _DateFormat()
+                    for df in self.file_handler.iter_chunks(filepath, dtypes=_BANK_DTYPES):
+                        if job:
+                            job.parsed(len(df))
+                        
+                        # Expected columns for bank statement
+                        required_columns = ['amount']
+                        missing_columns = [col for col in required_columns if col not in df.columns]
+                        
+                        if missing_columns:
+                            raise UploadError(f"Missing required columns: {', '.join(missing_columns)}")
+                        
+                        # Process transactions
+                        transactions_data = self._process_bank_transactions(df, date_format)
+                        if transactions_data.empty:
+                            continue
+                        
+                        if not BankTransaction.create_batch(upload_id, transactions_data):
+                            raise UploadError("Error saving transaction data")
+                        
+                        if job:
+                            job.inserted(len(transactions_data))
+                        
+                        amounts = transactions_data['amount']
+                        total_transactions += len(transactions_data)
+                        total_credits += float(amounts[amounts > 0].sum())
+                        total_debits += float(-amounts[amounts < 0].sum())
+                    
+                    if not total_transactions:
+                        raise UploadError("No valid transactions found in file")
+                    
+                    query = """
+                        UPDATE bank_statement_uploads 
+                        SET status = 'COMPLETED', total_credits = ?, total_debits = ? 
+                        WHERE id = ?
+                    """
+                    execute_query(query, (total_credits, total_debits, upload_id))
+            except DuplicateUploadError:
+                original_id = self.file_handler.existing_upload(UPLOAD_KIND_BANK, filename, file_hash)
+                if not original_id:
+                    return None, "Error creating upload record"
+                return original_id, duplicate_message(original_id)
+            except UploadError as e:
+                return None, str(e)
+            
+            logging.info(f"Bank statement file processed successfully: {filename}", 
+                       extra={'category': LOG_UPLOAD})
+            return upload_id, "File processed successfully"
             
         except Exception as e:
             logging.error(f"Error processing bank statement file: {str(e)}", 
                          extra={'category': LOG_UPLOAD})
             return None, f"Processing error: {str(e)}"
     
-    def _process_bank_transactions(self, df):
-        """Process bank transaction data."""
-        transactions = []
+    def _process_bank_transactions(self, df, date_format=None):
+        """Process bank transaction data, a whole column at a time."""
+        transactions = pd.DataFrame(index=df.index)
         
-        for _, row in df.iterrows():
-            transaction = {}
-            
-            # Handle amount (required)
-            if 'amount' in df.columns and pd.notna(row['amount']):
-                try:
-                    transaction['amount'] = float(row['amount'])
-                except (ValueError, TypeError):
-                    continue  # Skip invalid amounts
-            else:
-                continue  # Skip rows without amount
-            
-            # Handle optional fields
-            if 'transaction_date' in df.columns and pd.notna(row['transaction_date']):
-                try:
-                    if isinstance(row['transaction_date'], str):
-                        transaction['transaction_date'] = pd.to_datetime(row['transaction_date']).isoformat()
-                    else:
-                        transaction['transaction_date'] = row['transaction_date'].isoformat() if hasattr(row['transaction_date'], 'isoformat') else str(row['transaction_date'])
-                except:
-                    transaction['transaction_date'] = str(row['transaction_date'])
-            
-            if 'utr' in df.columns and pd.notna(row['utr']):
-                transaction['utr'] = str(row['utr'])
-            
-            if 'description' in df.columns and pd.notna(row['description']):
-                transaction['description'] = str(row['description'])
-            
-            transactions.append(transaction)
+        # Handle amount (required); rows without a numeric amount are skipped
+        transactions['amount'] = _amount_column(df['amount'])
+        
+        # Handle optional fields
+        if 'transaction_date' in df.columns:
+            transactions['transaction_date'] = _datetime_column(df['transaction_date'], date_format)
+        
+        if 'utr' in df.columns:
+            transactions['utr'] = _text_column(df['utr'])
+        
+        if 'description' in df.columns:
+            transactions['description'] = _text_column(df['description'])
         
-        return transactions
\ No newline at end of file
+        return transactions[transactions['amount'].notna()].reset_index(drop=True)
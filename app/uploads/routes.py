@@ -1,18 +1,56 @@
 """
 Upload routes and views.
 """
-from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app
+from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, jsonify
 from app.auth.utils import login_required
 from app.config.models import Channel
 from app.uploads.models import (
     MPRProcessor, MPRUpload, InternalDataProcessor, 
-    InternalUpload, BankStatementProcessor, BankStatementUpload
+    InternalUpload, BankStatementProcessor, BankStatementUpload, get_upload_status,
+    duplicate_message
 )
+from app.uploads.jobs import get_ingest_queue
 import logging
-from config.constants import LOG_UPLOAD
+from config.constants import LOG_UPLOAD, UPLOAD_KIND_MPR, UPLOAD_KIND_INTERNAL, UPLOAD_KIND_BANK
 
 uploads_bp = Blueprint('uploads', __name__)
 
+def _queue_upload(kind, processor, file, ingest, *args):
+    """
+    Save an uploaded file and queue `ingest(filename, *args)` for it.
+    
+    Returns (job, None), or (None, original upload id) for a file that was
+    already stored, or (None, None) for a rejected file.
+    """
+    filename, file_hash = processor.file_handler.save_file(file)
+    if not filename:
+        return None, None
+    
+    original_id = processor.file_handler.existing_upload(kind, filename, file_hash)
+    if original_id:
+        return None, original_id
+    
+    job = get_ingest_queue().submit(kind, filename,
+                                    lambda job: ingest(filename, *args, file_hash=file_hash, job=job))
+    return job, None
+
+def _queued_response(job, original_id, template, **context):
+    """The queued job as JSON for API clients, otherwise the upload page with a message."""
+    if request.accept_mimetypes.best == 'application/json':
+        if original_id:
+            return jsonify({'duplicate_of': original_id, 'message': duplicate_message(original_id)})
+        if not job:
+            return jsonify({'error': 'Invalid file or file type not allowed'}), 400
+        return jsonify(job.to_dict()), 202, {'Location': url_for('uploads.job_status', job_id=job.id)}
+    
+    if original_id:
+        flash(duplicate_message(original_id), 'info')
+    elif job:
+        flash(f'File queued for processing (job {job.id}).', 'success')
+    else:
+        flash('Upload failed: Invalid file or file type not allowed', 'error')
+    return render_template(template, **context)
+
 @uploads_bp.route('/mpr', methods=['GET', 'POST'])
 @login_required
 def mpr():
@@ -34,6 +72,12 @@ def mpr():
         try:
             channel_id = int(channel_id)
             processor = MPRProcessor(current_app.config['UPLOAD_FOLDER'])
+            
+            if current_app.config['UPLOAD_ASYNC']:
+                job, original_id = _queue_upload(UPLOAD_KIND_MPR, processor, file,
+                                                 processor.ingest_mpr_file, channel_id)
+                return _queued_response(job, original_id, 'uploads/mpr.html', channels=channels)
+            
             upload_id, message = processor.process_mpr_file(file, channel_id)
             
             if upload_id:
@@ -67,6 +111,12 @@ def internal():
         
         try:
             processor = InternalDataProcessor(current_app.config['UPLOAD_FOLDER'])
+            
+            if current_app.config['UPLOAD_ASYNC']:
+                job, original_id = _queue_upload(UPLOAD_KIND_INTERNAL, processor, file,
+                                                 processor.ingest_internal_file)
+                return _queued_response(job, original_id, 'uploads/internal.html')
+            
             upload_id, message = processor.process_internal_file(file)
             
             if upload_id:
@@ -98,6 +148,12 @@ def bank_statement():
         
         try:
             processor = BankStatementProcessor(current_app.config['UPLOAD_FOLDER'])
+            
+            if current_app.config['UPLOAD_ASYNC']:
+                job, original_id = _queue_upload(UPLOAD_KIND_BANK, processor, file,
+                                                 processor.ingest_bank_statement_file)
+                return _queued_response(job, original_id, 'uploads/bank_statement.html')
+            
             upload_id, message = processor.process_bank_statement_file(file)
             
             if upload_id:
@@ -127,4 +183,20 @@ def history():
     return render_template('uploads/history.html', 
                          mpr_uploads=mpr_uploads,
                          internal_uploads=internal_uploads,
-                         bank_uploads=bank_uploads)
\ No newline at end of file
+                         bank_uploads=bank_uploads)
+
+@uploads_bp.route('/jobs/<job_id>')
+@login_required
+def job_status(job_id):
+    """API endpoint for the progress of a background ingest job."""
+    job = get_ingest_queue().get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    try:
+        status = job.to_dict()
+        # The stored upload's own status, once the job has committed one
+        status['upload_status'] = get_upload_status(job.kind, job.upload_id) if job.upload_id else None
+        return jsonify(status)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
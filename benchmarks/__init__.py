@@ -0,0 +1,3 @@
+"""
+Synthetic data generation and performance benchmarks for reconciliation.
+"""
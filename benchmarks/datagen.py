@@ -0,0 +1,226 @@
+"""
+Synthetic MPR, internal and bank statement datasets.
+
+Every dataset starts from a set of true settlements; each source is then
+derived from them with configurable rates of amount mismatches, missing
+rows, duplicate MPR lines, date skew and transaction-ID drift (internal
+rows that carry their own order reference, so only AMOUNT_DATE can pair
+them). Generation is deterministic for a given seed.
+"""
+import csv
+import os
+import random
+from datetime import datetime, timedelta
+
+DEFAULT_RATES = {
+    'mismatch': 0.02,    # internal amount differs beyond the tolerance
+    'missing': 0.03,     # settlement absent from internal data / bank statement
+    'duplicate': 0.01,   # MPR line repeated by the channel
+    'date_skew': 0.05,   # internal time shifted by one to three days
+    'id_drift': 0.10,    # internal row carries its own order reference
+}
+
+# Per-channel MPR layouts: column per standard field, and how times are written
+CHANNEL_FORMATS = {
+    'BBPS': {
+        'weight': 0.5,
+        'columns': {
+            'transaction_id': 'BBPS Txn Ref',
+            'utr': 'UTR No',
+            'transaction_time': 'Txn Date Time',
+            'reference_id': 'Biller Ref',
+            'amount': 'Txn Amount',
+            'settlement_account': 'Settlement A/C',
+        },
+        'time_format': '%d-%m-%Y %H:%M:%S',
+    },
+    'Payment Gateway': {
+        'weight': 0.35,
+        'columns': {
+            'transaction_id': 'payment_id',
+            'utr': 'bank_reference',
+            'transaction_time': 'created_at',
+            'reference_id': 'order_id',
+            'amount': 'amount',
+            'settlement_account': 'settlement_id',
+        },
+        'time_format': '%Y-%m-%dT%H:%M:%S',
+    },
+    'WhatsApp': {
+        'weight': 0.15,
+        'columns': {
+            'transaction_id': 'TransactionID',
+            'utr': 'UTR',
+            'transaction_time': 'PaidOn',
+            'reference_id': 'ChatRef',
+            'amount': 'Amount',
+            'settlement_account': 'Account',
+        },
+        'time_format': '%Y/%m/%d %H:%M',
+    },
+}
+
+def parse_size(value):
+    """Parse a row count such as 10000, '10k' or '1M'."""
+    text = str(value).strip().lower()
+    multiplier = 1
+    if text.endswith('k'):
+        multiplier, text = 1000, text[:-1]
+    elif text.endswith('m'):
+        multiplier, text = 1000000, text[:-1]
+    return int(float(text) * multiplier)
+
+def generate_dataset(rows, rates=None, channels=None, start=None, days=30, seed=42):
+    """
+    Generate one dataset with `rows` settlements.
+
+    Returns a dict with 'mpr' (channel -> list of row dicts), 'internal' and
+    'bank' row lists, and 'stats' counting each injected defect. Times are
+    ISO-8601 strings, as the upload processors store them.
+    """
+    rates = dict(DEFAULT_RATES, **(rates or {}))
+    channels = channels or list(CHANNEL_FORMATS)
+    weights = [CHANNEL_FORMATS[channel]['weight'] for channel in channels]
+    start = start or datetime(2024, 1, 1)
+    rng = random.Random(seed)
+
+    dataset = {'mpr': {channel: [] for channel in channels}, 'internal': [], 'bank': []}
+    stats = {name: 0 for name in rates}
+    span_seconds = days * 86400
+
+    for number in range(rows):
+        channel = rng.choices(channels, weights)[0]
+        when = start + timedelta(seconds=rng.randrange(span_seconds))
+        amount = round(min(max(rng.lognormvariate(6.5, 1.2), 10.0), 500000.0), 2)
+        settlement = {
+            'transaction_id': f'TXN{number:09d}',
+            'utr': f'UTR{rng.randrange(10 ** 12):012d}',
+            'transaction_time': when.isoformat(),
+            'reference_id': f'REF{number:09d}',
+            'amount': amount,
+            'settlement_account': f'SA{rng.randrange(100):03d}',
+        }
+        dataset['mpr'][channel].append(settlement)
+        if rng.random() < rates['duplicate']:
+            dataset['mpr'][channel].append(dict(settlement))
+            stats['duplicate'] += 1
+
+        # Internal side
+        if rng.random() < rates['missing']:
+            stats['missing'] += 1
+        else:
+            internal = {
+                'transaction_id': settlement['transaction_id'],
+                'transaction_time': settlement['transaction_time'],
+                'amount': amount,
+                'reference_id': settlement['reference_id'],
+            }
+            if rng.random() < rates['mismatch']:
+                internal['amount'] = round(amount + rng.choice((-1, 1)) * rng.uniform(1, 500), 2)
+                stats['mismatch'] += 1
+            if rng.random() < rates['date_skew']:
+                skewed = when + timedelta(days=rng.choice((-3, -2, -1, 1, 2, 3)),
+                                          minutes=rng.randrange(-90, 90))
+                internal['transaction_time'] = skewed.isoformat()
+                stats['date_skew'] += 1
+            if rng.random() < rates['id_drift']:
+                internal['transaction_id'] = f'ORD{number:09d}'
+                stats['id_drift'] += 1
+            dataset['internal'].append(internal)
+
+        # Bank side: credits arrive T+1, usually carrying the UTR
+        if rng.random() >= rates['missing']:
+            dataset['bank'].append({
+                'transaction_date': (when + timedelta(days=1)).replace(
+                    hour=0, minute=0, second=0).isoformat(),
+                'amount': amount,
+                'utr': settlement['utr'] if rng.random() < 0.9 else None,
+                'description': f'NEFT CR {channel}',
+            })
+
+    # Internal rows the channels never reported, and bank debits
+    for number in range(int(rows * rates['missing'])):
+        when = start + timedelta(seconds=rng.randrange(span_seconds))
+        dataset['internal'].append({
+            'transaction_id': f'INT{number:09d}',
+            'transaction_time': when.isoformat(),
+            'amount': round(rng.uniform(10, 5000), 2),
+            'reference_id': None,
+        })
+        dataset['bank'].append({
+            'transaction_date': when.replace(hour=0, minute=0, second=0).isoformat(),
+            'amount': -round(rng.uniform(10, 5000), 2),
+            'utr': None,
+            'description': 'CHARGES',
+        })
+
+    # Sources are not in the same order in real files
+    rng.shuffle(dataset['internal'])
+    rng.shuffle(dataset['bank'])
+
+    dataset['stats'] = stats
+    return dataset
+
+def write_channel_files(dataset, directory, extra_columns=0):
+    """
+    Write the dataset as upload files, each MPR file in its channel's layout
+    with `extra_columns` unmapped columns appended.
+
+    Returns channel -> field_mappings, as ChannelConfig would store them.
+    """
+    os.makedirs(directory, exist_ok=True)
+    mappings = {}
+
+    for channel, rows in dataset['mpr'].items():
+        layout = CHANNEL_FORMATS[channel]
+        columns = layout['columns']
+        filename = os.path.join(directory, f"mpr_{channel.lower().replace(' ', '_')}.csv")
+        with open(filename, 'w', newline='') as handle:
+            writer = csv.writer(handle)
+            writer.writerow(list(columns.values()) + [f'Extra {n + 1}' for n in range(extra_columns)])
+            for row in rows:
+                writer.writerow([
+                    datetime.fromisoformat(row[field]).strftime(layout['time_format'])
+                    if field == 'transaction_time' else row[field]
+                    for field in columns
+                ] + [f'note {n}' for n in range(extra_columns)])
+        mappings[channel] = dict(columns)
+
+    _write_rows(os.path.join(directory, 'internal.csv'), dataset['internal'],
+                ['transaction_id', 'transaction_time', 'amount', 'reference_id'])
+    _write_rows(os.path.join(directory, 'bank.csv'), dataset['bank'],
+                ['transaction_date', 'amount', 'utr', 'description'])
+
+    return mappings
+
+def write_channel_workbook(dataset, channel, filename, sheet_name='Settlements', header_row=1,
+                           extra_columns=0):
+    """
+    Write one channel's MPR rows as an .xlsx workbook in the channel's layout.
+
+    The header goes on `header_row` below a title line, and `extra_columns`
+    unmapped columns are appended, as channels' own exports often carry.
+    Times are written as Excel dates. Returns the field_mappings.
+    """
+    import openpyxl
+
+    layout = CHANNEL_FORMATS[channel]
+    columns = layout['columns']
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet(sheet_name)
+    for line in range(header_row - 1):
+        sheet.append([f'{channel} settlement report' if line == 0 else None])
+    sheet.append(list(columns.values()) + [f'Extra {n + 1}' for n in range(extra_columns)])
+    for row in dataset['mpr'][channel]:
+        sheet.append([
+            datetime.fromisoformat(row[field]) if field == 'transaction_time' else row[field]
+            for field in columns
+        ] + [f'note {n}' for n in range(extra_columns)])
+    workbook.save(filename)
+    return dict(columns)
+
+def _write_rows(filename, rows, fields):
+    with open(filename, 'w', newline='') as handle:
+        writer = csv.DictWriter(handle, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
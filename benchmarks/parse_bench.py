@@ -0,0 +1,151 @@
+"""
+MPR file parsing benchmark.
+
+Writes a channel's MPR rows as a CSV file or .xlsx workbook, with unmapped
+columns alongside the mapped ones, and times reading it with the original
+whole-file `parse_file` against the streaming `iter_chunks` reader, which
+reads only the mapped columns with the types the channel's mappings give
+them. Each case runs in its own process so peak RSS belongs to that case
+alone:
+
+    python -m benchmarks.parse_bench --formats csv,excel --sizes 10k,100k,300k
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+if __package__ in (None, ''):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.datagen import (
+    generate_dataset, parse_size, write_channel_files, write_channel_workbook
+)
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+DEFAULT_SIZES = '10k,100k'
+FORMATS = ('CSV', 'EXCEL')
+READERS = ('PARSE_FILE', 'STREAMING')
+CHANNEL = 'BBPS'
+
+def write_mpr_file(rows, file_format, directory, seed=42, extra_columns=8):
+    """Write an MPR file of `rows` settlements; returns its path and field_mappings."""
+    dataset = generate_dataset(rows, channels=[CHANNEL], seed=seed)
+    if file_format == 'EXCEL':
+        filename = os.path.join(directory, f'mpr-{rows}.xlsx')
+        mappings = write_channel_workbook(dataset, CHANNEL, filename, extra_columns=extra_columns)
+        return filename, mappings
+
+    mappings = write_channel_files(dataset, directory, extra_columns=extra_columns)[CHANNEL]
+    filename = os.path.join(directory, f'mpr-{rows}.csv')
+    os.replace(os.path.join(directory, f"mpr_{CHANNEL.lower()}.csv"), filename)
+    return filename, mappings
+
+def run_case(filename, file_format, mappings, reader):
+    """Parse the file with one reader; returns the case report."""
+    from app.recon.profiling import peak_rss_kb
+    from app.uploads.models import FileUploadHandler, _mapped_columns
+
+    handler = FileUploadHandler(os.path.dirname(filename))
+    started = time.perf_counter()
+    if reader == 'PARSE_FILE':
+        frame = handler.parse_file(filename, file_format)
+        rows, chunks = len(frame), 1
+    else:
+        columns, dtypes = _mapped_columns(mappings)
+        rows = chunks = 0
+        for chunk in handler.iter_chunks(filename, file_format, columns=columns, dtypes=dtypes):
+            rows += len(chunk)
+            chunks += 1
+    seconds = time.perf_counter() - started
+
+    return {
+        'format': file_format,
+        'reader': reader,
+        'rows': rows,
+        'chunks': chunks,
+        'seconds': round(seconds, 6),
+        'rows_per_second': round(rows / seconds, 1) if seconds else None,
+        'peak_rss_kb': peak_rss_kb(),
+    }
+
+def _case_worker(connection, *args):
+    try:
+        connection.send(('ok', run_case(*args)))
+    except Exception as e:
+        connection.send(('error', f'{type(e).__name__}: {e}'))
+    finally:
+        connection.close()
+
+def run_isolated(filename, file_format, mappings, reader):
+    """Run one case in a fresh process so its peak RSS is its own."""
+    context = multiprocessing.get_context('spawn')
+    parent, child = context.Pipe(duplex=False)
+    process = context.Process(target=_case_worker,
+                              args=(child, filename, file_format, mappings, reader))
+    process.start()
+    child.close()
+    status, payload = parent.recv()
+    process.join()
+    if status != 'ok':
+        raise RuntimeError(f'{reader} on {filename} failed: {payload}')
+    return payload
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='MPR file parsing benchmark')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES,
+                        help='comma-separated settlement counts, e.g. 10k,100k,300k')
+    parser.add_argument('--formats', default=','.join(FORMATS), help='comma-separated file formats')
+    parser.add_argument('--readers', default=','.join(READERS), help='comma-separated readers')
+    parser.add_argument('--extra-columns', type=int, default=8,
+                        help='unmapped columns added to each row')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='result file (default: results/parse-<timestamp>.json)')
+    parser.add_argument('--in-process', action='store_true',
+                        help='run cases in this process (peak RSS then accumulates)')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    runner = run_case if args.in_process else run_isolated
+
+    report = {
+        'created_at': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': args.seed,
+        'extra_columns': args.extra_columns,
+        'cases': [],
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        for file_format in args.formats.split(','):
+            file_format = file_format.strip().upper()
+            for size in args.sizes.split(','):
+                # Generated in a separate process: Linux carries a process's peak RSS
+                # into the children it forks, which would mask the cases' own peaks
+                with multiprocessing.get_context('spawn').Pool(1) as pool:
+                    filename, mappings = pool.apply(write_mpr_file, (
+                        parse_size(size), file_format, directory, args.seed, args.extra_columns))
+                for reader in args.readers.split(','):
+                    case = runner(filename, file_format, mappings, reader.strip().upper())
+                    case['size'] = parse_size(size)
+                    report['cases'].append(case)
+                    print(f"{case['format']:>5} {case['reader']:>11} {case['rows']:>9} rows  "
+                          f"{case['seconds']:8.3f}s  {case['rows_per_second'] or 0:>11,.0f} rows/s  "
+                          f"peak RSS {case['peak_rss_kb']} KB")
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"parse-{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as handle:
+        json.dump(report, handle, indent=2)
+    print(f'Results written to {output}')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
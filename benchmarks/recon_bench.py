@@ -0,0 +1,172 @@
+"""
+End-to-end reconciliation benchmark.
+
+Generates a dataset per size, loads it into a SQLite stand-in, runs the
+selected reconciliation backends and reports throughput, per-stage latency
+and peak memory. Each case runs in its own process so peak RSS belongs to
+that case alone. Results are written as JSON and can be compared against a
+saved baseline:
+
+    python -m benchmarks.recon_bench --sizes 10k,100k --backends ROW,VECTORIZED
+    python -m benchmarks.recon_bench --sizes 1M --backends ROW,VECTORIZED
+    python -m benchmarks.recon_bench --sizes 10k --baseline benchmarks/results/<run>.json
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import sys
+import time
+from datetime import datetime
+
+if __package__ in (None, ''):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.datagen import DEFAULT_RATES, generate_dataset, parse_size
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+DEFAULT_SIZES = '10k,100k,1M'
+DEFAULT_REGRESSION_THRESHOLD = 0.20  # fail when a case is 20% slower than the baseline
+
+def run_case(rows, backend, rates, seed):
+    """Generate, load and reconcile one dataset; returns the case report."""
+    from benchmarks.sqlite_store import SQLiteStandIn
+    from app.recon.models import get_reconciliation_engine
+
+    started = time.perf_counter()
+    dataset = generate_dataset(rows, rates=rates, seed=seed)
+    generate_seconds = time.perf_counter() - started
+
+    store = SQLiteStandIn()
+    try:
+        started = time.perf_counter()
+        loaded = store.load(dataset)
+        load_seconds = time.perf_counter() - started
+
+        with store.installed():
+            engine = get_reconciliation_engine(backend)
+            results = engine.run_reconciliation()
+        profile = engine.profile.to_dict()
+    finally:
+        store.close()
+
+    input_rows = loaded['mpr'] + loaded['internal'] + loaded['bank']
+    return {
+        'rows': rows,
+        'backend': backend,
+        'input_rows': loaded,
+        'defects': dataset['stats'],
+        'results': len(results),
+        'generate_seconds': round(generate_seconds, 6),
+        'db_load_seconds': round(load_seconds, 6),
+        'total_seconds': profile['total_seconds'],
+        'rows_per_second': round(input_rows / profile['total_seconds'], 1)
+                           if profile['total_seconds'] else None,
+        'peak_rss_kb': profile['peak_rss_kb'],
+        'stages': profile['stages'],
+    }
+
+def _case_worker(connection, rows, backend, rates, seed):
+    try:
+        connection.send(('ok', run_case(rows, backend, rates, seed)))
+    except Exception as e:
+        connection.send(('error', f'{type(e).__name__}: {e}'))
+    finally:
+        connection.close()
+
+def run_isolated(rows, backend, rates, seed):
+    """Run one case in a fresh process so its peak RSS is its own."""
+    context = multiprocessing.get_context('spawn')
+    parent, child = context.Pipe(duplex=False)
+    process = context.Process(target=_case_worker, args=(child, rows, backend, rates, seed))
+    process.start()
+    child.close()
+    status, payload = parent.recv()
+    process.join()
+    if status != 'ok':
+        raise RuntimeError(f'{backend} at {rows} rows failed: {payload}')
+    return payload
+
+def compare(report, baseline, threshold):
+    """Return regression messages for cases slower than the baseline."""
+    previous = {(case['rows'], case['backend']): case for case in baseline['cases']}
+    regressions = []
+
+    for case in report['cases']:
+        before = previous.get((case['rows'], case['backend']))
+        if not before:
+            continue
+        checks = [('total', before['total_seconds'], case['total_seconds'])]
+        checks.extend(
+            (stage, before['stages'][stage]['seconds'], timings['seconds'])
+            for stage, timings in case['stages'].items() if stage in before['stages']
+        )
+        for name, old, new in checks:
+            # Sub-10ms stages are too noisy to gate on
+            if old >= 0.01 and new > old * (1 + threshold):
+                regressions.append(f"{case['backend']} @ {case['rows']} rows: {name} "
+                                   f"{old:.3f}s -> {new:.3f}s (+{(new / old - 1) * 100:.0f}%)")
+    return regressions
+
+def print_case(case):
+    print(f"{case['backend']:>11} {case['rows']:>9} rows  {case['total_seconds']:8.3f}s  "
+          f"{case['rows_per_second'] or 0:>11,.0f} rows/s  peak RSS {case['peak_rss_kb']} KB")
+    for stage, timings in case['stages'].items():
+        counters = ', '.join(f'{k}={v}' for k, v in timings.items() if k != 'seconds')
+        print(f"{'':>13}{stage:<10} {timings['seconds']:8.3f}s  {counters}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Reconciliation benchmark')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES,
+                        help='comma-separated settlement counts, e.g. 10k,100k,1M')
+    parser.add_argument('--backends', default='ROW', help='comma-separated backend names')
+    parser.add_argument('--seed', type=int, default=42)
+    for name, rate in DEFAULT_RATES.items():
+        parser.add_argument(f"--{name.replace('_', '-')}-rate", type=float, default=rate,
+                            dest=f'{name}_rate')
+    parser.add_argument('--output', help='result file (default: results/recon-<timestamp>.json)')
+    parser.add_argument('--baseline', help='earlier result file to compare against')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_REGRESSION_THRESHOLD)
+    parser.add_argument('--in-process', action='store_true',
+                        help='run cases in this process (peak RSS then accumulates)')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    rates = {name: getattr(args, f'{name}_rate') for name in DEFAULT_RATES}
+    runner = run_case if args.in_process else run_isolated
+
+    report = {
+        'created_at': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'seed': args.seed,
+        'rates': rates,
+        'cases': [],
+    }
+    for size in args.sizes.split(','):
+        for backend in args.backends.split(','):
+            case = runner(parse_size(size), backend.strip().upper(), rates, args.seed)
+            report['cases'].append(case)
+            print_case(case)
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"recon-{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as handle:
+        json.dump(report, handle, indent=2)
+    print(f'Results written to {output}')
+
+    if args.baseline:
+        with open(args.baseline) as handle:
+            regressions = compare(report, json.load(handle), args.threshold)
+        for message in regressions:
+            print(f'REGRESSION {message}')
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
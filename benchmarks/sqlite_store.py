@@ -0,0 +1,100 @@
+"""
+SQLite stand-in for the SQL Server database, for local benchmarks.
+
+Wraps a throwaway database file of the embedded SQLite dialect: the schema
+comes from supabase/migrations, and while installed every application query
+is rendered for SQLite and runs against it.
+"""
+import os
+import sqlite3
+import tempfile
+from contextlib import contextmanager
+from unittest import mock
+from config.dialects import SQLiteDialect
+from config.settings import Config
+
+class SQLiteStandIn:
+    """A throwaway SQLite database with the application schema."""
+
+    def __init__(self, path=None):
+        if path is None:
+            handle, path = tempfile.mkstemp(prefix='recon-bench-', suffix='.sqlite3')
+            os.close(handle)
+            os.unlink(path)
+            self._owned = True
+        else:
+            self._owned = False
+        self.path = path
+        SQLiteDialect(self.path).bootstrap()
+
+    @contextmanager
+    def installed(self):
+        """Route every application database call to this database."""
+        from config.database import reset_pool
+
+        reset_pool()
+        with mock.patch.object(Config, 'DATABASE_DIALECT', SQLiteDialect.name), \
+                mock.patch.object(Config, 'SQLITE_PATH', self.path):
+            try:
+                yield self
+            finally:
+                reset_pool()
+
+    def load(self, dataset, channel_ids=None):
+        """Insert a generated dataset as completed uploads; returns row counts."""
+        connection = sqlite3.connect(self.path)
+        cursor = connection.cursor()
+        channel_ids = channel_ids or dict(cursor.execute('SELECT name, id FROM channels'))
+        counts = {'mpr': 0, 'internal': 0, 'bank': 0}
+
+        for channel, rows in dataset['mpr'].items():
+            cursor.execute(
+                "INSERT INTO mpr_uploads (channel_id, filename, total_transactions, status) "
+                "VALUES (?, ?, ?, 'COMPLETED')",
+                (channel_ids[channel], f'bench_{channel}.csv', len(rows))
+            )
+            upload_id = cursor.lastrowid
+            cursor.executemany(
+                "INSERT INTO mpr_transactions (upload_id, utr, transaction_id, transaction_time, "
+                "reference_id, amount, settlement_account) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(upload_id, row['utr'], row['transaction_id'], row['transaction_time'],
+                  row['reference_id'], row['amount'], row['settlement_account']) for row in rows]
+            )
+            counts['mpr'] += len(rows)
+
+        cursor.execute(
+            "INSERT INTO internal_uploads (filename, total_transactions, status) "
+            "VALUES ('bench_internal.csv', ?, 'COMPLETED')", (len(dataset['internal']),)
+        )
+        upload_id = cursor.lastrowid
+        cursor.executemany(
+            "INSERT INTO internal_transactions (upload_id, transaction_id, transaction_time, "
+            "amount, reference_id) VALUES (?, ?, ?, ?, ?)",
+            [(upload_id, row['transaction_id'], row['transaction_time'], row['amount'],
+              row['reference_id']) for row in dataset['internal']]
+        )
+        counts['internal'] = len(dataset['internal'])
+
+        cursor.execute(
+            "INSERT INTO bank_statement_uploads (filename, status) "
+            "VALUES ('bench_bank.csv', 'COMPLETED')"
+        )
+        upload_id = cursor.lastrowid
+        cursor.executemany(
+            "INSERT INTO bank_transactions (upload_id, transaction_date, amount, utr, description) "
+            "VALUES (?, ?, ?, ?, ?)",
+            [(upload_id, row['transaction_date'], row['amount'], row['utr'], row['description'])
+             for row in dataset['bank']]
+        )
+        counts['bank'] = len(dataset['bank'])
+
+        connection.commit()
+        connection.close()
+        return counts
+
+    def close(self):
+        """Delete the database if this object created it."""
+        if self._owned:
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(self.path + suffix):
+                    os.unlink(self.path + suffix)
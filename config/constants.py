@@ -5,11 +5,45 @@ Application constants and configuration values.
 # File upload settings
 MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB
 ALLOWED_EXTENSIONS = {'csv', 'xlsx', 'xls'}
+UPLOAD_CHUNK_SIZE = 50000  # Rows read, mapped and inserted at a time when ingesting CSV files
+
+# Upload kinds, and the states of their background ingest jobs
+UPLOAD_KIND_MPR = 'mpr'
+UPLOAD_KIND_INTERNAL = 'internal'
+UPLOAD_KIND_BANK = 'bank_statement'
+INGEST_JOB_QUEUED = 'QUEUED'
+INGEST_JOB_RUNNING = 'RUNNING'
+INGEST_JOB_COMPLETED = 'COMPLETED'
+INGEST_JOB_FAILED = 'FAILED'
 
 # Reconciliation settings
 RECON_MATCH_TOLERANCE = 0.01  # Amount tolerance for matching
 DATE_TOLERANCE_DAYS = 1  # Date tolerance for matching
 
+# Reconciliation backends
+RECON_BACKEND_ROW = 'ROW'
+RECON_BACKEND_VECTORIZED = 'VECTORIZED'
+RECON_BACKEND_PARALLEL = 'PARALLEL'
+RECON_BACKEND_STREAMING = 'STREAMING'
+RECON_BACKENDS = (RECON_BACKEND_ROW, RECON_BACKEND_VECTORIZED, RECON_BACKEND_PARALLEL,
+                  RECON_BACKEND_STREAMING)
+# MPR plus internal rows below which the process pool costs more than it saves:
+# starting the pool and splitting and merging the shards took 0.2-1.2s per run,
+# more than even four workers save on passes of under about 100k rows
+RECON_PARALLEL_MIN_ROWS = 100000
+RECON_STREAM_CHUNK_SIZE = 5000  # Rows per fetch and per result write in streaming runs
+RECON_RESULT_BATCH_SIZE = 10000  # Result rows per executemany call
+
+# Reconciliation run modes (recorded in recon_run_history)
+RECON_MODE_FULL = 'FULL'
+RECON_MODE_INCREMENTAL = 'INCREMENTAL'
+
+# Reconciliation sources (keys of recon_watermarks)
+RECON_SOURCE_MPR = 'mpr_uploads'
+RECON_SOURCE_INTERNAL = 'internal_uploads'
+RECON_SOURCE_BANK = 'bank_statement_uploads'
+RECON_SOURCES = (RECON_SOURCE_MPR, RECON_SOURCE_INTERNAL, RECON_SOURCE_BANK)
+
 # Transaction statuses
 TRANSACTION_STATUS_PENDING = 'PENDING'
 TRANSACTION_STATUS_MATCHED = 'MATCHED'
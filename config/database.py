@@ -1,11 +1,16 @@
 """
 Database connection and utilities.
 """
-import pyodbc
 import logging
 import json
+import os
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
 from config.settings import Config
+from config.dialects import DIALECTS, SQLServerDialect, SQLiteDialect
+from config.query_stats import QueryStats, calling_module, fingerprint
 
 class JSONFormatter(logging.Formatter):
     """Custom JSON formatter for structured logging."""
@@ -24,6 +29,10 @@ class JSONFormatter(logging.Formatter):
             log_entry['user_id'] = record.user_id
         if hasattr(record, 'category'):
             log_entry['category'] = record.category
+        if hasattr(record, 'profile'):
+            log_entry['profile'] = record.profile
+        if hasattr(record, 'query'):
+            log_entry['query'] = record.query
             
         return json.dumps(log_entry)
 
@@ -43,46 +52,476 @@ def setup_logging():
     
     return logger
 
+_dialect = None
+_dialect_key = None
+_dialect_lock = threading.Lock()
+
+def get_dialect():
+    """Return the SQL dialect of the configured database."""
+    global _dialect, _dialect_key
+    config = Config()
+    name = config.DATABASE_DIALECT.lower()
+    if name not in DIALECTS:
+        raise ValueError(f"Unknown database dialect: {config.DATABASE_DIALECT}")
+    
+    key = (name, config.SQLITE_PATH if name == SQLiteDialect.name
+           else config.DATABASE_CONNECTION_STRING)
+    with _dialect_lock:
+        if _dialect_key != key:
+            if name == SQLiteDialect.name:
+                _dialect = SQLiteDialect(config.SQLITE_PATH)
+            else:
+                _dialect = SQLServerDialect(config.DATABASE_CONNECTION_STRING)
+            _dialect_key = key
+        return _dialect
+
+def open_connection():
+    """Open a new, unpooled database connection."""
+    return get_dialect().connect()
+
+class PooledConnection:
+    """
+    Connection borrowed from a ConnectionPool.
+    
+    Behaves like the underlying connection, except that close() hands it
+    back to the pool instead of closing it.
+    """
+    
+    def __init__(self, pool, connection):
+        self._pool = pool
+        self._connection = connection
+    
+    def close(self):
+        if self._connection is not None:
+            connection, self._connection = self._connection, None
+            self._pool.release(connection)
+    
+    def __getattr__(self, name):
+        if self._connection is None:
+            raise RuntimeError("connection has been returned to the pool")
+        return getattr(self._connection, name)
+
+class ConnectionPool:
+    """
+    Thread-safe pool of database connections.
+    
+    Idle connections are reused most-recently-returned first, so the spare
+    ones age out: any idle for longer than max_idle_seconds is closed on the
+    next checkout. With pre_ping, a connection is checked with SELECT 1 before
+    it is handed out and replaced if the server dropped it. When `size`
+    connections are in use, callers wait up to `timeout` seconds.
+    """
+    
+    def __init__(self, size, timeout=30, max_idle_seconds=300, pre_ping=True, connect=None):
+        self.size = size
+        self.timeout = timeout
+        self.max_idle_seconds = max_idle_seconds
+        self.pre_ping = pre_ping
+        self._connect = connect or (lambda: open_connection())
+        self._idle = []  # (connection, returned_at), most recent last
+        self._in_use = 0
+        self._condition = threading.Condition()
+        self._stats = {'created': 0, 'reused': 0, 'evicted_idle': 0, 'failed_pings': 0,
+                       'discarded': 0, 'waits': 0, 'timeouts': 0}
+    
+    def acquire(self):
+        """Borrow a connection, opening one if the pool has room."""
+        deadline = time.monotonic() + self.timeout
+        with self._condition:
+            self._evict_idle()
+            while not self._idle and self._in_use >= self.size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise TimeoutError(f"no database connection free after {self.timeout}s")
+                self._stats['waits'] += 1
+                self._condition.wait(remaining)
+                self._evict_idle()
+            
+            connection = self._idle.pop()[0] if self._idle else None
+            self._in_use += 1
+        
+        try:
+            if connection is not None and not self._ping(connection):
+                connection = None
+            if connection is None:
+                connection = self._connect()
+                self._count('created')
+            else:
+                self._count('reused')
+        except Exception:
+            with self._condition:
+                self._in_use -= 1
+                self._condition.notify()
+            raise
+        
+        return PooledConnection(self, connection)
+    
+    def release(self, connection):
+        """Take a connection back; anything left uncommitted is rolled back."""
+        try:
+            connection.rollback()
+            reusable = True
+        except Exception:
+            reusable = False
+        
+        with self._condition:
+            self._in_use -= 1
+            if reusable:
+                self._idle.append((connection, time.monotonic()))
+            else:
+                self._stats['discarded'] += 1
+            self._condition.notify()
+        
+        if not reusable:
+            self._close(connection)
+    
+    def metrics(self):
+        """Pool counters plus current in-use and idle connections."""
+        with self._condition:
+            return dict(self._stats, size=self.size, in_use=self._in_use, idle=len(self._idle))
+    
+    def close_all(self):
+        """Close every idle connection."""
+        with self._condition:
+            idle, self._idle = self._idle, []
+        for connection, _ in idle:
+            self._close(connection)
+    
+    def _evict_idle(self):
+        # Oldest returns sit at the front; called with the lock held
+        cutoff = time.monotonic() - self.max_idle_seconds
+        stale = 0
+        while stale < len(self._idle) and self._idle[stale][1] < cutoff:
+            stale += 1
+        if stale:
+            expired, self._idle = self._idle[:stale], self._idle[stale:]
+            self._stats['evicted_idle'] += stale
+            for connection, _ in expired:
+                self._close(connection)
+    
+    def _ping(self, connection):
+        if not self.pre_ping:
+            return True
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+            cursor.close()
+            return True
+        except Exception:
+            self._count('failed_pings')
+            self._close(connection)
+            return False
+    
+    def _count(self, name):
+        with self._condition:
+            self._stats[name] += 1
+    
+    def _close(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Return the process-wide connection pool, or None when pooling is disabled."""
+    global _pool, _pool_pid
+    if Config.DB_POOL_SIZE <= 0:
+        return None
+    
+    with _pool_lock:
+        # Connections must not be shared with forked worker processes
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ConnectionPool(
+                Config.DB_POOL_SIZE,
+                timeout=Config.DB_POOL_TIMEOUT,
+                max_idle_seconds=Config.DB_POOL_MAX_IDLE_SECONDS,
+                pre_ping=Config.DB_POOL_PRE_PING
+            )
+            _pool_pid = os.getpid()
+        return _pool
+
+def reset_pool():
+    """Close idle pooled connections and start a fresh pool on next use."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.close_all()
+
+def get_pool_metrics():
+    """Metrics of the connection pool, or None when pooling is disabled."""
+    pool = get_pool()
+    return pool.metrics() if pool else None
+
 def get_db_connection():
-    """Get database connection with error handling."""
+    """Get database connection (from the pool, when enabled) with error handling."""
     try:
-        config = Config()
-        connection = pyodbc.connect(config.DATABASE_CONNECTION_STRING)
-        return connection
+        pool = get_pool()
+        if pool is None:
+            return open_connection()
+        return pool.acquire()
     except Exception as e:
         logging.error(f"Database connection failed: {str(e)}", extra={'category': 'SYSTEM'})
         raise
 
+class UnitOfWork:
+    """
+    One connection and one transaction shared by every statement in a
+    `transaction()` block.
+    
+    execute_query, execute_insert and execute_many join the active unit on
+    the current thread instead of borrowing a connection and committing on
+    their own. The connection is borrowed by the first statement. A failed
+    statement marks the unit failed, so the block is rolled back even if
+    the caller caught the error.
+    """
+    
+    def __init__(self):
+        self.connection = None
+        self.failed = False
+    
+    def cursor(self):
+        if self.connection is None:
+            self.connection = get_db_connection()
+        return self.connection.cursor()
+
+_local = threading.local()
+
+def current_unit():
+    """Return the unit of work active on this thread, if any."""
+    return getattr(_local, 'unit', None)
+
+@contextmanager
+def transaction():
+    """
+    Run every statement in the block on one connection, with one commit.
+    
+    Nested blocks join the outer unit. The unit is rolled back if the block
+    raises or any statement in it failed.
+    """
+    unit = current_unit()
+    if unit is not None:
+        yield unit
+        return
+    
+    unit = UnitOfWork()
+    _local.unit = unit
+    try:
+        yield unit
+        if unit.failed:
+            raise RuntimeError("Transaction rolled back after a failed statement")
+        if unit.connection:
+            unit.connection.commit()
+    except BaseException:
+        if unit.connection:
+            unit.connection.rollback()
+        raise
+    finally:
+        _local.unit = None
+        if unit.connection:
+            unit.connection.close()
+
+@contextmanager
+def _cursor(commit=True):
+    """Cursor on the active unit of work, or on a borrowed connection committed on exit."""
+    unit = current_unit()
+    if unit is not None:
+        cursor = None
+        try:
+            cursor = unit.cursor()
+            yield cursor
+        except Exception:
+            unit.failed = True
+            raise
+        finally:
+            if cursor:
+                cursor.close()
+        return
+    
+    connection = None
+    cursor = None
+    try:
+        connection = get_db_connection()
+        cursor = connection.cursor()
+        yield cursor
+        if commit:
+            connection.commit()
+    except Exception:
+        if connection:
+            connection.rollback()
+        raise
+    finally:
+        if cursor:
+            cursor.close()
+        if connection:
+            connection.close()
+
+_query_stats = None
+_query_stats_lock = threading.Lock()
+
+def get_query_stats():
+    """Return the query statistics collector, or None when DB_QUERY_STATS is off."""
+    global _query_stats
+    if not Config.DB_QUERY_STATS:
+        return None
+    with _query_stats_lock:
+        if _query_stats is None:
+            _query_stats = QueryStats(Config.DB_QUERY_STATS_WINDOW)
+        return _query_stats
+
+def _record_query(query, seconds, rows=None):
+    """Add one statement to the statistics and log it if it was slow."""
+    stats = get_query_stats()
+    if stats is None:
+        return
+    statement = fingerprint(query)
+    caller = calling_module()
+    stats.record(statement, seconds, rows, caller)
+    
+    if seconds * 1000 >= Config.DB_SLOW_QUERY_MS:
+        logging.warning(f"Slow query: {seconds * 1000:.1f} ms in {caller}", extra={
+            'category': 'SYSTEM',
+            'query': {'statement': statement, 'duration_ms': round(seconds * 1000, 3),
+                      'rows': rows, 'caller': caller},
+        })
+
 def execute_query(query, params=None, fetch=False):
     """Execute database query with proper error handling."""
+    try:
+        with _cursor(commit=not fetch) as cursor:
+            started = time.perf_counter()
+            if params:
+                cursor.execute(query, params)
+            else:
+                cursor.execute(query)
+            
+            if fetch == 'one':
+                result = cursor.fetchone()
+                rows = 1 if result else 0
+            elif fetch:
+                result = cursor.fetchall()
+                rows = len(result)
+            else:
+                result = rows = cursor.rowcount
+            _record_query(query, time.perf_counter() - started, rows)
+            return result
+            
+    except Exception as e:
+        logging.error(f"Query execution failed: {str(e)}", extra={'category': 'SYSTEM'})
+        raise
+
+def stream_query(query, params=None, batch_size=None, row_factory=None):
+    """
+    Yield the rows of a query, fetching `batch_size` rows per round trip.
+    
+    Only one batch is held in memory at a time. `row_factory` is applied to
+    each row, e.g. `tuple` for plain tuples or a namedtuple's `_make` for
+    typed rows. The cursor and connection are released when the rows run
+    out, and also when the consumer stops early and closes the generator.
+    Streams always read on their own connection, outside any unit of work.
+    """
+    batch_size = batch_size or Config.DB_FETCH_BATCH_SIZE
+    seconds = 0.0
+    streamed = 0
     connection = None
     cursor = None
     try:
         connection = get_db_connection()
         cursor = connection.cursor()
         
+        # Only time spent in the database counts, not the consumer's work between batches
+        started = time.perf_counter()
         if params:
             cursor.execute(query, params)
         else:
             cursor.execute(query)
         
-        if fetch:
-            if fetch == 'one':
-                result = cursor.fetchone()
-            else:
-                result = cursor.fetchall()
-            return result
-        else:
-            connection.commit()
-            return cursor.rowcount
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            seconds += time.perf_counter() - started
+            if not rows:
+                break
+            streamed += len(rows)
+            if row_factory:
+                rows = [row_factory(row) for row in rows]
+            yield from rows
+            started = time.perf_counter()
+        
+        _record_query(query, seconds, streamed)
             
+    except GeneratorExit:
+        raise
     except Exception as e:
-        if connection:
-            connection.rollback()
-        logging.error(f"Query execution failed: {str(e)}", extra={'category': 'SYSTEM'})
+        logging.error(f"Streaming query failed: {str(e)}", extra={'category': 'SYSTEM'})
         raise
     finally:
         if cursor:
             cursor.close()
         if connection:
-            connection.close()
\ No newline at end of file
+            connection.close()
+
+def execute_insert(query, params=None, id_column='id'):
+    """
+    Execute an INSERT and return the identity of the new row.
+    
+    The identity comes back from the INSERT itself (OUTPUT INSERTED /
+    RETURNING), so no follow-up lookup is needed.
+    """
+    try:
+        with _cursor() as cursor:
+            query = get_dialect().returning_id(query, id_column)
+            started = time.perf_counter()
+            if params:
+                cursor.execute(query, params)
+            else:
+                cursor.execute(query)
+            
+            row = cursor.fetchone()
+            _record_query(query, time.perf_counter() - started, 1)
+            return row[0] if row else None
+            
+    except Exception as e:
+        logging.error(f"Insert execution failed: {str(e)}", extra={'category': 'SYSTEM'})
+        raise
+
+def execute_many(statements, batch_size=None):
+    """
+    Execute parameterised statements as one transaction.
+    
+    `statements` is a sequence of (query, rows) pairs, or (query, rows, types)
+    triples where `types` names the SQL type of each parameter (e.g.
+    'NVARCHAR(100)'), run in order with executemany. pyodbc's fast_executemany
+    sends each batch of `batch_size` rows in a single round trip, with its
+    parameter buffers sized from `types` when given. Everything is rolled
+    back if any statement fails.
+    """
+    try:
+        dialect = get_dialect()
+        with _cursor() as cursor:
+            if hasattr(cursor, 'fast_executemany'):
+                cursor.fast_executemany = True
+            
+            total = 0
+            for query, rows, *types in statements:
+                rows = list(rows)
+                sizes = dialect.input_sizes(types[0]) if types and types[0] else None
+                step = batch_size or len(rows)
+                started = time.perf_counter()
+                for start in range(0, len(rows), step or 1):
+                    if sizes:
+                        cursor.setinputsizes(sizes)
+                    cursor.executemany(query, rows[start:start + step])
+                if rows:
+                    _record_query(query, time.perf_counter() - started, len(rows))
+                total += len(rows)
+            return total
+            
+    except Exception as e:
+        logging.error(f"Batch execution failed: {str(e)}", extra={'category': 'SYSTEM'})
+        raise
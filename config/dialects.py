@@ -0,0 +1,229 @@
+"""
+SQL dialects supported by the database layer.
+
+Queries are written once with the dialect rendering the parts that differ:
+pagination, identity retrieval and current-time functions. SQL Server is the
+production database; SQLite is an embedded stand-in for local runs,
+benchmarks and load tests, bootstrapped from the same migrations.
+"""
+import glob
+import os
+import re
+import sqlite3
+import threading
+from datetime import date, timedelta
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                              'supabase', 'migrations')
+
+def migration_scripts():
+    """Paths of the schema migrations in the order they apply."""
+    return sorted(glob.glob(os.path.join(MIGRATIONS_DIR, '*.sql')))
+
+def day_range(first_day, last_day):
+    """
+    Half-open [start, end) bounds covering whole days, as ISO date strings.
+
+    `time >= start AND time < end` can seek an index on the time column,
+    unlike truncating every row to a date. Either day may be None to leave
+    that side open.
+    """
+    start = str(first_day)[:10] if first_day else None
+    end = (date.fromisoformat(str(last_day)[:10]) + timedelta(days=1)).isoformat() \
+        if last_day else None
+    return start, end
+
+class Dialect:
+    """SQL rendering and connection details for one database engine."""
+
+    name = None
+
+    def connect(self):
+        """Open a new DB-API connection."""
+        raise NotImplementedError
+
+    def now(self):
+        """Current UTC timestamp."""
+        raise NotImplementedError
+
+    def days_ago(self):
+        """Timestamp a number of days before now; takes the day count as one parameter."""
+        raise NotImplementedError
+
+    def paginate(self, limit, offset=0):
+        """Clause that follows ORDER BY to return one page of rows."""
+        raise NotImplementedError
+
+    def returning_id(self, query, column='id'):
+        """Rewrite an INSERT so executing it returns the new row's identity."""
+        raise NotImplementedError
+
+    def translate_ddl(self, script):
+        """Rewrite a migration script for this engine."""
+        return script
+
+    def input_sizes(self, types):
+        """
+        Driver parameter types for executemany, from SQL type names such as
+        'NVARCHAR(100)' or 'DECIMAL(18,2)'; None leaves the driver to infer them.
+        """
+        return None
+
+    def is_unique_violation(self, error):
+        """Whether a driver error was raised by a unique index or key."""
+        return False
+
+class SQLServerDialect(Dialect):
+    name = 'mssql'
+
+    VALUES_CLAUSE = re.compile(r'\)\s*VALUES\b', re.I)
+    SQL_TYPE = re.compile(r'^\s*(\w+)\s*(?:\(\s*(\d+)\s*(?:,\s*(\d+)\s*)?\))?\s*$')
+
+    # pyodbc SQL type constants by T-SQL type name
+    PARAMETER_TYPES = {
+        'INT': 'SQL_INTEGER',
+        'BIGINT': 'SQL_BIGINT',
+        'NVARCHAR': 'SQL_WVARCHAR',
+        'VARCHAR': 'SQL_VARCHAR',
+        'DECIMAL': 'SQL_DECIMAL',
+        'FLOAT': 'SQL_DOUBLE',
+        'DATETIME2': 'SQL_TYPE_TIMESTAMP',
+        'BINARY': 'SQL_BINARY',
+        'BIT': 'SQL_BIT',
+    }
+
+    # Native errors for a duplicate key in a unique index and in a unique constraint
+    UNIQUE_VIOLATIONS = ('(2601)', '(2627)')
+
+    def __init__(self, connection_string):
+        self.connection_string = connection_string
+
+    def connect(self):
+        import pyodbc
+        return pyodbc.connect(self.connection_string)
+
+    def now(self):
+        return "GETUTCDATE()"
+
+    def days_ago(self):
+        return "DATEADD(day, -?, GETUTCDATE())"
+
+    def paginate(self, limit, offset=0):
+        return f"OFFSET {int(offset)} ROWS FETCH NEXT {int(limit)} ROWS ONLY"
+
+    def returning_id(self, query, column='id'):
+        rewritten, count = self.VALUES_CLAUSE.subn(f') OUTPUT INSERTED.{column} VALUES', query, 1)
+        if not count:
+            raise ValueError("INSERT needs a column list to return its identity")
+        return rewritten
+
+    def input_sizes(self, types):
+        # fast_executemany otherwise sizes its parameter buffers from the first
+        # row, and has to re-bind when a later row holds a longer value
+        import pyodbc
+        sizes = []
+        for sql_type in types:
+            match = self.SQL_TYPE.match(sql_type)
+            if not match or match.group(1).upper() not in self.PARAMETER_TYPES:
+                raise ValueError(f"Unsupported parameter type: {sql_type}")
+            name, size, scale = match.groups()
+            sizes.append((getattr(pyodbc, self.PARAMETER_TYPES[name.upper()]),
+                          int(size or 0), int(scale or 0)))
+        return sizes
+
+    def is_unique_violation(self, error):
+        # pyodbc reports the native error number at the end of the message
+        return any(code in str(error) for code in self.UNIQUE_VIOLATIONS)
+
+class SQLiteDialect(Dialect):
+    """
+    Embedded SQLite database at `path`.
+
+    A new database file is created from the migrations on first connect.
+    WAL mode lets the streaming backend read while results are written.
+    """
+
+    name = 'sqlite'
+
+    # (pattern, replacement) pairs for the T-SQL constructs the migrations use
+    DDL_REWRITES = [
+        (re.compile(r'\bINT\s+IDENTITY\s*\(\s*1\s*,\s*1\s*\)\s+PRIMARY\s+KEY', re.I),
+         'INTEGER PRIMARY KEY AUTOINCREMENT'),
+        (re.compile(r'\(\s*MAX\s*\)', re.I), ''),
+        (re.compile(r'\bGETUTCDATE\s*\(\s*\)', re.I), 'CURRENT_TIMESTAMP'),
+        (re.compile(r'\bALTER\s+TABLE\s+(\w+)\s+ADD\s+(?!COLUMN\b)', re.I),
+         r'ALTER TABLE \1 ADD COLUMN '),
+        # Persisted computed date columns become generated columns
+        (re.compile(r'\b(\w+)\s+AS\s+CAST\s*\(\s*(\w+)\s+AS\s+DATE\s*\)\s+PERSISTED', re.I),
+         r'\1 DATE GENERATED ALWAYS AS (DATE(\2)) VIRTUAL'),
+        # Included columns become trailing key columns, which covers the same reads
+        (re.compile(r'\)\s*INCLUDE\s*\(([^)]*)\)', re.I), r', \1)'),
+        (re.compile(r'\bDROP\s+INDEX\s+(\w+)\s+ON\s+\w+', re.I), r'DROP INDEX \1'),
+    ]
+
+    def __init__(self, path):
+        self.path = path
+        self._bootstrapped = False
+        self._lock = threading.Lock()
+
+    def connect(self):
+        self._ensure_schema()
+        # Pooled connections may be borrowed by any thread
+        connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def now(self):
+        return "CURRENT_TIMESTAMP"
+
+    def days_ago(self):
+        # Stored transaction times are ISO-8601 strings with a 'T' separator
+        return "strftime('%Y-%m-%dT%H:%M:%S', 'now', '-' || ? || ' days')"
+
+    def paginate(self, limit, offset=0):
+        return f"LIMIT {int(limit)} OFFSET {int(offset)}"
+
+    def returning_id(self, query, column='id'):
+        return f"{query.rstrip().rstrip(';')} RETURNING {column}"
+
+    def is_unique_violation(self, error):
+        return isinstance(error, sqlite3.IntegrityError) and 'UNIQUE constraint failed' in str(error)
+
+    def translate_ddl(self, script):
+        for pattern, replacement in self.DDL_REWRITES:
+            script = pattern.sub(replacement, script)
+        return script
+
+    def bootstrap(self):
+        """Create the schema by applying every migration to the database file."""
+        connection = sqlite3.connect(self.path)
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            for script in migration_scripts():
+                with open(script) as handle:
+                    connection.executescript(self.translate_ddl(handle.read()))
+            connection.commit()
+        finally:
+            connection.close()
+
+    def _ensure_schema(self):
+        if self._bootstrapped:
+            return
+        with self._lock:
+            if self._bootstrapped:
+                return
+            connection = sqlite3.connect(self.path)
+            try:
+                exists = connection.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'users'"
+                ).fetchone()
+            finally:
+                connection.close()
+            if not exists:
+                self.bootstrap()
+            self._bootstrapped = True
+
+DIALECTS = {
+    SQLServerDialect.name: SQLServerDialect,
+    SQLiteDialect.name: SQLiteDialect,
+}
@@ -0,0 +1,96 @@
+"""
+Per-statement latency statistics for the database layer.
+
+Statements are grouped by fingerprint: the SQL with literals replaced by
+placeholders and whitespace collapsed, so the same query with different
+values is counted once. Each fingerprint keeps totals and a rolling window
+of recent durations for percentiles.
+"""
+import math
+import re
+import sys
+import threading
+from collections import deque
+
+_STRING_LITERAL = re.compile(r"N?'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)+\s*\)', re.I)
+_WHITESPACE = re.compile(r'\s+')
+
+# Frames inside these modules are skipped when finding who issued a query
+_DB_MODULES = ('config.database', 'config.query_stats', 'contextlib')
+
+def fingerprint(query):
+    """Normalise a statement so queries differing only in literals compare equal."""
+    query = _STRING_LITERAL.sub('?', query)
+    query = _NUMBER_LITERAL.sub('?', query)
+    query = _IN_LIST.sub('IN (?...)', query)
+    return _WHITESPACE.sub(' ', query).strip()
+
+def calling_module(depth=1):
+    """Name of the first module outside the database layer on the call stack."""
+    frame = sys._getframe(depth)
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '')
+        if module not in _DB_MODULES:
+            return module
+        frame = frame.f_back
+    return None
+
+def _percentile(ordered, fraction):
+    # Nearest-rank percentile of an already sorted list
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+class QueryStats:
+    """Thread-safe latency statistics keyed by statement fingerprint."""
+
+    def __init__(self, window=1000):
+        self.window = window
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, statement, seconds, rows=None, caller=None):
+        """Add one execution of a fingerprinted statement."""
+        with self._lock:
+            entry = self._stats.get(statement)
+            if entry is None:
+                entry = self._stats[statement] = {
+                    'count': 0, 'total_seconds': 0.0, 'max_seconds': 0.0,
+                    'rows': 0, 'callers': set(), 'recent': deque(maxlen=self.window),
+                }
+            entry['count'] += 1
+            entry['total_seconds'] += seconds
+            entry['max_seconds'] = max(entry['max_seconds'], seconds)
+            entry['rows'] += rows or 0
+            if caller:
+                entry['callers'].add(caller)
+            entry['recent'].append(seconds)
+
+    def snapshot(self, limit=None):
+        """Per-fingerprint statistics, the most total time first."""
+        with self._lock:
+            entries = [(statement, dict(entry, recent=sorted(entry['recent']),
+                                        callers=sorted(entry['callers'])))
+                       for statement, entry in self._stats.items()]
+
+        report = []
+        for statement, entry in entries:
+            recent = entry['recent']
+            report.append({
+                'statement': statement,
+                'count': entry['count'],
+                'total_ms': round(entry['total_seconds'] * 1000, 3),
+                'mean_ms': round(entry['total_seconds'] * 1000 / entry['count'], 3),
+                'max_ms': round(entry['max_seconds'] * 1000, 3),
+                'p50_ms': round(_percentile(recent, 0.50) * 1000, 3),
+                'p95_ms': round(_percentile(recent, 0.95) * 1000, 3),
+                'p99_ms': round(_percentile(recent, 0.99) * 1000, 3),
+                'rows': entry['rows'],
+                'callers': entry['callers'],
+            })
+        report.sort(key=lambda item: item['total_ms'], reverse=True)
+        return report[:limit] if limit else report
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
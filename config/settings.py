@@ -10,18 +10,52 @@ class Config:
     SECRET_KEY = os.environ.get('FLASK_SECRET_KEY') or 'dev-secret-key'
     
     # Database configuration
+    DATABASE_DIALECT = os.environ.get('DATABASE_DIALECT', 'mssql')  # mssql or sqlite
+    SQLITE_PATH = os.environ.get('SQLITE_PATH', 'collection_recon.sqlite3')
     DATABASE_SERVER = os.environ.get('DATABASE_SERVER', 'localhost')
     DATABASE_NAME = os.environ.get('DATABASE_NAME', 'collection_recon')
     DATABASE_USER = os.environ.get('DATABASE_USER', 'sa')
     DATABASE_PASSWORD = os.environ.get('DATABASE_PASSWORD', '')
     
+    # Connection pool (DB_POOL_SIZE=0 opens a connection per query)
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 30))
+    DB_POOL_MAX_IDLE_SECONDS = float(os.environ.get('DB_POOL_MAX_IDLE_SECONDS', 300))
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'true').lower() == 'true'
+    
+    # Rows fetched per round trip by stream_query
+    DB_FETCH_BATCH_SIZE = int(os.environ.get('DB_FETCH_BATCH_SIZE', 5000))
+    
+    # Rows per executemany call when bulk-loading uploaded transactions
+    DB_INSERT_BATCH_SIZE = int(os.environ.get('DB_INSERT_BATCH_SIZE', 10000))
+    
+    # Per-statement latency statistics, and the threshold for logging slow statements
+    DB_QUERY_STATS = os.environ.get('DB_QUERY_STATS', 'false').lower() == 'true'
+    DB_QUERY_STATS_WINDOW = int(os.environ.get('DB_QUERY_STATS_WINDOW', 1000))
+    DB_SLOW_QUERY_MS = float(os.environ.get('DB_SLOW_QUERY_MS', 500))
+    
     # Authentication
     AUTH_USERNAME = os.environ.get('AUTH_USERNAME', 'admin')
     AUTH_PASSWORD = os.environ.get('AUTH_PASSWORD', 'admin123')
     
+    # Reconciliation
+    RECON_BACKEND = os.environ.get('RECON_BACKEND', 'ROW')
+    RECON_WORKERS = int(os.environ.get('RECON_WORKERS', os.cpu_count() or 1))
+    RECON_VERIFY_ANOMALIES = os.environ.get('RECON_VERIFY_ANOMALIES', 'false').lower() == 'true'
+    
     # File upload
     UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', 'app/static/uploads')
     
+    # Background ingestion: uploads are saved and queued, then parsed and stored
+    # by a local worker pool (UPLOAD_ASYNC=false processes them inside the request)
+    UPLOAD_ASYNC = os.environ.get('UPLOAD_ASYNC', 'true').lower() == 'true'
+    UPLOAD_WORKERS = int(os.environ.get('UPLOAD_WORKERS', 2))
+    UPLOAD_JOB_HISTORY = int(os.environ.get('UPLOAD_JOB_HISTORY', 200))  # Finished jobs kept for the status API
+    
+    # Bloom filter of stored MPR fingerprints, sized for this many rows at this false-positive rate
+    UPLOAD_DEDUPE_CAPACITY = int(os.environ.get('UPLOAD_DEDUPE_CAPACITY', 5000000))
+    UPLOAD_DEDUPE_ERROR_RATE = float(os.environ.get('UPLOAD_DEDUPE_ERROR_RATE', 0.01))
+    
     @property
     def DATABASE_CONNECTION_STRING(self):
         return (
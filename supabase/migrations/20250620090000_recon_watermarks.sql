@@ -0,0 +1,25 @@
+-- Collection Reconciliation System - Incremental reconciliation
+-- Tracks the last upload each source contributed to a reconciliation run
+
+-- Upload status is read by the reconciliation loaders for every source
+ALTER TABLE internal_uploads ADD status NVARCHAR(20) DEFAULT 'PENDING';
+ALTER TABLE bank_statement_uploads ADD status NVARCHAR(20) DEFAULT 'PENDING';
+
+-- High-water marks per upload source
+CREATE TABLE recon_watermarks (
+    source NVARCHAR(50) PRIMARY KEY,
+    last_upload_id INT NOT NULL DEFAULT 0,
+    updated_at DATETIME2 DEFAULT GETUTCDATE()
+);
+
+INSERT INTO recon_watermarks (source, last_upload_id) VALUES
+('mpr_uploads', 0),
+('internal_uploads', 0),
+('bank_statement_uploads', 0);
+
+-- Open-pool lookups probe results by transaction and bank credit
+CREATE INDEX IX_reconciliation_results_mpr_transaction_id ON reconciliation_results(mpr_transaction_id);
+CREATE INDEX IX_reconciliation_results_internal_transaction_id ON reconciliation_results(internal_transaction_id);
+CREATE INDEX IX_reconciliation_results_bank_transaction_id ON reconciliation_results(bank_transaction_id);
+CREATE INDEX IX_internal_transactions_upload_id ON internal_transactions(upload_id);
+CREATE INDEX IX_bank_transactions_upload_id ON bank_transactions(upload_id);
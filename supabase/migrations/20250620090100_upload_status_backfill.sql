@@ -0,0 +1,7 @@
+-- Collection Reconciliation System - Upload status backfill
+-- Uploads stored before internal and bank uploads had a status were complete
+-- when they were written; adding the column left them NULL, which the
+-- reconciliation loaders (u.status = 'COMPLETED') would skip
+
+UPDATE internal_uploads SET status = 'COMPLETED' WHERE status IS NULL;
+UPDATE bank_statement_uploads SET status = 'COMPLETED' WHERE status IS NULL;
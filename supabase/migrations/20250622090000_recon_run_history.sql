@@ -0,0 +1,17 @@
+-- Collection Reconciliation System - Reconciliation run history
+-- One row per run with its per-stage profile
+
+CREATE TABLE recon_run_history (
+    id INT IDENTITY(1,1) PRIMARY KEY,
+    backend NVARCHAR(20) NOT NULL,
+    mode NVARCHAR(20) NOT NULL,
+    date_filter NVARCHAR(10),
+    started_at DATETIME2 NOT NULL,
+    total_seconds FLOAT NOT NULL,
+    results INT NOT NULL DEFAULT 0,
+    peak_rss_kb BIGINT,
+    profile NVARCHAR(MAX),  -- JSON: stage -> {seconds, counters...}
+    created_at DATETIME2 DEFAULT GETUTCDATE()
+);
+
+CREATE INDEX IX_recon_run_history_started_at ON recon_run_history(started_at);
@@ -0,0 +1,25 @@
+-- Collection Reconciliation System - Query performance
+-- Date filters are half-open ranges on the raw time columns, so they can seek
+-- these indexes; persisted date columns serve the per-day analytics groupings
+
+-- Calendar day of each transaction, computed once on write instead of per query
+ALTER TABLE mpr_transactions ADD transaction_day AS CAST(transaction_time AS DATE) PERSISTED;
+ALTER TABLE internal_transactions ADD transaction_day AS CAST(transaction_time AS DATE) PERSISTED;
+ALTER TABLE bank_transactions ADD transaction_day AS CAST(transaction_date AS DATE) PERSISTED;
+
+-- Date-filtered recon loads, streaming runs and analytics reports
+CREATE INDEX IX_mpr_transactions_transaction_time ON mpr_transactions(transaction_time)
+    INCLUDE (upload_id, transaction_id, amount, utr, reference_id);
+CREATE INDEX IX_internal_transactions_transaction_time ON internal_transactions(transaction_time)
+    INCLUDE (upload_id, transaction_id, amount);
+CREATE INDEX IX_bank_transactions_transaction_date ON bank_transactions(transaction_date)
+    INCLUDE (upload_id, amount, utr);
+
+-- Results joined to MPR rows by the analytics reports read status and anomaly type
+DROP INDEX IX_reconciliation_results_mpr_transaction_id ON reconciliation_results;
+CREATE INDEX IX_reconciliation_results_mpr_transaction_id ON reconciliation_results(mpr_transaction_id)
+    INCLUDE (internal_transaction_id, bank_transaction_id, status, anomaly_type);
+
+-- Per-day summaries and clearing a day's results
+CREATE INDEX IX_reconciliation_results_created_at ON reconciliation_results(created_at)
+    INCLUDE (status, anomaly_type);
@@ -0,0 +1,14 @@
+-- Collection Reconciliation System - Upload file hashes
+-- SHA-256 of each uploaded file, so a file already stored is not ingested again
+
+ALTER TABLE mpr_uploads ADD file_hash CHAR(64) NULL;
+ALTER TABLE internal_uploads ADD file_hash CHAR(64) NULL;
+ALTER TABLE bank_statement_uploads ADD file_hash CHAR(64) NULL;
+
+-- One stored upload per file content; uploads made before hashing have none
+CREATE UNIQUE INDEX UX_mpr_uploads_file_hash ON mpr_uploads(file_hash)
+    WHERE file_hash IS NOT NULL;
+CREATE UNIQUE INDEX UX_internal_uploads_file_hash ON internal_uploads(file_hash)
+    WHERE file_hash IS NOT NULL;
+CREATE UNIQUE INDEX UX_bank_statement_uploads_file_hash ON bank_statement_uploads(file_hash)
+    WHERE file_hash IS NOT NULL;
@@ -0,0 +1,19 @@
+-- Collection Reconciliation System - MPR transaction fingerprints
+-- Hash of channel, transaction ID, amount and UTR, written at ingest; rows whose
+-- fingerprint was already stored are kept but flagged as duplicates
+
+ALTER TABLE mpr_transactions ADD fingerprint BINARY(16) NULL;
+ALTER TABLE mpr_transactions ADD is_duplicate BIT NOT NULL DEFAULT 0;
+
+-- One original per fingerprint; rows loaded before fingerprinting have none
+CREATE UNIQUE INDEX UX_mpr_transactions_fingerprint ON mpr_transactions(fingerprint)
+    WHERE fingerprint IS NOT NULL AND is_duplicate = 0;
+
+-- Duplicates are read per upload by reconciliation
+CREATE INDEX IX_mpr_transactions_duplicates ON mpr_transactions(upload_id)
+    WHERE is_duplicate = 1;
+
+-- Recon loaders skip duplicates, so the time index must carry the flag to stay covering
+DROP INDEX IX_mpr_transactions_transaction_time ON mpr_transactions;
+CREATE INDEX IX_mpr_transactions_transaction_time ON mpr_transactions(transaction_time)
+    INCLUDE (upload_id, transaction_id, amount, utr, reference_id, is_duplicate);
@@ -0,0 +1,5 @@
+-- Collection Reconciliation System - Channel workbook layout
+-- Which worksheet an Excel MPR is read from, and the row holding its column names
+
+ALTER TABLE channel_configs ADD sheet_name NVARCHAR(100) NULL;
+ALTER TABLE channel_configs ADD header_row INT NOT NULL DEFAULT 1;
@@ -0,0 +1,19 @@
+"""
+Shared test fixtures.
+"""
+import pytest
+
+@pytest.fixture
+def sqlite_db(monkeypatch, tmp_path):
+    """Point the database layer at a fresh SQLite file for one test; yields config.database."""
+    import config.database as database
+    from config.settings import Config
+    from app.uploads.fingerprints import reset_fingerprint_index
+    monkeypatch.setattr(Config, 'DATABASE_DIALECT', 'sqlite')
+    monkeypatch.setattr(Config, 'SQLITE_PATH', str(tmp_path / 'test.sqlite3'))
+    database.reset_pool()
+    # The fingerprint filter caches rows of whichever database it last read
+    reset_fingerprint_index()
+    yield database
+    reset_fingerprint_index()
+    database.reset_pool()
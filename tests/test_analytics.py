@@ -211,4 +211,14 @@ def test_analytics_models_error_handling():
     trends = ChannelAnalytics.get_channel_trends(
         channel_id='invalid', days=30
     )
-    assert isinstance(trends, list)  # Should handle gracefully
\ No newline at end of file
+    assert isinstance(trends, list)  # Should handle gracefully
+
+def test_report_exporter_streams_csv_lines():
+    """Test ReportExporter.iter_csv_data yields the header, then one line per transaction."""
+    transactions = ({'transaction_id': f'TXN{n:03d}', 'amount': 10.0} for n in range(3))
+    
+    lines = list(ReportExporter.iter_csv_data(transactions))
+    
+    assert len(lines) == 4
+    assert lines[0].startswith('Transaction ID,Amount')
+    assert lines[3].startswith('TXN002,10.0')
@@ -0,0 +1,56 @@
+"""
+Benchmark harness tests.
+"""
+from benchmarks.datagen import generate_dataset, parse_size, write_channel_files
+from benchmarks.recon_bench import compare, run_case
+
+def test_parse_size_accepts_suffixes():
+    """Test row counts accept k and M suffixes."""
+    assert parse_size('10k') == 10000
+    assert parse_size('1M') == 1000000
+    assert parse_size(250) == 250
+
+def test_generate_dataset_is_deterministic_and_injects_defects():
+    """Test the same seed gives the same dataset with the requested defects."""
+    rates = {'mismatch': 0.1, 'missing': 0.1, 'duplicate': 0.1, 'date_skew': 0.1, 'id_drift': 0.1}
+    first = generate_dataset(500, rates=rates, seed=7)
+    second = generate_dataset(500, rates=rates, seed=7)
+    
+    assert first == second
+    assert sum(len(rows) for rows in first['mpr'].values()) == 500 + first['stats']['duplicate']
+    assert all(count > 0 for count in first['stats'].values())
+
+def test_write_channel_files_uses_channel_layouts(tmp_path):
+    """Test each channel's MPR file is written with its own headers."""
+    mappings = write_channel_files(generate_dataset(50, seed=1), str(tmp_path))
+    
+    header = (tmp_path / 'mpr_bbps.csv').read_text().splitlines()[0]
+    assert header.split(',')[0] == mappings['BBPS']['transaction_id'] == 'BBPS Txn Ref'
+    assert (tmp_path / 'internal.csv').exists() and (tmp_path / 'bank.csv').exists()
+
+def test_run_case_reconciles_end_to_end_on_sqlite():
+    """Test a small case runs the engine against the SQLite stand-in."""
+    case = run_case(300, 'ROW', None, seed=3)
+    
+    assert case['input_rows']['mpr'] >= 300
+    assert case['results'] > 0
+    assert {'load', 'exact', 'fuzzy', 'bank', 'anomalies', 'write'} <= set(case['stages'])
+
+def test_run_case_vectorized_reports_the_row_engine_counts():
+    """Test the vectorized case reconciles to the same matches as the row case."""
+    row = run_case(300, 'ROW', None, seed=3)
+    vectorized = run_case(300, 'VECTORIZED', None, seed=3)
+
+    assert vectorized['results'] == row['results']
+    for stage in ('exact', 'fuzzy'):
+        assert vectorized['stages'][stage]['matches'] == row['stages'][stage]['matches']
+
+def test_compare_flags_regressions_over_threshold():
+    """Test cases slower than the baseline beyond the threshold are reported."""
+    baseline = {'cases': [{'rows': 10, 'backend': 'ROW', 'total_seconds': 1.0,
+                           'stages': {'write': {'seconds': 0.5}}}]}
+    current = {'cases': [{'rows': 10, 'backend': 'ROW', 'total_seconds': 1.1,
+                          'stages': {'write': {'seconds': 0.9}}}]}
+    
+    regressions = compare(current, baseline, 0.2)
+    assert len(regressions) == 1 and 'write' in regressions[0]
@@ -0,0 +1,402 @@
+"""
+Database utility tests.
+"""
+import json
+import threading
+import pytest
+from config.database import ConnectionPool
+
+class FakeConnection:
+    def __init__(self, alive=True):
+        self.alive = alive
+        self.closed = False
+        self.rollbacks = 0
+    
+    def cursor(self):
+        if not self.alive:
+            raise RuntimeError("server went away")
+        return self
+    
+    def execute(self, query):
+        pass
+    
+    def fetchall(self):
+        return [(1,)]
+    
+    def rollback(self):
+        self.rollbacks += 1
+    
+    def close(self):
+        self.closed = True
+
+def test_pool_reuses_returned_connections():
+    """Test closing a pooled connection returns it for reuse."""
+    opened = []
+    pool = ConnectionPool(2, connect=lambda: opened.append(FakeConnection()) or opened[-1])
+    
+    first = pool.acquire()
+    first.close()
+    second = pool.acquire()
+    
+    assert len(opened) == 1
+    assert second._connection is opened[0] and opened[0].rollbacks == 1
+    assert pool.metrics()['reused'] == 1 and pool.metrics()['in_use'] == 1
+
+def test_pool_replaces_connections_that_fail_pre_ping():
+    """Test a dead idle connection is dropped and a new one opened."""
+    opened = []
+    pool = ConnectionPool(1, connect=lambda: opened.append(FakeConnection()) or opened[-1])
+    
+    pool.acquire().close()
+    opened[0].alive = False
+    connection = pool.acquire()
+    
+    assert connection._connection is opened[1] and opened[0].closed
+    assert pool.metrics()['failed_pings'] == 1
+
+def test_pool_evicts_idle_connections():
+    """Test connections idle past max_idle_seconds are closed."""
+    opened = []
+    pool = ConnectionPool(1, max_idle_seconds=0,
+                          connect=lambda: opened.append(FakeConnection()) or opened[-1])
+    
+    pool.acquire().close()
+    pool.acquire()
+    
+    assert opened[0].closed and len(opened) == 2
+    assert pool.metrics()['evicted_idle'] == 1
+
+def test_pool_waits_for_a_free_connection_and_times_out():
+    """Test a full pool blocks borrowers until a connection comes back."""
+    pool = ConnectionPool(1, timeout=0.05, connect=FakeConnection)
+    held = pool.acquire()
+    
+    with pytest.raises(TimeoutError):
+        pool.acquire()
+    
+    threading.Timer(0.01, held.close).start()
+    pool.timeout = 5
+    assert pool.acquire() is not None
+    assert pool.metrics()['timeouts'] == 1 and pool.metrics()['waits'] >= 1
+
+def test_get_db_connection_borrows_from_pool(monkeypatch):
+    """Test get_db_connection goes through the pool and closing returns the connection."""
+    import config.database as database
+    opened = []
+    monkeypatch.setattr(database, 'open_connection',
+                        lambda: opened.append(FakeConnection()) or opened[-1])
+    database.reset_pool()
+    try:
+        database.get_db_connection().close()
+        database.get_db_connection().close()
+        assert len(opened) == 1
+        assert database.get_pool_metrics()['reused'] == 1
+    finally:
+        database.reset_pool()
+
+def test_dialects_render_pagination_and_timestamps():
+    """Test each dialect renders the constructs queries delegate to it."""
+    from config.dialects import SQLServerDialect, SQLiteDialect
+    mssql = SQLServerDialect('DSN=test')
+    sqlite = SQLiteDialect(':memory:')
+    
+    assert mssql.paginate(50, 100) == 'OFFSET 100 ROWS FETCH NEXT 50 ROWS ONLY'
+    assert sqlite.paginate(50, 100) == 'LIMIT 50 OFFSET 100'
+    assert mssql.now() == 'GETUTCDATE()'
+    assert sqlite.now() == 'CURRENT_TIMESTAMP'
+
+def test_dialects_recognise_unique_violations():
+    """Test duplicate-key errors are told apart from other driver errors."""
+    import sqlite3
+    from config.dialects import SQLServerDialect, SQLiteDialect
+    mssql = SQLServerDialect('DSN=test')
+    sqlite = SQLiteDialect(':memory:')
+    
+    assert mssql.is_unique_violation(Exception(
+        '23000', "[23000] Cannot insert duplicate key row in object 'dbo.mpr_uploads' (2601)"))
+    assert not mssql.is_unique_violation(Exception('HYT00', '[HYT00] Query timeout expired (0)'))
+    assert sqlite.is_unique_violation(sqlite3.IntegrityError('UNIQUE constraint failed: t.file_hash'))
+    assert not sqlite.is_unique_violation(sqlite3.IntegrityError('NOT NULL constraint failed: t.id'))
+
+def test_sqlite_dialect_translates_migration_ddl():
+    """Test T-SQL DDL in the migrations is rewritten for SQLite."""
+    from config.dialects import SQLiteDialect
+    script = ("CREATE TABLE t (id INT IDENTITY(1,1) PRIMARY KEY, note NVARCHAR(MAX), "
+              "created_at DATETIME2 DEFAULT GETUTCDATE());\n"
+              "ALTER TABLE t ADD status NVARCHAR(20);")
+    
+    translated = SQLiteDialect(':memory:').translate_ddl(script)
+    
+    assert 'INTEGER PRIMARY KEY AUTOINCREMENT' in translated
+    assert 'NVARCHAR(MAX)' not in translated and 'DEFAULT CURRENT_TIMESTAMP' in translated
+    assert 'ALTER TABLE t ADD COLUMN status' in translated
+
+def test_sqlite_backend_inserts_and_pages(sqlite_db):
+    """Test the embedded backend bootstraps the schema and returns new identities."""
+    database = sqlite_db
+    ids = [database.execute_insert(
+        "INSERT INTO internal_uploads (filename, status) VALUES (?, 'COMPLETED')",
+        (f'internal_{n}.csv',)) for n in range(3)]
+    page = database.execute_query(
+        f"SELECT id FROM internal_uploads ORDER BY id DESC "
+        f"{database.get_dialect().paginate(2)}", fetch=True)
+    
+    assert ids == [1, 2, 3]
+    assert [row[0] for row in page] == [3, 2]
+
+class FakeStreamingCursor:
+    def __init__(self, rows):
+        self.rows = list(rows)
+        self.fetch_sizes = []
+        self.closed = False
+    
+    def execute(self, query, params=None):
+        pass
+    
+    def fetchmany(self, size):
+        self.fetch_sizes.append(size)
+        batch, self.rows = self.rows[:size], self.rows[size:]
+        return batch
+    
+    def close(self):
+        self.closed = True
+
+def test_stream_query_fetches_in_batches_and_releases_on_early_stop(monkeypatch):
+    """Test stream_query fetches batch by batch and closes everything when abandoned."""
+    import config.database as database
+    cursor = FakeStreamingCursor([[n, f'TXN{n}'] for n in range(10)])
+    connection = FakeConnection()
+    connection.cursor = lambda: cursor
+    monkeypatch.setattr(database, 'get_db_connection', lambda: connection)
+    
+    rows = database.stream_query("SELECT id, transaction_id FROM t", batch_size=4,
+                                 row_factory=tuple)
+    first = [next(rows) for _ in range(5)]
+    rows.close()
+    
+    assert first == [(n, f'TXN{n}') for n in range(5)]
+    assert cursor.fetch_sizes == [4, 4]
+    assert cursor.closed and connection.closed
+
+class FakeTransactionalConnection(FakeConnection):
+    def __init__(self):
+        super().__init__()
+        self.executed = []
+        self.commits = 0
+        self.rowcount = 1
+    
+    def cursor(self):
+        return self
+    
+    def execute(self, query, params=None):
+        if 'FAIL' in query:
+            raise RuntimeError("constraint violation")
+        self.executed.append(query)
+    
+    def fetchone(self):
+        return (len(self.executed),)
+    
+    def commit(self):
+        self.commits += 1
+
+def test_transaction_runs_statements_on_one_connection_with_one_commit(monkeypatch):
+    """Test statements inside transaction() share a connection and commit once."""
+    import config.database as database
+    opened = []
+    monkeypatch.setattr(database, 'get_db_connection',
+                        lambda: opened.append(FakeTransactionalConnection()) or opened[-1])
+    monkeypatch.setattr(database.Config, 'DATABASE_DIALECT', 'mssql')
+    
+    with database.transaction():
+        upload_id = database.execute_insert("INSERT INTO uploads (name) VALUES (?)", ('a',))
+        database.execute_query("UPDATE uploads SET status = 'COMPLETED' WHERE id = ?", (upload_id,))
+    
+    assert len(opened) == 1 and opened[0].commits == 1 and opened[0].closed
+    assert opened[0].executed[0] == "INSERT INTO uploads (name) OUTPUT INSERTED.id VALUES (?)"
+    assert upload_id == 1
+
+def test_transaction_rolls_back_when_a_statement_failed(monkeypatch):
+    """Test a failed statement rolls the unit back even if the caller swallowed the error."""
+    import config.database as database
+    connection = FakeTransactionalConnection()
+    monkeypatch.setattr(database, 'get_db_connection', lambda: connection)
+    
+    with pytest.raises(RuntimeError):
+        with database.transaction():
+            database.execute_query("UPDATE uploads SET status = 'COMPLETED'")
+            try:
+                database.execute_query("FAIL")
+            except RuntimeError:
+                pass
+    
+    assert connection.commits == 0 and connection.rollbacks == 1 and connection.closed
+    assert database.current_unit() is None
+
+class FakeBulkConnection(FakeTransactionalConnection):
+    def __init__(self):
+        super().__init__()
+        self.fast_executemany = False
+        self.batches = []
+    
+    def setinputsizes(self, sizes):
+        self.batches.append(('sizes', sizes))
+    
+    def executemany(self, query, rows):
+        self.batches.append(('rows', len(rows), self.fast_executemany))
+
+def test_execute_many_binds_explicit_sizes_for_each_batch(monkeypatch):
+    """Test typed bulk inserts size fast_executemany parameters before every batch."""
+    import sys
+    import types
+    import config.database as database
+    monkeypatch.setitem(sys.modules, 'pyodbc', types.SimpleNamespace(
+        SQL_INTEGER=4, SQL_WVARCHAR=-9, SQL_DECIMAL=3))
+    monkeypatch.setattr(database.Config, 'DATABASE_DIALECT', 'mssql')
+    connection = FakeBulkConnection()
+    monkeypatch.setattr(database, 'get_db_connection', lambda: connection)
+    
+    rows = [(1, f'TXN{n}', 10.5) for n in range(5)]
+    total = database.execute_many(
+        [("INSERT INTO t (upload_id, transaction_id, amount) VALUES (?, ?, ?)", rows,
+          ('INT', 'NVARCHAR(100)', 'DECIMAL(18,2)'))], batch_size=2)
+    
+    sizes = [(4, 0, 0), (-9, 100, 0), (3, 18, 2)]
+    assert total == 5 and connection.commits == 1
+    assert connection.batches == [('sizes', sizes), ('rows', 2, True)] * 2 + \
+        [('sizes', sizes), ('rows', 1, True)]
+    with pytest.raises(ValueError):
+        database.get_dialect().input_sizes(['GEOGRAPHY'])
+
+def test_query_fingerprint_normalises_literals():
+    """Test statements differing only in literals share a fingerprint."""
+    from config.query_stats import fingerprint
+    
+    assert fingerprint("SELECT * FROM t WHERE name = 'a''b' AND id IN (1, 2,3)\n  ORDER BY id") == \
+        "SELECT * FROM t WHERE name = ? AND id IN (?...) ORDER BY id"
+    assert fingerprint("SELECT TOP (10) col1 FROM t2 WHERE amount > 1.5") == \
+        "SELECT TOP (?) col1 FROM t2 WHERE amount > ?"
+
+def test_query_stats_records_percentiles_and_logs_slow_queries(monkeypatch, caplog):
+    """Test instrumented queries feed the percentiles and slow ones are logged."""
+    import logging
+    import config.database as database
+    monkeypatch.setattr(database.Config, 'DB_QUERY_STATS', True)
+    monkeypatch.setattr(database.Config, 'DB_SLOW_QUERY_MS', 0)
+    monkeypatch.setattr(database, '_query_stats', None)
+    monkeypatch.setattr(database, 'get_db_connection', FakeConnection)
+    caplog.set_level(logging.WARNING)
+    
+    for value in range(3):
+        database.execute_query(f"SELECT id FROM uploads WHERE id = {value}", fetch='all')
+    
+    [entry] = database.get_query_stats().snapshot()
+    assert entry['statement'] == "SELECT id FROM uploads WHERE id = ?"
+    assert entry['count'] == 3 and entry['rows'] == 3
+    assert entry['callers'] == [__name__]
+    assert entry['p50_ms'] <= entry['p99_ms'] <= entry['max_ms']
+    
+    slow = [record for record in caplog.records if record.getMessage().startswith('Slow query')]
+    assert len(slow) == 3
+    assert slow[0].levelname == 'WARNING' and slow[0].category == 'SYSTEM'
+    assert slow[0].query['statement'] == entry['statement']
+    assert slow[0].query['caller'] == __name__ and slow[0].query['rows'] == 1
+    assert json.loads(database.JSONFormatter().format(slow[0]))['query'] == slow[0].query
+
+@pytest.fixture
+def sqlite_plans(tmp_path):
+    """SQLite stand-in with a month of MPR rows; returns an EXPLAIN QUERY PLAN helper."""
+    import sqlite3
+    from config.dialects import SQLiteDialect
+    path = str(tmp_path / 'plans.sqlite3')
+    SQLiteDialect(path).bootstrap()
+    connection = sqlite3.connect(path)
+    connection.execute("INSERT INTO channels (name) VALUES ('BBPS')")
+    connection.executemany("INSERT INTO mpr_uploads (channel_id, filename, status) "
+                           "VALUES (1, ?, 'COMPLETED')", [(f'mpr_{n}.csv',) for n in range(5)])
+    connection.executemany(
+        "INSERT INTO mpr_transactions (upload_id, transaction_id, transaction_time, amount) "
+        "VALUES (?, ?, ?, 10)",
+        [(n % 5 + 1, f'TXN{n}', f'2024-01-{n % 30 + 1:02d}T10:00:00') for n in range(3000)])
+    connection.execute("ANALYZE")
+    connection.commit()
+    
+    def plan(query, params):
+        return ' | '.join(row[3] for row in connection.execute(f"EXPLAIN QUERY PLAN {query}", params))
+    
+    yield plan
+    connection.close()
+
+def test_recon_date_filter_seeks_the_time_index(monkeypatch, sqlite_plans):
+    """Test the recon loader's half-open range seeks an index where DATE() scanned."""
+    from app.recon.models import ReconciliationEngine
+    captured = []
+    monkeypatch.setattr('app.recon.models.stream_query',
+                        lambda query, params=None, **kwargs: captured.append((query, params)) or iter([]))
+    
+    ReconciliationEngine()._load_mpr_transactions('2024-01-15')
+    query, params = captured[0]
+    before = query.replace("m.transaction_time >= ? AND m.transaction_time < ?",
+                           "DATE(m.transaction_time) = ?")
+    
+    assert params == ('2024-01-15', '2024-01-16')
+    assert 'SCAN m' in sqlite_plans(before, ('2024-01-15',))
+    assert 'SEARCH m USING COVERING INDEX IX_mpr_transactions_transaction_time' in \
+        sqlite_plans(query, params)
+
+def test_analytics_filters_seek_the_time_and_result_indexes(monkeypatch, sqlite_plans):
+    """Test analytics counts range-seek MPR rows and probe results by covering index."""
+    from app.analytics.models import TransactionReporting
+    captured = []
+    monkeypatch.setattr('app.analytics.models.execute_query',
+                        lambda query, params=None, fetch=False: captured.append((query, params)))
+    
+    TransactionReporting.get_transaction_count('2024-01-10', '2024-01-12')
+    query, params = captured[0]
+    
+    assert params == ['2024-01-10', '2024-01-13']
+    plan = sqlite_plans(query, params)
+    assert 'SEARCH m USING COVERING INDEX IX_mpr_transactions_transaction_time' in plan
+    assert 'SEARCH r USING COVERING INDEX IX_reconciliation_results_mpr_transaction_id' in plan
+
+def test_migrations_add_generated_transaction_day(sqlite_plans, tmp_path):
+    """Test the persisted date column is computed from the transaction time."""
+    import sqlite3
+    connection = sqlite3.connect(str(tmp_path / 'plans.sqlite3'))
+    try:
+        assert connection.execute(
+            "SELECT transaction_day FROM mpr_transactions WHERE transaction_id = 'TXN14'"
+        ).fetchone() == ('2024-01-15',)
+    finally:
+        connection.close()
+
+def test_uploads_stored_before_upload_status_count_as_completed(tmp_path):
+    """Test internal and bank uploads that predate their status column are backfilled."""
+    import os
+    import sqlite3
+    from config.dialects import SQLiteDialect, migration_scripts
+    dialect = SQLiteDialect(str(tmp_path / 'upgrade.sqlite3'))
+    scripts = migration_scripts()
+    split = [os.path.basename(script) for script in scripts].index(
+        '20250620090000_recon_watermarks.sql')
+    connection = sqlite3.connect(dialect.path)
+    
+    def apply(batch):
+        for script in batch:
+            with open(script) as handle:
+                connection.executescript(dialect.translate_ddl(handle.read()))
+    
+    try:
+        apply(scripts[:split])
+        connection.execute("INSERT INTO internal_uploads (filename) VALUES ('internal.csv')")
+        connection.execute("INSERT INTO bank_statement_uploads (filename) VALUES ('bank.csv')")
+        apply(scripts[split:split + 1])
+        # SQL Server leaves existing rows NULL when a nullable column is added
+        # with a default; SQLite fills in the default instead
+        connection.execute("UPDATE internal_uploads SET status = NULL")
+        connection.execute("UPDATE bank_statement_uploads SET status = NULL")
+        apply(scripts[split + 1:])
+        
+        assert connection.execute("SELECT status FROM internal_uploads").fetchall() == [('COMPLETED',)]
+        assert connection.execute("SELECT status FROM bank_statement_uploads").fetchall() == [('COMPLETED',)]
+    finally:
+        connection.close()
@@ -2,6 +2,7 @@
 Reconciliation module tests.
 """
 import pytest
+from datetime import datetime
 from app import create_app
 from app.recon.models import ReconciliationEngine, ReconciliationReport
 
@@ -138,4 +139,513 @@ def test_reconciliation_report_methods():
     assert hasattr(ReconciliationReport, 'get_detailed_results')
     
     assert callable(ReconciliationReport.get_summary)
-    assert callable(ReconciliationReport.get_detailed_results)
\ No newline at end of file
+    assert callable(ReconciliationReport.get_detailed_results)
+
+def _serve_queries(monkeypatch, fake_execute_query):
+    """Answer both execute_query calls and streamed loader queries from one fake."""
+    monkeypatch.setattr('app.recon.models.execute_query', fake_execute_query)
+    monkeypatch.setattr('app.recon.models.stream_query',
+                        lambda query, params=None, **kwargs: iter(
+                            fake_execute_query(query, params, fetch='all') or []))
+
+def _fake_loader(monkeypatch, mpr_rows, internal_rows):
+    """Serve fixed MPR and internal rows to the engine's loader queries."""
+    def fake_execute_query(query, params=None, fetch=False):
+        if 'FROM mpr_transactions' in query:
+            return list(mpr_rows)
+        if 'FROM internal_transactions' in query:
+            return list(internal_rows)
+        return []
+    _serve_queries(monkeypatch, fake_execute_query)
+
+def test_exact_id_matching_pairs_duplicates_in_load_order(monkeypatch):
+    """Test duplicate transaction IDs are paired first-come, first-served."""
+    mpr_rows = [
+        (1, 'TXN001', 100.00, None, None),
+        (2, 'TXN001', 100.00, None, None),
+        (3, 'TXN002', 250.00, None, None),
+    ]
+    internal_rows = [
+        (10, 'TXN001', 100.00, None),
+        (11, 'TXN001', 100.00, None),
+        (12, 'TXN002', 999.00, None),
+    ]
+    _fake_loader(monkeypatch, mpr_rows, internal_rows)
+    
+    matches = ReconciliationEngine()._match_mpr_with_internal()
+    exact = [(m['mpr_id'], m['internal_id']) for m in matches if m['match_type'] == 'EXACT_ID']
+    assert exact == [(1, 10), (2, 11)]
+
+def test_fuzzy_matching_respects_amount_and_date_window(monkeypatch):
+    """Test AMOUNT_DATE matches pick the first internal row inside both tolerances."""
+    mpr_rows = [
+        (1, 'MPR-A', 500.00, '2024-01-15T10:00:00', None),
+        (2, 'MPR-B', 750.00, '2024-01-15T10:00:00', None),
+        (3, 'MPR-C', 300.00, None, None),
+    ]
+    internal_rows = [
+        (10, 'INT-A', 500.00, '2024-01-20T10:00:00'),  # outside date window
+        (11, 'INT-B', 500.00, '2024-01-16T09:00:00'),
+        (12, 'INT-C', 760.00, '2024-01-15T10:00:00'),  # outside amount tolerance
+        (13, 'INT-D', 300.00, '2024-03-01T00:00:00'),
+    ]
+    _fake_loader(monkeypatch, mpr_rows, internal_rows)
+    
+    matches = ReconciliationEngine()._match_mpr_with_internal()
+    fuzzy = [(m['mpr_id'], m['internal_id']) for m in matches if m['match_type'] == 'AMOUNT_DATE']
+    assert fuzzy == [(1, 11), (3, 13)]
+
+def test_bank_matching_prefers_utr_and_consumes_credits(monkeypatch):
+    """Test bank credits are matched by UTR first and never reused."""
+    existing_matches = [
+        (1, 10, 100.00, 'UTR-B'),
+        (2, 11, 100.00, None),
+        (3, 12, 100.00, None),
+    ]
+    bank_rows = [
+        (20, 100.00, 'UTR-A', None, 'credit'),
+        (21, 100.00, 'UTR-B', None, 'credit'),
+    ]
+    queries = []
+    
+    def fake_execute_query(query, params=None, fetch=False):
+        queries.append(query)
+        if 'FROM bank_transactions' in query:
+            return list(bank_rows)
+        if 'FROM reconciliation_results' in query:
+            return list(existing_matches)
+        return []
+    _serve_queries(monkeypatch, fake_execute_query)
+    
+    matches = ReconciliationEngine()._match_with_bank_statements()
+    assert [(m['mpr_id'], m['bank_id'], m['match_type']) for m in matches] == [
+        (1, 21, 'UTR'),
+        (2, 20, 'AMOUNT'),
+    ]
+    assert len(queries) == 2
+
+def test_vectorized_backend_matches_row_engine():
+    """Test the vectorized backend produces the same matches as the row engine."""
+    from app.recon.vectorized import VectorizedReconciliationEngine
+    
+    mpr_rows = [
+        (1, 'TXN001', 100.00, '2024-01-15T10:00:00', 'UTR1'),
+        (2, 'TXN001', 100.00, '2024-01-15T11:00:00', None),
+        (3, 'TXN002', 250.00, '2024-01-15T12:00:00', None),
+        (4, None, 80.00, '2024-01-15T12:00:00', None),
+        (5, 'TXN404', 42.00, None, None),
+    ]
+    internal_rows = [
+        (10, 'TXN001', 100.00, '2024-01-15T10:05:00'),
+        (11, 'TXN002', 260.00, '2024-01-15T12:00:00'),
+        (12, 'TXN001', 100.00, '2024-01-15T11:05:00'),
+        (13, 'INT-X', 80.00, '2024-01-16T09:00:00'),
+        (14, 'INT-Y', 250.00, '2024-01-18T09:00:00'),
+    ]
+    
+    row_matches = ReconciliationEngine()._pair_mpr_with_internal(mpr_rows, internal_rows)
+    vectorized_matches = VectorizedReconciliationEngine()._pair_mpr_with_internal(mpr_rows, internal_rows)
+    assert vectorized_matches == row_matches
+    assert [(m['mpr_id'], m['internal_id'], m['match_type']) for m in row_matches] == [
+        (1, 10, 'EXACT_ID'),
+        (2, 12, 'EXACT_ID'),
+        (4, 13, 'AMOUNT_DATE'),
+    ]
+
+def test_vectorized_backend_reproduces_row_engine_on_contested_rows(monkeypatch):
+    """Test the merged candidates resolve to the row engine's greedy choices."""
+    import random
+    from app.recon.vectorized import VectorizedReconciliationEngine
+
+    def rows(rng, count, start):
+        # Few distinct amounts, IDs and days so greedy choices collide often
+        for row_id in range(start, start + count):
+            when = rng.choice([None, 'not a time', datetime(2024, 1, rng.randint(1, 6), 12),
+                               datetime(2024, 1, rng.randint(1, 6), rng.randint(0, 23)).isoformat()])
+            yield (row_id, rng.choice([None, '', 'T1', 'T2', f'T{row_id}']),
+                   rng.choice([100.0, 100.01, 100.02, 100.05, 250.0]), when,
+                   rng.choice([None, 'U1', 'U2', f'U{row_id}']))
+
+    row_engine = ReconciliationEngine()
+    engine = VectorizedReconciliationEngine()
+    for seed in range(12):
+        rng = random.Random(seed)
+        # Alternate between proposal rounds only and an early sweep
+        monkeypatch.setattr('app.recon.vectorized.SWEEP_BELOW_SHARE', seed % 2)
+        mpr_rows = list(rows(rng, 80, 1))
+        internal_rows = [row[:4] for row in rows(rng, 80, 100)]
+        bank_rows = [(row[0], row[2], row[4]) for row in rows(rng, 50, 200)]
+
+        matches = row_engine._pair_mpr_with_internal(mpr_rows, internal_rows)
+        assert engine._pair_mpr_with_internal(mpr_rows, internal_rows) == matches
+
+        existing = [(m['mpr_id'], m['internal_id'], mpr_rows[m['mpr_id'] - 1][2],
+                     mpr_rows[m['mpr_id'] - 1][4]) for m in matches]
+        assert (engine._pair_with_bank(existing, bank_rows)
+                == row_engine._pair_with_bank(existing, bank_rows))
+
+def test_get_reconciliation_engine_selects_backend():
+    """Test backends are selectable by name."""
+    from app.recon.models import get_reconciliation_engine
+    from app.recon.vectorized import VectorizedReconciliationEngine
+    
+    assert type(get_reconciliation_engine('ROW')) is ReconciliationEngine
+    assert isinstance(get_reconciliation_engine('vectorized'), VectorizedReconciliationEngine)
+    with pytest.raises(ValueError):
+        get_reconciliation_engine('QUANTUM')
+
+def test_parallel_backend_partitions_fuzzy_matching(monkeypatch):
+    """Test the parallel backend matches across partition edges deterministically."""
+    from app.recon.parallel import ParallelReconciliationEngine
+    monkeypatch.setattr('app.recon.parallel.RECON_PARALLEL_MIN_ROWS', 0)
+    
+    mpr_rows = [
+        (1, 'A', 100.00, '2024-01-15T23:30:00', None),
+        (2, 'B', 100.00, '2024-01-15T23:45:00', None),
+        (3, 'C', 999.00, '2024-01-16T08:00:00', None),
+        (4, 'D', 55.00, None, None),
+    ]
+    internal_rows = [
+        (10, 'X', 100.00, '2024-01-16T00:10:00'),  # next day, inside the tolerance
+        (11, 'Y', 999.00, '2024-01-16T09:00:00'),
+        (12, 'Z', 55.00, '2024-02-01T00:00:00'),
+    ]
+    
+    engine = ParallelReconciliationEngine(workers=2)
+    matches = engine._pair_by_amount_and_date(mpr_rows, internal_rows)
+    pairs = [(m['mpr_id'], m['internal_id']) for m in matches]
+    assert pairs == [(1, 10), (3, 11), (4, 12)]
+    assert engine._pair_by_amount_and_date(mpr_rows, internal_rows) == matches
+
+def test_parallel_backend_does_not_fork_a_threaded_process(monkeypatch):
+    """Test a process running threads gets workers from a fork server, with the same pairs."""
+    import threading
+    from app.recon.parallel import ParallelReconciliationEngine, _pool_context
+    monkeypatch.setattr('app.recon.parallel.RECON_PARALLEL_MIN_ROWS', 0)
+    mpr_rows = [(1, 'A', 100.00, '2024-01-15T23:30:00', None), (2, 'B', 55.00, None, None)]
+    internal_rows = [(10, 'X', 100.00, '2024-01-16T00:10:00'), (11, 'Y', 55.00, None)]
+    assert _pool_context().get_start_method() == 'fork'
+
+    # Stands in for the web app's ingest queue and pool threads
+    release = threading.Event()
+    worker = threading.Thread(target=release.wait)
+    worker.start()
+    try:
+        assert _pool_context().get_start_method() == 'forkserver'
+        matches = ParallelReconciliationEngine(workers=2)._pair_by_amount_and_date(
+            mpr_rows, internal_rows)
+    finally:
+        release.set()
+        worker.join()
+    assert [(m['mpr_id'], m['internal_id']) for m in matches] == [(1, 10), (2, 11)]
+
+def test_parallel_backend_reproduces_row_engine_on_every_pass(monkeypatch):
+    """Test every sharded pass returns exactly what the row engine returns."""
+    import random
+    from app.recon.parallel import ParallelReconciliationEngine
+    monkeypatch.setattr('app.recon.parallel.RECON_PARALLEL_MIN_ROWS', 0)
+
+    def rows(rng, count, start):
+        # Few distinct amounts, IDs and days so greedy choices collide often
+        for row_id in range(start, start + count):
+            when = (None if rng.random() < 0.1 else
+                    datetime(2024, 1, rng.randint(1, 6), rng.randint(0, 23)).isoformat())
+            yield (row_id, rng.choice([None, 'T1', 'T2', 'T3', f'T{row_id}']),
+                   rng.choice([100.0, 100.01, 100.02, 100.05, 250.0]), when,
+                   rng.choice([None, 'U1', 'U2', f'U{row_id}']))
+
+    row_engine = ReconciliationEngine()
+    engine = ParallelReconciliationEngine(workers=3)
+    for seed in range(8):
+        rng = random.Random(seed)
+        mpr_rows = list(rows(rng, 60, 1))
+        internal_rows = [row[:4] for row in rows(rng, 60, 100)]
+        bank_rows = [(row[0], row[2], row[4], row[3], '') for row in rows(rng, 40, 200)]
+
+        matches = row_engine._pair_mpr_with_internal(mpr_rows, internal_rows)
+        assert engine._pair_mpr_with_internal(mpr_rows, internal_rows) == matches
+
+        existing = [(m['mpr_id'], m['internal_id'], mpr_rows[m['mpr_id'] - 1][2],
+                     mpr_rows[m['mpr_id'] - 1][4]) for m in matches]
+        assert (engine._pair_with_bank(existing, bank_rows)
+                == row_engine._pair_with_bank(existing, bank_rows))
+
+        assert (engine._identify_anomalies(mpr_rows, internal_rows, matches)
+                == row_engine._identify_anomalies(mpr_rows, internal_rows, matches))
+    assert engine.profile.stages['fuzzy']['shards'] > 0
+
+def test_incremental_reconciliation_matches_new_rows_against_open_pool(monkeypatch):
+    """Test incremental runs only match new rows and advance the watermarks."""
+    executed = []
+    
+    def fake_execute_query(query, params=None, fetch=False):
+        executed.append((' '.join(query.split()), params))
+        if 'FROM recon_watermarks' in query:
+            return [('mpr_uploads', 1), ('internal_uploads', 1), ('bank_statement_uploads', 1)]
+        if 'SELECT MAX(id)' in query:
+            return (2,)
+        if 'm.is_duplicate = 1' in query:
+            return [(4, 'NEW-1', 2)]
+        if 'FROM mpr_transactions' in query and 'u.id > ?' in query:
+            return [(2, 'NEW-1', 100.00, '2024-01-16T10:00:00', None),
+                    (3, 'NEW-2', 70.00, '2024-01-16T10:00:00', None)]
+        if 'FROM internal_transactions' in query and 'u.id > ?' in query:
+            return []
+        if 'FROM internal_transactions' in query and 'NOT EXISTS' in query:
+            return [(10, 'NEW-1', 100.00, '2024-01-15T10:00:00')]
+        return []
+    _serve_queries(monkeypatch, fake_execute_query)
+    
+    def fake_execute_many(statements, batch_size=None):
+        for query, rows in statements:
+            executed.extend((' '.join(query.split()), row) for row in rows)
+    monkeypatch.setattr('app.recon.models.execute_many', fake_execute_many)
+    
+    results = ReconciliationEngine().run_reconciliation(incremental=True)
+    
+    assert [(r.get('mpr_id'), r.get('internal_id'), r.get('anomaly_type')) for r in results] == [
+        (2, 10, None),
+        (3, None, 'MISSING_INTERNAL'),
+        (4, None, 'DUPLICATE'),
+    ]
+    assert any('m.is_duplicate = 1' in q and p == [1, 2] for q, p in executed)
+    assert any(q.startswith('DELETE FROM reconciliation_results') and p == (10,)
+               for q, p in executed)
+    assert any(q.startswith('UPDATE recon_watermarks') and p == (2, 'mpr_uploads', 2)
+               for q, p in executed)
+
+def test_incremental_run_after_date_filtered_run_keeps_one_result_per_row(sqlite_db):
+    """Test rows a date-filtered run reconciled are not matched again by the next incremental run."""
+    from benchmarks.datagen import generate_dataset
+    from benchmarks.sqlite_store import SQLiteStandIn
+    from config.settings import Config
+    SQLiteStandIn(Config.SQLITE_PATH).load(
+        generate_dataset(200, start=datetime(2024, 1, 10), days=2, seed=5))
+
+    assert ReconciliationEngine().run_reconciliation('2024-01-10')
+    assert ReconciliationEngine().run_reconciliation(incremental=True)
+
+    counts = sqlite_db.execute_query("""
+        SELECT m.id, COUNT(r.id) FROM mpr_transactions m
+        LEFT JOIN reconciliation_results r ON r.mpr_transaction_id = m.id
+        GROUP BY m.id
+    """, fetch='all')
+    assert counts and {count for _, count in counts} == {1}
+
+def test_full_run_leaves_uploads_completed_after_its_high_marks(sqlite_db, monkeypatch):
+    """Test a full run only reconciles uploads up to the high marks it advances to."""
+    from benchmarks.datagen import generate_dataset
+    from benchmarks.sqlite_store import SQLiteStandIn
+    from app.recon.models import ReconWatermark, get_reconciliation_engine
+    from config.settings import Config
+    store = SQLiteStandIn(Config.SQLITE_PATH)
+    store.load(generate_dataset(50, start=datetime(2024, 1, 10), days=1, seed=1))
+    high_marks = ReconWatermark.get_high_marks()
+    # Uploads that complete while the run is loading
+    store.load(generate_dataset(50, start=datetime(2024, 1, 10), days=1, seed=2))
+    monkeypatch.setattr(ReconWatermark, 'get_high_marks', staticmethod(lambda: dict(high_marks)))
+
+    for backend in ('ROW', 'STREAMING'):
+        sqlite_db.execute_query("DELETE FROM reconciliation_results")
+        assert get_reconciliation_engine(backend).run_reconciliation()
+
+        late_rows = sqlite_db.execute_query("""
+            SELECT COUNT(*) FROM reconciliation_results r
+            LEFT JOIN mpr_transactions m ON r.mpr_transaction_id = m.id
+            LEFT JOIN internal_transactions i ON r.internal_transaction_id = i.id
+            LEFT JOIN bank_transactions b ON r.bank_transaction_id = b.id
+            WHERE m.upload_id > ? OR i.upload_id > ? OR b.upload_id > ?
+        """, (high_marks['mpr_uploads'], high_marks['internal_uploads'],
+              high_marks['bank_statement_uploads']), fetch='one')
+        assert late_rows[0] == 0
+    assert ReconWatermark.get_all() == high_marks
+
+def test_streaming_run_with_a_failed_chunk_write_leaves_no_results(sqlite_db, monkeypatch):
+    """Test a failed chunk write rolls back earlier chunks and keeps the watermarks."""
+    import app.recon.models as recon_models
+    from benchmarks.datagen import generate_dataset
+    from benchmarks.sqlite_store import SQLiteStandIn
+    from app.recon.models import ReconWatermark, get_reconciliation_engine
+    from config.settings import Config
+    SQLiteStandIn(Config.SQLITE_PATH).load(generate_dataset(200, start=datetime(2024, 1, 10),
+                                                            days=2, seed=4))
+    watermarks = ReconWatermark.get_all()
+    monkeypatch.setattr('app.recon.streaming.RECON_STREAM_CHUNK_SIZE', 20)
+
+    write = recon_models.execute_many
+    writes = []
+    def failing_second_write(statements, batch_size=None):
+        writes.append(statements)
+        if len(writes) == 2:
+            raise RuntimeError("disk full")
+        return write(statements, batch_size=batch_size)
+    monkeypatch.setattr('app.recon.models.execute_many', failing_second_write)
+
+    assert get_reconciliation_engine('STREAMING').run_reconciliation() == []
+    assert len(writes) == 2
+    assert sqlite_db.execute_query("SELECT COUNT(*) FROM reconciliation_results",
+                                   fetch='one')[0] == 0
+    assert ReconWatermark.get_all() == watermarks
+
+def test_streaming_backend_matches_within_sliding_window(monkeypatch):
+    """Test the streaming backend matches in a window and releases old rows."""
+    from app.recon.streaming import StreamingReconciliationEngine
+    
+    streams = {
+        ('mpr_transactions', 'IS NOT NULL'): [
+            (1, 'A', 100.00, datetime(2024, 1, 10, 9), 'UTR-1'),
+            (2, 'B', 40.00, datetime(2024, 1, 20, 9), None),
+        ],
+        ('internal_transactions', 'IS NOT NULL'): [
+            (10, 'OLD', 70.00, datetime(2024, 1, 1, 9)),
+            (11, 'A', 100.00, datetime(2024, 1, 10, 8)),
+            (12, 'Z', 40.00, datetime(2024, 1, 20, 10)),
+        ],
+        ('internal_transactions', 'IS NULL'): [(13, 'U', 55.00, None)],
+        ('bank_transactions', 'IS NOT NULL'): [(20, 100.00, 'UTR-1', datetime(2024, 1, 11), '')],
+    }
+    
+    def fake_stream_rows(self, query, params):
+        for (table, condition), rows in streams.items():
+            if table in query and condition in query:
+                return iter(rows)
+        return iter([])
+    written = []
+    monkeypatch.setattr(StreamingReconciliationEngine, '_stream_rows', fake_stream_rows)
+    monkeypatch.setattr(StreamingReconciliationEngine, '_create_reconciliation_results',
+                        lambda self, matches, bank, anomalies: written.append(
+                            (list(matches), list(bank), list(anomalies))))
+    
+    engine = StreamingReconciliationEngine()
+    results = engine._reconcile_streams(None)
+    
+    matches = [m for chunk in written for m in chunk[0]]
+    bank = [b for chunk in written for b in chunk[1]]
+    anomalies = [a for chunk in written for a in chunk[2]]
+    assert [(m['mpr_id'], m['internal_id'], m['match_type']) for m in matches] == [
+        (1, 11, 'EXACT_ID'), (2, 12, 'AMOUNT_DATE')]
+    assert [(b['mpr_id'], b['bank_id'], b['match_type']) for b in bank] == [(1, 20, 'UTR')]
+    assert sorted(a['internal_id'] for a in anomalies) == [10, 13]
+    assert (results.matched, results.pending, results.anomalies) == (1, 1, 2)
+
+def test_streaming_backend_treats_unparseable_times_as_undated(monkeypatch):
+    """Test rows with unreadable stored times are matched as undated, not dropped."""
+    from app.recon.streaming import StreamingReconciliationEngine
+
+    streams = {
+        ('mpr_transactions', 'IS NOT NULL'): [
+            (1, 'A', 100.00, datetime(2024, 1, 10, 9), None),
+            (2, 'B', 40.00, 'not a time', 'UTR-2'),
+        ],
+        ('internal_transactions', 'IS NOT NULL'): [
+            (11, 'A', 100.00, datetime(2024, 1, 10, 8)),
+            (12, 'B', 40.00, 'not a time either'),
+        ],
+        ('bank_transactions', 'IS NOT NULL'): [(20, 100.00, None, 'bad date', '')],
+        ('bank_transactions', 'IS NULL'): [(21, 40.00, 'UTR-2', None, '')],
+    }
+
+    def fake_stream_rows(self, query, params):
+        for (table, condition), rows in streams.items():
+            if table in query and condition in query:
+                return iter(rows)
+        return iter([])
+    written = []
+    monkeypatch.setattr(StreamingReconciliationEngine, '_stream_rows', fake_stream_rows)
+    monkeypatch.setattr(StreamingReconciliationEngine, '_create_reconciliation_results',
+                        lambda self, matches, bank, anomalies: written.append(
+                            (list(matches), list(bank), list(anomalies))))
+
+    results = StreamingReconciliationEngine()._reconcile_streams(None)
+
+    matches = [m for chunk in written for m in chunk[0]]
+    bank = [b for chunk in written for b in chunk[1]]
+    assert [(m['mpr_id'], m['internal_id']) for m in matches] == [(1, 11), (2, 12)]
+    assert [(b['mpr_id'], b['bank_id'], b['match_type']) for b in bank] == [
+        (1, 20, 'AMOUNT'), (2, 21, 'UTR')]
+    assert (results.matched, results.pending, results.anomalies) == (2, 0, 0)
+
+def test_results_are_written_in_one_bulk_call(monkeypatch):
+    """Test results go out as one executemany batch per statement."""
+    calls = []
+    monkeypatch.setattr('app.recon.models.execute_many',
+                        lambda statements, batch_size=None: calls.append(statements))
+    
+    engine = ReconciliationEngine()
+    results = engine._create_reconciliation_results(
+        [{'mpr_id': 1, 'internal_id': 10}, {'mpr_id': 2, 'internal_id': 11}],
+        [{'mpr_id': 1, 'internal_id': 10, 'bank_id': 20}],
+        [{'mpr_id': 3, 'anomaly_type': 'MISSING_INTERNAL'}]
+    )
+    
+    assert len(calls) == 1
+    assert [rows for _, rows in calls[0]] == [
+        [(1, 10, 20, 'MATCHED')],
+        [(2, 11, 'PENDING')],
+        [(3, None, None, 'ANOMALY', 'MISSING_INTERNAL')],
+    ]
+    assert len(results) == 3
+
+def test_anomalies_are_derived_from_the_runs_match_sets():
+    """Test unmatched rows and same-ID amount mismatches come from memory."""
+    mpr_rows = [
+        (1, 'TXN001', 100.00, None, None),
+        (2, 'TXN002', 250.00, None, None),
+        (3, 'TXN003', 80.00, None, None),
+    ]
+    internal_rows = [
+        (10, 'TXN001', 100.00, None),
+        (11, 'TXN002', 260.00, None),
+        (12, 'TXN009', 45.00, None),
+    ]
+    matches = [{'mpr_id': 1, 'internal_id': 10}]
+    
+    anomalies = ReconciliationEngine()._identify_anomalies(mpr_rows, internal_rows, matches)
+    
+    assert [(a['mpr_id'], a['internal_id'], a['anomaly_type']) for a in anomalies] == [
+        (2, 11, 'AMOUNT_MISMATCH'),
+        (3, None, 'MISSING_INTERNAL'),
+        (None, 12, 'MISSING_MPR'),
+    ]
+
+def test_run_reconciliation_records_stage_profile(monkeypatch):
+    """Test a run profiles each stage and stores the profile in the run history."""
+    import json
+    import logging
+    from config.database import JSONFormatter
+    
+    executed = []
+    mpr_rows = [(1, 'TXN001', 100.00, None, None), (2, 'TXN002', 40.00, None, None)]
+    internal_rows = [(10, 'TXN001', 100.00, None), (11, 'OTHER', 40.00, None)]
+    
+    def fake_execute_query(query, params=None, fetch=False):
+        executed.append((' '.join(query.split()), params))
+        if 'm.is_duplicate = 1' in query:
+            return []
+        if 'FROM mpr_transactions' in query:
+            return list(mpr_rows)
+        if 'FROM internal_transactions' in query:
+            return list(internal_rows)
+        return None if fetch == 'one' else []
+    _serve_queries(monkeypatch, fake_execute_query)
+    monkeypatch.setattr('app.recon.models.execute_many', lambda statements, batch_size=None: 0)
+    
+    records = []
+    monkeypatch.setattr(logging, 'info', lambda msg, *args, **kwargs: records.append(
+        logging.makeLogRecord(dict(msg=msg, **kwargs.get('extra', {})))))
+    
+    engine = ReconciliationEngine()
+    engine.run_reconciliation()
+    profile = engine.profile.to_dict()
+    
+    assert profile['mode'] == 'FULL' and profile['results'] == 2
+    assert {'load', 'exact', 'fuzzy', 'bank', 'anomalies', 'write'} <= set(profile['stages'])
+    assert profile['stages']['load']['mpr_rows'] == 2
+    assert profile['stages']['exact']['matches'] == 1
+    assert profile['stages']['fuzzy']['matches'] == 1
+    
+    history = [p for q, p in executed if q.startswith('INSERT INTO recon_run_history')]
+    assert len(history) == 1 and json.loads(history[0][-1])['write']['rows'] == 2
+    
+    logged = [json.loads(JSONFormatter().format(r)) for r in records if hasattr(r, 'profile')]
+    assert logged and logged[0]['profile']['backend'] == 'ROW'
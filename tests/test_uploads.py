@@ -159,4 +159,355 @@ def test_upload_history_displays_all_types(client):
     assert response.status_code == 200
     assert b'MPR File Uploads' in response.data
     assert b'Internal Data Uploads' in response.data
-    assert b'Bank Statement Uploads' in response.data
\ No newline at end of file
+    assert b'Bank Statement Uploads' in response.data
+
+def test_internal_upload_is_stored_in_one_transaction(sqlite_db, tmp_path):
+    """Test an internal upload, its rows and its status are written together on SQLite."""
+    import io
+    from werkzeug.datastructures import FileStorage
+    database = sqlite_db
+    csv_file = FileStorage(io.BytesIO(b'transaction_id,amount\nTXN1,100.5\nTXN2,20\n'),
+                           filename='internal.csv')
+    upload_id, message = InternalDataProcessor(str(tmp_path)).process_internal_file(csv_file)
+    
+    assert message == "File processed successfully"
+    assert database.execute_query(
+        "SELECT status FROM internal_uploads WHERE id = ?", (upload_id,), fetch='one'
+    )[0] == 'COMPLETED'
+    assert database.execute_query(
+        "SELECT COUNT(*) FROM internal_transactions WHERE upload_id = ?", (upload_id,),
+        fetch='one'
+    )[0] == 2
+
+def test_mpr_mapping_is_column_wise_and_filters_required_fields():
+    """Test MPR mapping coerces amounts, normalises times and drops incomplete rows."""
+    import pandas as pd
+    df = pd.DataFrame({
+        'Txn Ref': ['T1', 'T2', None, 'T4', 'T5'],
+        'Txn Amount': ['100.50', 'n/a', 20, '0', 30],
+        'Txn Date Time': ['25-01-2024 10:00:00', '02-01-2024 11:00:00', None,
+                          '03-01-2024 12:00:00', 'not a date'],
+        'UTR No': [123456.0, None, 'U3', 'U4', None],
+    })
+    mappings = {'transaction_id': 'Txn Ref', 'amount': 'Txn Amount',
+                'transaction_time': 'Txn Date Time', 'utr': 'UTR No', 'reference_id': 'Absent'}
+    
+    transactions = MPRProcessor(tempfile.gettempdir())._map_transactions(df, mappings)
+    
+    assert transactions['transaction_id'].tolist() == ['T1', 'T5']
+    assert transactions['amount'].tolist() == [100.5, 30.0]
+    # Day-first, because month-first cannot read 25-01-2024
+    assert transactions['transaction_time'].tolist() == ['2024-01-25T10:00:00', 'not a date']
+    assert transactions['utr'][0] == '123456.0' and pd.isna(transactions['utr'][1])
+    assert 'reference_id' not in transactions
+
+def test_dates_are_read_the_same_way_in_every_chunk(sqlite_db, monkeypatch, tmp_path):
+    """Test the day order the first chunk needs is kept for chunks that would fit either."""
+    import io
+    from werkzeug.datastructures import FileStorage
+    import app.uploads.models as models
+    database = sqlite_db
+    monkeypatch.setattr(models, 'UPLOAD_CHUNK_SIZE', 2)
+    csv_file = FileStorage(io.BytesIO(b'transaction_id,amount,transaction_time\n'
+                                      b'TXN1,10,25-01-2024 10:00:00\n'
+                                      b'TXN2,20,05-01-2024 10:00:00\n'
+                                      b'TXN3,30,05-01-2024 10:00:00\n'
+                                      b'TXN4,40,06-01-2024 11:30:00\n'), filename='internal.csv')
+    
+    upload_id, _ = InternalDataProcessor(str(tmp_path)).process_internal_file(csv_file)
+    
+    times = database.execute_query(
+        "SELECT transaction_time FROM internal_transactions WHERE upload_id = ? ORDER BY id",
+        (upload_id,), fetch='all')
+    assert [str(row[0]) for row in times] == ['2024-01-25T10:00:00', '2024-01-05T10:00:00',
+                                             '2024-01-05T10:00:00', '2024-01-06T11:30:00']
+
+def test_zero_padded_ids_survive_every_chunk(sqlite_db, monkeypatch, tmp_path):
+    """Test numeric-looking IDs keep their leading zeros in chunks with no letters."""
+    import io
+    from werkzeug.datastructures import FileStorage
+    import app.uploads.models as models
+    database = sqlite_db
+    monkeypatch.setattr(models, 'UPLOAD_CHUNK_SIZE', 2)
+    internal_file = FileStorage(io.BytesIO(b'transaction_id,amount,reference_id\n'
+                                           b'TXN1,10,REF1\n'
+                                           b'TXN2,20,REF2\n'
+                                           b'000123,30,007\n'), filename='internal.csv')
+    bank_file = FileStorage(io.BytesIO(b'amount,utr\n'
+                                       b'10,UTR1\n'
+                                       b'20,UTR2\n'
+                                       b'30,000456\n'), filename='bank.csv')
+    
+    internal_id, _ = InternalDataProcessor(str(tmp_path)).process_internal_file(internal_file)
+    bank_id, _ = BankStatementProcessor(str(tmp_path)).process_bank_statement_file(bank_file)
+    
+    internal = database.execute_query(
+        "SELECT transaction_id, reference_id FROM internal_transactions WHERE upload_id = ? "
+        "ORDER BY id", (internal_id,), fetch='all')
+    utrs = database.execute_query(
+        "SELECT utr FROM bank_transactions WHERE upload_id = ? ORDER BY id",
+        (bank_id,), fetch='all')
+    assert tuple(internal[-1]) == ('000123', '007')
+    assert [row[0] for row in utrs] == ['UTR1', 'UTR2', '000456']
+
+def test_bank_rows_are_bound_column_wise_with_nulls():
+    """Test bank rows keep any numeric amount and bind missing values as NULL."""
+    import pandas as pd
+    from app.uploads.models import BankTransaction, _batch_rows
+    df = pd.DataFrame({'amount': ['10', None, 'x', -5, 0],
+                       'transaction_date': ['2024-01-01', '2024-01-02', None, None, '2024-01-05']})
+    
+    transactions = BankStatementProcessor(tempfile.gettempdir())._process_bank_transactions(df)
+    
+    assert _batch_rows(7, transactions, BankTransaction.COLUMNS) == [
+        (7, '2024-01-01T00:00:00', 10.0, None, None),
+        (7, None, -5.0, None, None),
+        (7, '2024-01-05T00:00:00', 0.0, None, None),
+    ]
+
+def test_bank_statement_is_ingested_chunk_by_chunk(sqlite_db, monkeypatch, tmp_path):
+    """Test a bank statement read in several chunks is stored whole with running totals."""
+    import io
+    from werkzeug.datastructures import FileStorage
+    import app.uploads.models as models
+    database = sqlite_db
+    monkeypatch.setattr(models, 'UPLOAD_CHUNK_SIZE', 2)
+    chunks = []
+    iter_chunks = models.FileUploadHandler.iter_chunks
+    def counting_chunks(self, *args, **kwargs):
+        for chunk in iter_chunks(self, *args, **kwargs):
+            chunks.append(len(chunk))
+            yield chunk
+    monkeypatch.setattr(models.FileUploadHandler, 'iter_chunks', counting_chunks)
+    csv_file = FileStorage(io.BytesIO(b'amount,utr\n100,U1\n-20.5,U2\nx,U3\n50,U4\n-4.5,U5\n'),
+                           filename='bank.csv')
+    upload_id, message = BankStatementProcessor(str(tmp_path)).process_bank_statement_file(csv_file)
+    
+    assert message == "File processed successfully"
+    assert chunks == [2, 2, 1]
+    assert tuple(database.execute_query(
+        "SELECT status, total_credits, total_debits FROM bank_statement_uploads WHERE id = ?",
+        (upload_id,), fetch='one'
+    )) == ('COMPLETED', 150.0, 25.0)
+    assert database.execute_query(
+        "SELECT COUNT(*) FROM bank_transactions WHERE upload_id = ?", (upload_id,), fetch='one'
+    )[0] == 4
+
+def test_workbook_is_streamed_from_sheet_and_header_row(tmp_path):
+    """Test an .xlsx sheet is read from its header row in chunks, keeping mapped columns."""
+    import openpyxl
+    workbook = openpyxl.Workbook()
+    workbook.active.title = 'Summary'
+    sheet = workbook.create_sheet('Settlements')
+    sheet.append(['BBPS settlement report'])
+    sheet.append([])
+    sheet.append(['Txn Ref', 'Notes', 'Amount'])
+    for number in range(5):
+        sheet.append([f'T{number}', 'ignored', 100 + number])
+    sheet.append([])
+    filename = str(tmp_path / 'mpr.xlsx')
+    workbook.save(filename)
+
+    chunks = list(FileUploadHandler(str(tmp_path)).iter_chunks(
+        filename, 'EXCEL', chunksize=2, sheet_name='Settlements', header_row=3,
+        columns=['Txn Ref', 'Amount']
+    ))
+
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+    assert list(chunks[0].columns) == ['Txn Ref', 'Amount']
+    assert chunks[2].iloc[0].tolist() == ['T4', 104]
+
+def test_csv_reads_only_mapped_columns_as_text(tmp_path):
+    """Test a CSV keeps only mapped columns, with identifiers as text and amounts numeric."""
+    import pandas as pd
+    from app.uploads.models import _mapped_columns
+    filepath = tmp_path / 'mpr.csv'
+    filepath.write_text('Txn Ref,Notes,UTR No,Amount\n'
+                        '007,a,000123,10.5\n'
+                        '008,b,,20\n')
+    columns, dtypes = _mapped_columns({'transaction_id': 'Txn Ref', 'utr': 'UTR No',
+                                       'amount': 'Amount', 'reference_id': ''})
+
+    chunk, = FileUploadHandler(str(tmp_path)).iter_chunks(str(filepath), 'CSV', columns=columns,
+                                                          dtypes=dtypes)
+
+    assert list(chunk.columns) == ['Txn Ref', 'UTR No', 'Amount']
+    assert chunk['Txn Ref'].tolist() == ['007', '008']
+    assert chunk['UTR No'].iloc[0] == '000123' and pd.isna(chunk['UTR No'].iloc[1])
+    assert chunk['Amount'].tolist() == [10.5, 20.0]
+
+def test_upload_is_queued_and_reports_progress(sqlite_db, client, app, tmp_path):
+    """Test an upload returns a job at once and the job API reports its progress and status."""
+    import io
+    import time
+    from app.uploads.jobs import get_ingest_queue, reset_ingest_queue
+    app.config['UPLOAD_FOLDER'] = str(tmp_path)
+    app.config['UPLOAD_ASYNC'] = True
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+        sess['username'] = 'admin'
+    try:
+        response = client.post('/uploads/internal', headers={'Accept': 'application/json'}, data={
+            'file': (io.BytesIO(b'transaction_id,amount\nTXN1,100.5\n,7\nTXN3,20\n'), 'internal.csv'),
+        })
+        assert response.status_code == 202
+        job_id = response.get_json()['id']
+        assert response.headers['Location'].endswith(f'/uploads/jobs/{job_id}')
+        
+        job = get_ingest_queue().get(job_id)
+        deadline = time.monotonic() + 10
+        while not job.finished and time.monotonic() < deadline:
+            time.sleep(0.01)
+        
+        status = client.get(f'/uploads/jobs/{job_id}').get_json()
+        assert status['status'] == 'COMPLETED'
+        assert (status['rows_parsed'], status['rows_inserted']) == (3, 2)
+        assert status['errors'] == []
+        assert status['upload_status'] == 'COMPLETED'
+        assert client.get('/uploads/jobs/unknown').status_code == 404
+    finally:
+        reset_ingest_queue()
+
+def test_reuploaded_file_is_not_processed_again(sqlite_db, monkeypatch, tmp_path):
+    """Test a file matching a stored upload's SHA-256 returns that upload without parsing."""
+    import io
+    import hashlib
+    from werkzeug.datastructures import FileStorage
+    database = sqlite_db
+    content = b'amount,utr\n100,U1\n-20.5,U2\n'
+    processor = BankStatementProcessor(str(tmp_path))
+    upload_id, _ = processor.process_bank_statement_file(
+        FileStorage(io.BytesIO(content), filename='bank.csv'))
+    monkeypatch.setattr(processor, 'ingest_bank_statement_file',
+                        lambda *args, **kwargs: pytest.fail("duplicate was parsed"))
+    duplicate_id, message = processor.process_bank_statement_file(
+        FileStorage(io.BytesIO(content), filename='bank copy.csv'))
+    
+    assert duplicate_id == upload_id
+    assert message == f"File already processed as upload {upload_id}; it was not processed again"
+    assert database.execute_query(
+        "SELECT file_hash FROM bank_statement_uploads WHERE id = ?", (upload_id,), fetch='one'
+    )[0] == hashlib.sha256(content).hexdigest()
+    # Only the first copy is kept
+    assert not any(name.endswith('bank_copy.csv') for name in os.listdir(tmp_path))
+
+def test_file_stored_by_a_concurrent_upload_reports_the_original(sqlite_db, tmp_path):
+    """Test a copy that passed the hash check before the first copy committed reports it."""
+    import io
+    import hashlib
+    from werkzeug.datastructures import FileStorage
+    database = sqlite_db
+    content = b'transaction_id,amount\nTXN1,100.5\n'
+    processor = InternalDataProcessor(str(tmp_path))
+    upload_id, _ = processor.process_internal_file(FileStorage(io.BytesIO(content),
+                                                               filename='internal.csv'))
+    # A second copy queued while the first was still being ingested
+    (tmp_path / 'internal copy.csv').write_bytes(content)
+    
+    duplicate_id, message = processor.ingest_internal_file(
+        'internal copy.csv', file_hash=hashlib.sha256(content).hexdigest())
+    
+    assert duplicate_id == upload_id
+    assert message == f"File already processed as upload {upload_id}; it was not processed again"
+    assert database.execute_query("SELECT COUNT(*) FROM internal_uploads", fetch='one')[0] == 1
+    assert not (tmp_path / 'internal copy.csv').exists()
+
+def test_bloom_filter_has_no_false_negatives():
+    """Test every added fingerprint is reported and most others are ruled out."""
+    import hashlib
+    from app.uploads.fingerprints import BloomFilter
+    fingerprints = [hashlib.blake2b(str(n).encode(), digest_size=16).digest() for n in range(4000)]
+    bloom = BloomFilter(2000, error_rate=0.01)
+    
+    bloom.add(fingerprints[:2000])
+    
+    assert bloom.might_contain(fingerprints[:2000]).all()
+    assert bloom.might_contain(fingerprints[2000:]).mean() < 0.03
+
+def test_repeated_mpr_rows_are_flagged_across_files(sqlite_db, tmp_path):
+    """Test MPR rows already stored, or repeated within a file, are stored flagged as duplicates."""
+    import io
+    from werkzeug.datastructures import FileStorage
+    from app.config.models import ChannelConfig
+    from app.recon.models import ReconciliationEngine
+    database = sqlite_db
+    ChannelConfig.create_or_update(1, {'transaction_id': 'ref', 'amount': 'amt', 'utr': 'utr'}, 'CSV')
+    processor = MPRProcessor(str(tmp_path))
+    first, _ = processor.process_mpr_file(
+        FileStorage(io.BytesIO(b'ref,amt,utr\nT1,100,U1\nT2,50,U2\n'), filename='day1.csv'), 1)
+    # Same channel resends T2, repeats T3 within the file, and sends T1 with another amount
+    second, message = processor.process_mpr_file(
+        FileStorage(io.BytesIO(b'ref,amt,utr\nT2,50.00,U2\nT3,10,U3\nT3,10,U3\nT1,90,U1\n'),
+                    filename='day2.csv'), 1)
+    
+    assert message == "File processed successfully"
+    flags = database.execute_query(
+        "SELECT m.transaction_id, m.is_duplicate FROM mpr_transactions m "
+        "WHERE m.upload_id = ? ORDER BY m.id", (second,), fetch='all')
+    assert [tuple(row) for row in flags] == [('T2', 1), ('T3', 0), ('T3', 1), ('T1', 0)]
+    
+    duplicates = ReconciliationEngine()._load_duplicate_mpr()
+    originals = dict(database.execute_query(
+        "SELECT transaction_id, id FROM mpr_transactions WHERE is_duplicate = 0 AND upload_id = ? "
+        "OR transaction_id = 'T2' AND upload_id = ?", (second, first), fetch='all'))
+    assert [(txn_id, original) for _, txn_id, original in duplicates] == [
+        ('T2', originals['T2']), ('T3', originals['T3'])]
+
+def test_multi_chunk_mpr_upload_reads_the_filter_outside_its_transaction(sqlite_db, monkeypatch,
+                                                                         tmp_path):
+    """Test a file of several chunks flags repeats across chunks without reading the filter mid-upload."""
+    import io
+    from werkzeug.datastructures import FileStorage
+    import app.uploads.models as models
+    import app.uploads.fingerprints as fingerprints
+    from app.config.models import ChannelConfig
+    database = sqlite_db
+    monkeypatch.setattr(models, 'UPLOAD_CHUNK_SIZE', 2)
+    stream_query = fingerprints.stream_query
+    def outside_transaction(*args, **kwargs):
+        # On SQL Server this separate connection would wait on the upload's own rows
+        assert database.current_unit() is None
+        return stream_query(*args, **kwargs)
+    monkeypatch.setattr(fingerprints, 'stream_query', outside_transaction)
+    ChannelConfig.create_or_update(1, {'transaction_id': 'ref', 'amount': 'amt'}, 'CSV')
+    processor = MPRProcessor(str(tmp_path))
+    processor.process_mpr_file(FileStorage(io.BytesIO(b'ref,amt\nT0,5\n'), filename='day1.csv'), 1)
+    
+    upload_id, message = processor.process_mpr_file(FileStorage(
+        io.BytesIO(b'ref,amt\nT1,10\nT2,20\nT3,30\nT1,10\nT0,5\n'), filename='day2.csv'), 1)
+    
+    assert message == "File processed successfully"
+    flags = database.execute_query(
+        "SELECT transaction_id, is_duplicate FROM mpr_transactions WHERE upload_id = ? ORDER BY id",
+        (upload_id,), fetch='all')
+    assert [tuple(row) for row in flags] == [('T1', 0), ('T2', 0), ('T3', 0), ('T1', 1), ('T0', 1)]
+
+def test_row_missed_by_the_filter_is_flagged_after_the_unique_index_rejects_it(sqlite_db, caplog,
+                                                                              tmp_path):
+    """Test an original stored out of id order, unseen by the filter, still makes a duplicate."""
+    import io
+    import pandas as pd
+    from werkzeug.datastructures import FileStorage
+    from app.config.models import ChannelConfig
+    from app.uploads.fingerprints import get_fingerprint_index, transaction_fingerprints
+    database = sqlite_db
+    ChannelConfig.create_or_update(1, {'transaction_id': 'ref', 'amount': 'amt'}, 'CSV')
+    processor = MPRProcessor(str(tmp_path))
+    processor.process_mpr_file(FileStorage(io.BytesIO(b'ref,amt\nT0,5\n'), filename='day1.csv'), 1)
+    # Another worker's upload commits T9 after the filter has read past its id
+    [fingerprint] = transaction_fingerprints(1, pd.DataFrame({'transaction_id': ['T9'], 'amount': [90.0]}))
+    database.execute_query(
+        "INSERT INTO mpr_transactions (upload_id, transaction_id, amount, fingerprint, is_duplicate) "
+        "VALUES (1, 'T9', 90, ?, 0)", (fingerprint,))
+    index = get_fingerprint_index()
+    index.last_id = 100
+    
+    upload_id, message = processor.process_mpr_file(FileStorage(
+        io.BytesIO(b'ref,amt\nT8,80\nT9,90\n'), filename='day2.csv'), 1)
+    
+    assert message == "File processed successfully"
+    flags = database.execute_query(
+        "SELECT transaction_id, is_duplicate FROM mpr_transactions WHERE upload_id = ? ORDER BY id",
+        (upload_id,), fetch='all')
+    assert [tuple(row) for row in flags] == [('T8', 0), ('T9', 1)]
+    assert any('missed a stored transaction' in record.getMessage() for record in caplog.records)